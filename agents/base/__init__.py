@@ -3,5 +3,6 @@ Base agent package.
 """
 
 from .agent import BaseAgent, AgentOutput, AgentType
+from .buffer import AgentOutputBuffer
 
-__all__ = ["BaseAgent", "AgentOutput", "AgentType"]
+__all__ = ["BaseAgent", "AgentOutput", "AgentType", "AgentOutputBuffer"]
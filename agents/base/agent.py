@@ -3,9 +3,11 @@ Base agent class for all trading agents.
 """
 
 from abc import ABC, abstractmethod
+from dataclasses import dataclass
 from typing import Any, Dict, Optional
 from enum import Enum
 import logging
+import sys
 
 
 logger = logging.getLogger(__name__)
@@ -21,40 +23,47 @@ class AgentType(Enum):
     TECHNICAL = "technical"
 
 
+# AgentType -> interned value string (dict lookup instead of the Enum descriptor)
+_AGENT_TYPE_STR = {at: sys.intern(at.value) for at in AgentType}
+
+
+@dataclass(slots=True, eq=False)
 class AgentOutput:
-    """Standard output format for all agents."""
+    """
+    Standard output format for all agents.
     
-    def __init__(
-        self,
-        agent_type: AgentType,
-        signal: Optional[float] = None,  # -1 to 1 scale
-        confidence: float = 0.0,  # 0 to 1 scale
-        metadata: Optional[Dict[str, Any]] = None
-    ):
-        """
-        Initialize agent output.
-        
-        Args:
-            agent_type: Type of the agent
-            signal: Trading signal (-1: strong sell, 0: neutral, 1: strong buy)
-            confidence: Confidence level of the signal (0 to 1)
-            metadata: Additional information from the agent
-        """
-        self.agent_type = agent_type
-        self.signal = signal
-        self.confidence = confidence
-        self.metadata = metadata or {}
+    Attributes:
+        agent_type: Type of the agent
+        signal: Trading signal (-1: strong sell, 0: neutral, 1: strong buy)
+        confidence: Confidence level of the signal (0 to 1)
+        metadata: Additional information from the agent
+    """
+    
+    agent_type: AgentType
+    signal: Optional[float] = None  # -1 to 1 scale
+    confidence: float = 0.0  # 0 to 1 scale
+    metadata: Optional[Dict[str, Any]] = None
+    
+    def __post_init__(self):
+        if self.metadata is None:
+            self.metadata = {}
+    
+    @property
+    def _type_name(self) -> str:
+        # agent_type.value via dict lookup (skips the Enum descriptor); derived
+        # on every access so reassigning agent_type is never stale
+        return _AGENT_TYPE_STR[self.agent_type]
     
     def __repr__(self) -> str:
         return (
-            f"AgentOutput(type={self.agent_type.value}, "
+            f"AgentOutput(type={self._type_name}, "
             f"signal={self.signal:.2f}, confidence={self.confidence:.2f})"
         )
     
     def to_dict(self) -> Dict[str, Any]:
         """Convert to dictionary."""
         return {
-            "agent_type": self.agent_type.value,
+            "agent_type": self._type_name,
             "signal": self.signal,
             "confidence": self.confidence,
             "metadata": self.metadata
@@ -73,9 +82,10 @@ class BaseAgent(ABC):
             name: Optional name for the agent
         """
         self.agent_type = agent_type
-        self.name = name or agent_type.value
+        self._agent_type_name = _AGENT_TYPE_STR[agent_type]
+        self.name = name or self._agent_type_name
         self.enabled = True
-        logger.info(f"Initialized agent: {self.name}")
+        logger.info("Initialized agent: %s", self.name)
     
     @abstractmethod
     def analyze(self, data: Any) -> AgentOutput:
@@ -93,12 +103,12 @@ class BaseAgent(ABC):
     def enable(self):
         """Enable the agent."""
         self.enabled = True
-        logger.info(f"Agent {self.name} enabled")
+        logger.info("Agent %s enabled", self.name)
     
     def disable(self):
         """Disable the agent."""
         self.enabled = False
-        logger.info(f"Agent {self.name} disabled")
+        logger.info("Agent %s disabled", self.name)
     
     def is_enabled(self) -> bool:
         """Check if agent is enabled."""
@@ -0,0 +1,119 @@
+"""
+Structure-of-arrays buffer for agent outputs.
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .agent import AgentOutput, AgentType
+
+
+# Stable AgentType <-> int8 code mapping used by the buffer
+AGENT_TYPES: Tuple[AgentType, ...] = tuple(AgentType)
+AGENT_TYPE_INDEX: Dict[AgentType, int] = {agent_type: i for i, agent_type in enumerate(AGENT_TYPES)}
+
+
+class AgentOutputBuffer:
+    """
+    Columnar storage for many agent outputs (e.g. one backtest run).
+    
+    Each row is one step (bar) holding the outputs of n_agents agents.
+    push() fills the slots of the current row in order and moves on to the
+    next row once it is full. Signals, confidences and agent types live in
+    preallocated NumPy arrays so aggregation can run over whole columns;
+    metadata is kept sparsely on the side.
+    
+    Example:
+        >>> buffer = AgentOutputBuffer(n_agents=3, capacity=len(bars))
+        >>> for bar in bars:
+        ...     for agent in agents:
+        ...         buffer.push_output(agent.analyze(bar))
+        >>> signals, confidences, decisions = decision_agent.analyze_batch(buffer)
+    """
+    
+    def __init__(self, n_agents: int, capacity: int):
+        """
+        Initialize buffer.
+        
+        Args:
+            n_agents: Number of agent outputs per step
+            capacity: Maximum number of steps
+        """
+        if n_agents <= 0 or capacity <= 0:
+            raise ValueError("n_agents and capacity must be positive")
+        
+        self.n_agents = n_agents
+        self.capacity = capacity
+        
+        # Missing signal is stored as NaN (treated as invalid, like None)
+        self.signals = np.full((capacity, n_agents), np.nan, dtype=np.float64)
+        self.confidences = np.zeros((capacity, n_agents), dtype=np.float64)
+        self.agent_types = np.full((capacity, n_agents), -1, dtype=np.int8)
+        self.metadata: Dict[Tuple[int, int], Dict[str, Any]] = {}
+        
+        self._size = 0  # number of filled slots
+    
+    @property
+    def n_rows(self) -> int:
+        """Number of steps that hold at least one output."""
+        return -(-self._size // self.n_agents)
+    
+    def __len__(self) -> int:
+        return self.n_rows
+    
+    def push(
+        self,
+        agent_type_idx: int,
+        signal: Optional[float],
+        confidence: float,
+        metadata: Optional[Dict[str, Any]] = None
+    ):
+        """
+        Append one agent output.
+        
+        Args:
+            agent_type_idx: Index of the agent type in AGENT_TYPES
+            signal: Trading signal (-1 to 1) or None
+            confidence: Confidence level (0 to 1)
+            metadata: Optional metadata (stored only when given)
+        """
+        if self._size >= self.capacity * self.n_agents:
+            raise IndexError("AgentOutputBuffer is full")
+        
+        row, col = divmod(self._size, self.n_agents)
+        self.signals[row, col] = np.nan if signal is None else signal
+        self.confidences[row, col] = confidence
+        self.agent_types[row, col] = agent_type_idx
+        if metadata:
+            self.metadata[(row, col)] = metadata
+        
+        self._size += 1
+    
+    def push_output(self, output: AgentOutput):
+        """Append an AgentOutput."""
+        self.push(AGENT_TYPE_INDEX[output.agent_type], output.signal, output.confidence, output.metadata)
+    
+    def get_outputs(self, row: int) -> List[AgentOutput]:
+        """Rebuild the AgentOutput objects stored in a row."""
+        outputs = []
+        for col in range(self.n_agents):
+            type_idx = self.agent_types[row, col]
+            if type_idx < 0:
+                continue
+            signal = self.signals[row, col]
+            outputs.append(AgentOutput(
+                agent_type=AGENT_TYPES[type_idx],
+                signal=None if np.isnan(signal) else float(signal),
+                confidence=float(self.confidences[row, col]),
+                metadata=self.metadata.get((row, col))
+            ))
+        return outputs
+    
+    def clear(self):
+        """Reset the buffer for reuse."""
+        self.signals.fill(np.nan)
+        self.confidences.fill(0.0)
+        self.agent_types.fill(-1)
+        self.metadata.clear()
+        self._size = 0
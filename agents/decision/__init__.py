@@ -2,6 +2,6 @@
 Decision agent package.
 """
 
-from .decision_agent import DecisionAgent, TradingDecision
+from .decision_agent import DecisionAgent, TradingDecision, DECISIONS
 
-__all__ = ["DecisionAgent", "TradingDecision"]
+__all__ = ["DecisionAgent", "TradingDecision", "DECISIONS"]
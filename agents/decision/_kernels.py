@@ -0,0 +1,112 @@
+"""
+Numba kernels for DecisionAgent signal aggregation.
+"""
+
+import numpy as np
+
+from utils._njit import njit
+
+
+@njit(cache=True)
+def aggregate_signals(signals, confidences):
+    """
+    Confidence-weighted signal aggregation.
+    
+    Args:
+        signals: float64 array of agent signals (-1 to 1)
+        confidences: float64 array of agent confidences (0 to 1), same length
+        
+    Returns:
+        Tuple of (aggregated_signal, aggregated_confidence)
+    """
+    n = signals.shape[0]
+    
+    # Weight by confidence
+    total_weight = 0.0
+    weighted_signal = 0.0
+    for i in range(n):
+        weighted_signal += signals[i] * confidences[i]
+        total_weight += confidences[i]
+    
+    # Calculate final signal
+    if total_weight > 0:
+        final_signal = weighted_signal / total_weight
+    else:
+        final_signal = 0.0
+    
+    # Calculate final confidence (average of confidences, but penalize disagreement)
+    avg_confidence = total_weight / n
+    
+    # Calculate signal agreement (how much agents agree)
+    signal_variance = 0.0
+    for i in range(n):
+        signal_variance += (signals[i] - final_signal) ** 2
+    signal_variance /= n
+    agreement_factor = max(0.5, 1.0 - signal_variance)
+    
+    return final_signal, avg_confidence * agreement_factor
+
+
+@njit(cache=True)
+def aggregate_signals3(s1, c1, s2, c2, s3, c3):
+    """
+    aggregate_signals unrolled for exactly three agents (technical, ML, risk).
+    
+    Same operation order as the generic kernel, so results are identical.
+    """
+    total_weight = c1 + c2 + c3
+    if total_weight > 0:
+        final_signal = (s1 * c1 + s2 * c2 + s3 * c3) / total_weight
+    else:
+        final_signal = 0.0
+    
+    avg_confidence = total_weight / 3
+    signal_variance = ((s1 - final_signal) ** 2 + (s2 - final_signal) ** 2 + (s3 - final_signal) ** 2) / 3
+    agreement_factor = max(0.5, 1.0 - signal_variance)
+    
+    return final_signal, avg_confidence * agreement_factor
+
+
+@njit(cache=True)
+def aggregate_signals_batch(signals, confidences):
+    """
+    Row-wise aggregate_signals over (n_steps, n_agents) arrays.
+    
+    Entries with a NaN signal or non-positive confidence are skipped; rows
+    without any valid entry aggregate to (0.0, 0.0).
+    
+    Returns:
+        Tuple of (aggregated_signals, aggregated_confidences) arrays
+    """
+    n_rows, n_cols = signals.shape
+    final_signals = np.zeros(n_rows)
+    final_confidences = np.zeros(n_rows)
+    
+    for row in range(n_rows):
+        n = 0
+        total_weight = 0.0
+        weighted_signal = 0.0
+        for col in range(n_cols):
+            s = signals[row, col]
+            c = confidences[row, col]
+            if not np.isnan(s) and c > 0:
+                weighted_signal += s * c
+                total_weight += c
+                n += 1
+        if n == 0:
+            continue
+        
+        final_signal = weighted_signal / total_weight if total_weight > 0 else 0.0
+        
+        signal_variance = 0.0
+        for col in range(n_cols):
+            s = signals[row, col]
+            if not np.isnan(s) and confidences[row, col] > 0:
+                signal_variance += (s - final_signal) ** 2
+        signal_variance /= n
+        agreement_factor = max(0.5, 1.0 - signal_variance)
+        
+        final_signals[row] = final_signal
+        final_confidences[row] = total_weight / n * agreement_factor
+    
+    return final_signals, final_confidences
@@ -3,15 +3,28 @@ Decision agent for making final trading decisions.
 """
 
 import logging
-from typing import List, Dict, Any
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple
 from enum import Enum
 
-from agents.base import BaseAgent, AgentOutput, AgentType
+import numpy as np
+
+from agents.base import BaseAgent, AgentOutput, AgentType, AgentOutputBuffer
+from agents.decision._kernels import aggregate_signals, aggregate_signals3, aggregate_signals_batch
 from config import settings
 
 
 logger = logging.getLogger(__name__)
 
+# Signal bands used by the decision table:
+# 0: <= -0.5 | 1: (-0.5, -0.2] | 2: (-0.2, 0.2) | 3: [0.2, 0.5) | 4: >= 0.5
+_NEGATIVE_SIGNAL_EDGES = (-0.5, -0.2)
+_POSITIVE_SIGNAL_EDGES = (0.2, 0.5)
+_SIGNAL_BAND_SAMPLES = (-1.0, -0.3, 0.0, 0.3, 1.0)
+_NEGATIVE_SIGNAL_EDGES_ARR = np.array(_NEGATIVE_SIGNAL_EDGES)
+_POSITIVE_SIGNAL_EDGES_ARR = np.array(_POSITIVE_SIGNAL_EDGES)
+
 
 class TradingDecision(Enum):
     """Trading decision types."""
@@ -22,6 +35,13 @@ class TradingDecision(Enum):
     STRONG_SELL = "STRONG_SELL"
 
 
+# Stable TradingDecision <-> int8 code mapping (used by analyze_batch)
+DECISIONS = tuple(TradingDecision)
+
+# TradingDecision -> value string (dict lookup instead of the Enum descriptor)
+_DECISION_STR = {d: d.value for d in TradingDecision}
+
+
 class DecisionAgent(BaseAgent):
     """
     Decision-making agent that aggregates signals from multiple agents.
@@ -30,11 +50,36 @@ class DecisionAgent(BaseAgent):
     and makes a final trading decision with reasoning.
     """
     
-    def __init__(self, name: str = "Decision Agent"):
-        """Initialize the decision agent."""
+    def __init__(
+        self,
+        name: str = "Decision Agent",
+        cache_size: int = 512,
+        cache_min_outputs: int = 2,
+        build_metadata: bool = True
+    ):
+        """
+        Initialize the decision agent.
+        
+        Args:
+            name: Name of the agent
+            cache_size: Max number of memoized decisions (0 disables the cache)
+            cache_min_outputs: Only memoize when at least this many valid outputs
+                are aggregated (smaller inputs are cheaper to recompute)
+            build_metadata: Build agent_contributions and reasoning in the output
+                metadata. Backtests that only read signal/confidence can turn this
+                off; metadata then only holds the decision.
+        """
         super().__init__(AgentType.DECISION, name)
         self.strong_threshold = settings.strong_signal_threshold
         self.medium_threshold = settings.medium_signal_threshold
+        self.build_metadata = build_metadata
+        self._build_decision_lut()
+        self._make_decision = self._compile_decision(self.strong_threshold, self.medium_threshold)
+        
+        # LRU cache: exact (agent_type, signal, confidence) tuples -> decision
+        self.cache_size = cache_size
+        self.cache_min_outputs = cache_min_outputs
+        self._cache: "OrderedDict[tuple, Tuple[float, float, TradingDecision, Optional[str]]]" = OrderedDict()
     
     def analyze(self, agent_outputs: List[AgentOutput]) -> AgentOutput:
         """
@@ -47,7 +92,7 @@ class DecisionAgent(BaseAgent):
             AgentOutput with final decision
         """
         if not self.enabled:
-            logger.warning(f"Agent {self.name} is disabled")
+            logger.warning("Agent %s is disabled", self.name)
             return AgentOutput(
                 agent_type=self.agent_type,
                 signal=0.0,
@@ -64,13 +109,21 @@ class DecisionAgent(BaseAgent):
                 metadata={"error": "no_inputs"}
             )
         
-        logger.info(f"Analyzing outputs from {len(agent_outputs)} agents")
+        logger.info("Analyzing outputs from %d agents", len(agent_outputs))
         
-        # Filter out disabled agents or invalid outputs
-        valid_outputs = [
-            output for output in agent_outputs
-            if output.signal is not None and output.confidence > 0
-        ]
+        # Filter out disabled agents or invalid outputs, collecting the
+        # values for aggregation in the same pass
+        n = len(agent_outputs)
+        signals = np.empty(n, dtype=np.float64)
+        confidences = np.empty(n, dtype=np.float64)
+        valid_outputs = []
+        k = 0
+        for output in agent_outputs:
+            if output.signal is not None and output.confidence > 0:
+                signals[k] = output.signal
+                confidences[k] = output.confidence
+                valid_outputs.append(output)
+                k += 1
         
         if not valid_outputs:
             logger.warning("No valid agent outputs")
@@ -81,29 +134,59 @@ class DecisionAgent(BaseAgent):
                 metadata={"error": "no_valid_inputs"}
             )
         
-        # Calculate weighted average signal
-        final_signal, final_confidence = self._aggregate_signals(valid_outputs)
+        # Identical inputs produce identical decisions - reuse them
+        use_cache = self.cache_size > 0 and len(valid_outputs) >= self.cache_min_outputs
+        cached = None
+        if use_cache:
+            # Exact values: a rounded key would return the decision of a
+            # nearby input (e.g. just across a threshold)
+            key = tuple(
+                (output._type_name, output.signal, output.confidence)
+                for output in valid_outputs
+            )
+            cached = self._cache.get(key)
         
-        # Make decision
-        decision = self._make_decision(final_signal, final_confidence)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            final_signal, final_confidence, decision, reasoning = cached
+        else:
+            # Calculate weighted average signal
+            final_signal, final_confidence = self._aggregate_signals(signals[:k], confidences[:k])
+            
+            # Make decision
+            decision = self._make_decision(final_signal, final_confidence)
+            reasoning = None
         
-        # Generate reasoning
-        reasoning = self._generate_reasoning(valid_outputs, final_signal, final_confidence, decision)
+        if not self.build_metadata:
+            metadata = {"decision": _DECISION_STR[decision]}
+        else:
+            # Generate reasoning
+            if reasoning is None:
+                reasoning = self._generate_reasoning(valid_outputs, final_signal, final_confidence, decision)
+            
+            metadata = {
+                "decision": _DECISION_STR[decision],
+                "agent_contributions": [
+                    {
+                        "agent": output._type_name,
+                        "signal": output.signal,
+                        "confidence": output.confidence
+                    }
+                    for output in valid_outputs
+                ],
+                "reasoning": reasoning
+            }
         
-        metadata = {
-            "decision": decision.value,
-            "agent_contributions": [
-                {
-                    "agent": output.agent_type.value,
-                    "signal": output.signal,
-                    "confidence": output.confidence
-                }
-                for output in valid_outputs
-            ],
-            "reasoning": reasoning
-        }
+        # Store new results (or fill in reasoning that was skipped earlier)
+        if use_cache and (cached is None or cached[3] is not reasoning):
+            self._cache[key] = (final_signal, final_confidence, decision, reasoning)
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
         
-        logger.info(f"Final decision: {decision.value} (signal={final_signal:.2f}, confidence={final_confidence:.2f})")
+        logger.info(
+            "Final decision: %s (signal=%.2f, confidence=%.2f)",
+            _DECISION_STR[decision], final_signal, final_confidence
+        )
         
         return AgentOutput(
             agent_type=self.agent_type,
@@ -112,43 +195,63 @@ class DecisionAgent(BaseAgent):
             metadata=metadata
         )
     
-    def _aggregate_signals(self, outputs: List[AgentOutput]) -> tuple[float, float]:
+    def analyze_batch(self, buffer: AgentOutputBuffer) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
         """
-        Aggregate signals from multiple agents using confidence-weighted average.
+        Aggregate every step of an AgentOutputBuffer at once.
+        
+        Same rules as analyze(), vectorized over all rows; no metadata or
+        reasoning is produced. Steps without valid outputs give signal and
+        confidence 0 (HOLD).
         
         Args:
-            outputs: List of valid AgentOutput objects
+            buffer: Buffer with one row of agent outputs per step
             
         Returns:
-            Tuple of (aggregated_signal, aggregated_confidence)
+            Tuple of (signals, confidences, decision_codes) arrays, one entry
+            per step. decision_codes index into DECISIONS.
         """
-        total_weight = 0.0
-        weighted_signal = 0.0
-        confidences = []
-        
-        for output in outputs:
-            # Weight by confidence
-            weight = output.confidence
-            weighted_signal += output.signal * weight
-            total_weight += weight
-            confidences.append(output.confidence)
+        n_rows = buffer.n_rows
+        hold = DECISIONS.index(TradingDecision.HOLD)
         
-        # Calculate final signal
-        if total_weight > 0:
-            final_signal = weighted_signal / total_weight
-        else:
-            final_signal = 0.0
+        if not self.enabled:
+            logger.warning("Agent %s is disabled", self.name)
+            return np.zeros(n_rows), np.zeros(n_rows), np.full(n_rows, hold, dtype=np.int8)
         
-        # Calculate final confidence (average of confidences, but penalize disagreement)
-        avg_confidence = sum(confidences) / len(confidences)
+        signals, confidences = aggregate_signals_batch(
+            buffer.signals[:n_rows], buffer.confidences[:n_rows]
+        )
         
-        # Calculate signal agreement (how much agents agree)
-        signal_variance = sum((output.signal - final_signal) ** 2 for output in outputs) / len(outputs)
-        agreement_factor = max(0.5, 1.0 - signal_variance)
+        bands = (
+            np.searchsorted(_NEGATIVE_SIGNAL_EDGES_ARR, signals, side='left') +
+            np.searchsorted(_POSITIVE_SIGNAL_EDGES_ARR, signals, side='right')
+        )
+        decision_codes = self._decision_code_lut[
+            (confidences >= self.strong_threshold).astype(np.intp),
+            (confidences >= self.medium_threshold).astype(np.intp),
+            bands
+        ]
         
-        final_confidence = avg_confidence * agreement_factor
+        return signals, confidences, decision_codes
+    
+    def _aggregate_signals(self, signals: np.ndarray, confidences: np.ndarray) -> tuple[float, float]:
+        """
+        Aggregate signals from multiple agents using confidence-weighted average.
         
-        return final_signal, final_confidence
+        Args:
+            signals: Signals of the valid agent outputs
+            confidences: Confidences of the valid agent outputs
+            
+        Returns:
+            Tuple of (aggregated_signal, aggregated_confidence)
+        """
+        if signals.shape[0] == 3:
+            # Common technical + ML + risk case: unrolled kernel
+            s1, s2, s3 = signals.tolist()
+            c1, c2, c3 = confidences.tolist()
+            final_signal, final_confidence = aggregate_signals3(s1, c1, s2, c2, s3, c3)
+        else:
+            final_signal, final_confidence = aggregate_signals(signals, confidences)
+        return float(final_signal), float(final_confidence)
     
     def _make_decision(self, signal: float, confidence: float) -> TradingDecision:
         """
@@ -160,16 +263,64 @@ class DecisionAgent(BaseAgent):
             
         Returns:
             TradingDecision enum
+            
+        Note:
+            Instances replace this with a closure from _compile_decision();
+            thresholds should be changed through set_thresholds().
+        """
+        band = bisect_left(_NEGATIVE_SIGNAL_EDGES, signal) + bisect_right(_POSITIVE_SIGNAL_EDGES, signal)
+        return self._decision_lut[confidence >= self.strong_threshold][confidence >= self.medium_threshold][band]
+    
+    def _compile_decision(self, strong: float, medium: float):
+        """
+        Build a _make_decision specialized for fixed thresholds.
+        
+        The thresholds, lookup table and band edges are captured as closure
+        cells, so each call avoids the instance attribute loads.
+        """
+        lut = self._decision_lut
+        neg_edges = _NEGATIVE_SIGNAL_EDGES
+        pos_edges = _POSITIVE_SIGNAL_EDGES
+        
+        def make_decision(signal: float, confidence: float) -> TradingDecision:
+            band = bisect_left(neg_edges, signal) + bisect_right(pos_edges, signal)
+            return lut[confidence >= strong][confidence >= medium][band]
+        
+        return make_decision
+    
+    def _build_decision_lut(self):
         """
+        Precompute decisions for every (strong, medium, signal band) combination.
+        
+        Indexed as lut[confidence >= strong][confidence >= medium][signal band].
+        """
+        self._decision_lut = tuple(
+            tuple(
+                tuple(
+                    self._decision_rule(signal, is_strong, is_medium)
+                    for signal in _SIGNAL_BAND_SAMPLES
+                )
+                for is_medium in (False, True)
+            )
+            for is_strong in (False, True)
+        )
+        self._decision_code_lut = np.array(
+            [[[DECISIONS.index(d) for d in bands] for bands in medium] for medium in self._decision_lut],
+            dtype=np.int8
+        )
+    
+    @staticmethod
+    def _decision_rule(signal: float, is_strong: bool, is_medium: bool) -> TradingDecision:
+        """Decision rules behind the lookup table."""
         # Only make strong decisions if confidence is high
-        if confidence >= self.strong_threshold:
+        if is_strong:
             if signal >= 0.5:
                 return TradingDecision.STRONG_BUY
             elif signal <= -0.5:
                 return TradingDecision.STRONG_SELL
         
         # Medium confidence decisions
-        if confidence >= self.medium_threshold:
+        if is_medium:
             if signal >= 0.2:
                 return TradingDecision.BUY
             elif signal <= -0.2:
@@ -187,34 +338,28 @@ class DecisionAgent(BaseAgent):
     ) -> str:
         """Generate human-readable reasoning for the decision."""
         
-        reasoning_parts = []
-        
-        # Summary
-        reasoning_parts.append(
-            f"Decision: {decision.value} based on analysis of {len(outputs)} agent(s)."
-        )
-        
         # Signal strength
         signal_strength = "strong" if abs(signal) > 0.6 else "moderate" if abs(signal) > 0.3 else "weak"
         signal_direction = "bullish" if signal > 0 else "bearish" if signal < 0 else "neutral"
-        reasoning_parts.append(
-            f"Overall signal is {signal_strength} {signal_direction} ({signal:.2f})."
-        )
         
         # Confidence
         confidence_level = "high" if confidence > 0.7 else "medium" if confidence > 0.5 else "low"
-        reasoning_parts.append(f"Confidence level is {confidence_level} ({confidence:.2f}).")
+        
+        summary = (
+            f"Decision: {_DECISION_STR[decision]} based on analysis of {len(outputs)} agent(s). "
+            f"Overall signal is {signal_strength} {signal_direction} ({signal:.2f}). "
+            f"Confidence level is {confidence_level} ({confidence:.2f})."
+        )
         
         # Agent contributions
-        for output in outputs:
-            agent_name = output.agent_type.value
-            agent_signal = "buy" if output.signal > 0.2 else "sell" if output.signal < -0.2 else "neutral"
-            reasoning_parts.append(
-                f"- {agent_name.capitalize()} agent suggests {agent_signal} "
-                f"(signal={output.signal:.2f}, confidence={output.confidence:.2f})"
-            )
+        contributions = " ".join(
+            f"- {output._type_name.capitalize()} agent suggests "
+            f"{'buy' if output.signal > 0.2 else 'sell' if output.signal < -0.2 else 'neutral'} "
+            f"(signal={output.signal:.2f}, confidence={output.confidence:.2f})"
+            for output in outputs
+        )
         
-        return " ".join(reasoning_parts)
+        return f"{summary} {contributions}" if contributions else summary
     
     def set_thresholds(self, strong: float, medium: float):
         """
@@ -226,4 +371,10 @@ class DecisionAgent(BaseAgent):
         """
         self.strong_threshold = max(0.0, min(1.0, strong))
         self.medium_threshold = max(0.0, min(1.0, medium))
-        logger.info(f"Updated thresholds: strong={self.strong_threshold}, medium={self.medium_threshold}")
+        self._make_decision = self._compile_decision(self.strong_threshold, self.medium_threshold)
+        self.clear_cache()
+        logger.info("Updated thresholds: strong=%s, medium=%s", self.strong_threshold, self.medium_threshold)
+    
+    def clear_cache(self):
+        """Drop all memoized decisions."""
+        self._cache.clear()
@@ -16,9 +16,13 @@ Final Decision Logic:
 - اگر همه OK بودن → معامله با weighted confidence
 """
 
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Sequence
 from dataclasses import dataclass
-import numpy as np
+from types import MappingProxyType
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import math
+import os
 
 from agents.base import BaseAgent, AgentOutput, AgentType
 from agents.technical.enhanced_technical_agent import EnhancedTechnicalAgent
@@ -27,7 +31,7 @@ from agents.risk.risk_management_agent import RiskManagementAgent
 from data_layer.models import MarketData
 
 
-@dataclass
+@dataclass(slots=True)
 class MetaDecision:
     """تصمیم نهایی Meta-Agent"""
     final_signal: float  # -1 to 1
@@ -36,9 +40,10 @@ class MetaDecision:
     position_size: float
     stop_loss: float
     take_profit: float
-    reasoning_chain: List[str]  # دلیل هر agent
-    veto_reasons: List[str]  # اگر reject شد چرا؟
-    warnings: List[str]
+    # لیست‌های خالی به صورت () برگردانده می‌شوند (بدون allocation در backtest)
+    reasoning_chain: Sequence[str]  # دلیل هر agent
+    veto_reasons: Sequence[str]  # اگر reject شد چرا؟
+    warnings: Sequence[str]
 
 
 class MetaAgentOrchestrator:
@@ -58,7 +63,12 @@ class MetaAgentOrchestrator:
         self,
         account_balance: float = 10000.0,
         min_technical_confidence: float = 0.5,
-        ml_filter_veto_threshold: float = 0.4
+        ml_filter_veto_threshold: float = 0.4,
+        max_workers: Optional[int] = None,
+        build_metadata: bool = True,
+        min_signal_strength: float = 0.05,
+        technical_agent: Optional[EnhancedTechnicalAgent] = None,
+        ml_filter: Optional[SimpleMLFilter] = None
     ):
         """
         Initialize Meta-Agent
@@ -67,22 +77,87 @@ class MetaAgentOrchestrator:
             account_balance: مبلغ اولیه حساب
             min_technical_confidence: حداقل confidence برای Technical
             ml_filter_veto_threshold: threshold برای veto توسط ML
+            max_workers: تعداد thread ها برای get_decision_async (default: os.cpu_count())
+            build_metadata: ساخت reasoning_chain (برای backtest می‌توان خاموش کرد)
+            min_signal_strength: حداقل confidence × |signal| در Technical؛
+                کمتر از این بدون اجرای ML Filter و Risk → HOLD
+            technical_agent: Technical Agent (اختیاری، default: EnhancedTechnicalAgent())
+            ml_filter: ML Filter (اختیاری، default: SimpleMLFilter())
         """
         # Initialize all agents
-        self.technical_agent = EnhancedTechnicalAgent()
-        self.ml_filter = SimpleMLFilter()
+        # هر orchestrator agents خودش را دارد: تنظیمات public آن‌ها (rsi_period،
+        # threshold ها، disable()) نباید روی orchestrator های دیگر اثر بگذارد.
+        # ساخت Technical و ML Filter حدود یک میکروثانیه است؛ cache لازم ندارد
+        self.technical_agent = technical_agent or EnhancedTechnicalAgent()
+        self.ml_filter = ml_filter or SimpleMLFilter()
         self.risk_agent = RiskManagementAgent(account_balance=account_balance)
         
         # Settings
         self.min_technical_confidence = min_technical_confidence
         self.ml_filter_veto_threshold = ml_filter_veto_threshold
+        self.build_metadata = build_metadata
+        self.min_signal_strength = min_signal_strength
         
         # Weights for final decision (must sum to 1.0)
-        self.weights = {
-            'technical': 0.50,
-            'ml_filter': 0.20,
-            'risk': 0.30
+        self.set_weights(technical=0.50, ml_filter=0.20, risk=0.30)
+        
+        # Thread pool for get_decision_async (created lazily)
+        self.max_workers = max_workers or os.cpu_count()
+        self._executor: Optional[ThreadPoolExecutor] = None
+    
+    # agents به صورت property: setter متد analyze را دوباره bind می‌کند تا bound
+    # method های مسیر داغ (هر bar در backtest) با agent جایگزین‌شده یکی بمانند
+    
+    @property
+    def technical_agent(self) -> EnhancedTechnicalAgent:
+        return self._technical_agent
+    
+    @technical_agent.setter
+    def technical_agent(self, agent: EnhancedTechnicalAgent):
+        self._technical_agent = agent
+        self._tech_analyze = agent.analyze
+    
+    @property
+    def ml_filter(self) -> SimpleMLFilter:
+        return self._ml_filter
+    
+    @ml_filter.setter
+    def ml_filter(self, agent: SimpleMLFilter):
+        self._ml_filter = agent
+        self._ml_analyze = agent.analyze
+    
+    @property
+    def risk_agent(self) -> RiskManagementAgent:
+        return self._risk_agent
+    
+    @risk_agent.setter
+    def risk_agent(self, agent: RiskManagementAgent):
+        self._risk_agent = agent
+        self._risk_analyze = agent.analyze
+    
+    @property
+    def weights(self) -> MappingProxyType:
+        """وزن‌های weighted voting (فقط‌خواندنی؛ تغییر فقط با set_weights)"""
+        return MappingProxyType(self._weights)
+    
+    def set_weights(self, technical: float, ml_filter: float, risk: float):
+        """
+        تنظیم وزن‌های weighted voting (باید جمعشان 1.0 باشد)
+        
+        Args:
+            technical: وزن Technical Agent
+            ml_filter: وزن ML Filter
+            risk: وزن Risk Agent
+        """
+        self._weights = {
+            'technical': technical,
+            'ml_filter': ml_filter,
+            'risk': risk
         }
+        # floats مستقیم برای weighted voting (بدون lookup dict در هر bar)
+        self._w_tech = float(technical)
+        self._w_ml = float(ml_filter)
+        self._w_risk = float(risk)
     
     def get_decision(self, market_data: MarketData) -> MetaDecision:
         """
@@ -100,50 +175,125 @@ class MetaAgentOrchestrator:
         Returns:
             MetaDecision with final action
         """
-        reasoning_chain = []
-        veto_reasons = []
-        warnings = []
+        tech_output = self._tech_analyze(market_data)
+        return self._decide(market_data, tech_output)
+    
+    async def get_decision_async(
+        self,
+        market_data: MarketData,
+        extra_agents: Optional[List[BaseAgent]] = None
+    ) -> MetaDecision:
+        """
+        نسخه async از get_decision
+        
+        Technical Agent و هر agent مستقل دیگر (مثلاً technical روی timeframe های
+        دیگر، sentiment، news) به صورت همزمان روی thread pool اجرا می‌شوند.
+        زنجیره veto (Technical → ML Filter → Risk) دقیقاً مثل get_decision حفظ می‌شود.
+        
+        Args:
+            market_data: داده‌های بازار
+            extra_agents: agents مستقل که فقط به market_data نیاز دارند
+        
+        Returns:
+            MetaDecision with final action (خروجی extra_agents به reasoning_chain اضافه می‌شود)
+        """
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        extra_agents = extra_agents or []
+        
+        outputs = await asyncio.gather(
+            loop.run_in_executor(executor, self._tech_analyze, market_data),
+            *(loop.run_in_executor(executor, agent.analyze, market_data) for agent in extra_agents)
+        )
+        tech_output, extra_outputs = outputs[0], outputs[1:]
+        
+        decision = await loop.run_in_executor(executor, self._decide, market_data, tech_output)
+        
+        if self.build_metadata:
+            for agent, output in zip(extra_agents, extra_outputs):
+                decision.reasoning_chain.append(
+                    f"{agent.name}: Signal={output.signal:.2f}, "
+                    f"Confidence={output.confidence:.2f}"
+                )
+        
+        return decision
+    
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """Thread pool مشترک برای get_decision_async"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+    
+    def shutdown(self):
+        """بستن thread pool"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+    
+    def _decide(self, market_data: MarketData, tech_output: AgentOutput) -> MetaDecision:
+        """
+        زنجیره veto روی خروجی Technical Agent (STEP 1 تا STEP 4)
+        
+        Args:
+            market_data: داده‌های بازار
+            tech_output: خروجی Technical Agent
+        
+        Returns:
+            MetaDecision with final action
+        """
+        # veto_reasons و warnings فقط در صورت نیاز ساخته می‌شوند
+        reasoning_chain = [] if self.build_metadata else ()
+        warnings = ()
         
         # ========================================
         # STEP 1: Technical Analysis
         # ========================================
-        tech_output = self.technical_agent.analyze(market_data)
-        
-        reasoning_chain.append(
-            f"Technical: Signal={tech_output.signal:.2f}, "
-            f"Confidence={tech_output.confidence:.2f}, "
-            f"Reasons={tech_output.metadata.get('reasons', [])}"
-        )
+        if self.build_metadata:
+            reasoning_chain.append(
+                f"Technical: Signal={tech_output.signal:.2f}, "
+                f"Confidence={tech_output.confidence:.2f}, "
+                f"Reasons={tech_output.metadata.get('reasons', [])}"
+            )
         
         # Check minimum technical confidence
         if tech_output.confidence < self.min_technical_confidence:
-            veto_reasons.append(
+            veto_reasons = [
                 f"Technical confidence too low: {tech_output.confidence:.2f} < {self.min_technical_confidence}"
-            )
+            ]
             return self._create_hold_decision(reasoning_chain, veto_reasons, warnings)
         
         # If no clear signal, hold
         if abs(tech_output.signal) < 0.1:
-            veto_reasons.append("No clear technical signal")
+            veto_reasons = ["No clear technical signal"]
+            return self._create_hold_decision(reasoning_chain, veto_reasons, warnings)
+        
+        # Trivially weak signal: skip ML Filter and Risk entirely
+        signal_strength = tech_output.confidence * abs(tech_output.signal)
+        if signal_strength < self.min_signal_strength:
+            veto_reasons = [
+                f"Technical signal too weak: {signal_strength:.3f} < {self.min_signal_strength}"
+            ]
             return self._create_hold_decision(reasoning_chain, veto_reasons, warnings)
         
         # ========================================
         # STEP 2: ML Filter
         # ========================================
-        ml_output = self.ml_filter.analyze(market_data, tech_output)
+        ml_output = self._ml_analyze(market_data, tech_output)
         
-        filter_decision = ml_output.metadata.get('filter_decision', 'UNKNOWN')
-        filter_reason = ml_output.metadata.get('filter_reason', '')
+        ml_metadata = ml_output.metadata
+        filter_decision = ml_metadata.get('filter_decision', 'UNKNOWN')
+        filter_reason = ml_metadata.get('filter_reason', '')
         
-        reasoning_chain.append(
-            f"ML Filter: {filter_decision}, "
-            f"Confidence={ml_output.confidence:.2f}, "
-            f"Reason={filter_reason}"
-        )
+        if self.build_metadata:
+            reasoning_chain.append(
+                f"ML Filter: {filter_decision}, "
+                f"Confidence={ml_output.confidence:.2f}, "
+                f"Reason={filter_reason}"
+            )
         
         # ML Filter veto
         if filter_decision == 'REJECT':
-            veto_reasons.append(f"ML Filter rejected: {filter_reason}")
+            veto_reasons = [f"ML Filter rejected: {filter_reason}"]
             return self._create_hold_decision(reasoning_chain, veto_reasons, warnings)
         
         # ========================================
@@ -154,28 +304,32 @@ class MetaAgentOrchestrator:
         stop_loss = tech_metadata.get('stop_loss', 0.0)
         take_profit = tech_metadata.get('take_profit', 0.0)
         
-        risk_output = self.risk_agent.analyze(
+        risk_output = self._risk_analyze(
             market_data=market_data,
             signal_output=ml_output,
             stop_loss=stop_loss,
             take_profit=take_profit
         )
         
-        risk_decision = risk_output.metadata.get('risk_decision', 'UNKNOWN')
-        risk_warnings = risk_output.metadata.get('warnings', [])
-        rejection_reasons = risk_output.metadata.get('rejection_reasons', [])
+        risk_metadata = risk_output.metadata
+        risk_decision = risk_metadata.get('risk_decision', 'UNKNOWN')
+        risk_warnings = risk_metadata.get('warnings', [])
+        rejection_reasons = risk_metadata.get('rejection_reasons', [])
+        position_size = risk_metadata.get('position_size', 0.0)
         
-        reasoning_chain.append(
-            f"Risk: {risk_decision}, "
-            f"Position Size={risk_output.metadata.get('position_size', 0):.4f}, "
-            f"R/R={risk_output.metadata.get('risk_reward_ratio', 0):.2f}"
-        )
+        if self.build_metadata:
+            reasoning_chain.append(
+                f"Risk: {risk_decision}, "
+                f"Position Size={position_size:.4f}, "
+                f"R/R={risk_metadata.get('risk_reward_ratio', 0):.2f}"
+            )
         
-        warnings.extend(risk_warnings)
+        if risk_warnings:
+            warnings = list(risk_warnings)
         
         # Risk veto
         if risk_decision == 'REJECTED':
-            veto_reasons.extend(rejection_reasons)
+            veto_reasons = list(rejection_reasons)
             return self._create_hold_decision(reasoning_chain, veto_reasons, warnings)
         
         # ========================================
@@ -192,14 +346,13 @@ class MetaAgentOrchestrator:
         # Determine action
         if final_signal > 0.3:
             action = "BUY"
+            veto_reasons = ()
         elif final_signal < -0.3:
             action = "SELL"
+            veto_reasons = ()
         else:
             action = "HOLD"
-            veto_reasons.append(f"Weak final signal: {final_signal:.2f}")
-        
-        # Extract position details
-        position_size = risk_output.metadata.get('position_size', 0.0)
+            veto_reasons = [f"Weak final signal: {final_signal:.2f}"]
         
         return MetaDecision(
             final_signal=final_signal,
@@ -225,13 +378,19 @@ class MetaAgentOrchestrator:
         Formula:
         Final Signal = (Tech × 0.5) + (ML × 0.2) + (Risk × 0.3)
         """
-        weighted_signal = (
-            tech_output.signal * self.weights['technical'] +
-            ml_output.signal * self.weights['ml_filter'] +
-            risk_output.signal * self.weights['risk']
+        # فقط سه ضرب روی scalar ها: Python خالص سریع‌تر از np.clip یا dispatch
+        # یک kernel numba است
+        signal = (
+            tech_output.signal * self._w_tech +
+            ml_output.signal * self._w_ml +
+            risk_output.signal * self._w_risk
         )
         
-        return np.clip(weighted_signal, -1.0, 1.0)
+        if signal < -1.0:
+            return -1.0
+        if signal > 1.0:
+            return 1.0
+        return signal
     
     def _calculate_weighted_confidence(
         self,
@@ -243,29 +402,51 @@ class MetaAgentOrchestrator:
         محاسبه confidence نهایی با weighted voting
         
         اگر یکی از agents confidence پایین داشت، نهایی هم پایین میره
+        اگه agents با هم مخالف باشن (std سیگنال‌ها > 0.5)، confidence کم میشه
         """
-        # Weighted average
-        weighted_conf = (
-            tech_output.confidence * self.weights['technical'] +
-            ml_output.confidence * self.weights['ml_filter'] +
-            risk_output.confidence * self.weights['risk']
+        conf = (
+            tech_output.confidence * self._w_tech +
+            ml_output.confidence * self._w_ml +
+            risk_output.confidence * self._w_risk
         )
         
-        # Penalty for disagreement
-        # اگه agents با هم مخالف باشن، confidence کم میشه
-        signals = [tech_output.signal, ml_output.signal, risk_output.signal]
-        signal_std = np.std([s for s in signals if abs(s) > 0.1])
-        
-        if signal_std > 0.5:  # High disagreement
-            weighted_conf *= 0.8
+        # Penalty for disagreement: std سیگنال‌های غیرخنثی (|s| > 0.1)؛ باز شده
+        # برای سه agent (بدون list و generator در هر bar). با یک سیگنال std صفر است
+        s_tech, s_ml, s_risk = tech_output.signal, ml_output.signal, risk_output.signal
+        active_tech, active_ml, active_risk = abs(s_tech) > 0.1, abs(s_ml) > 0.1, abs(s_risk) > 0.1
+        n = active_tech + active_ml + active_risk
+        if n > 1:
+            total = 0.0
+            if active_tech:
+                total += s_tech
+            if active_ml:
+                total += s_ml
+            if active_risk:
+                total += s_risk
+            mean = total / n
+            
+            var = 0.0
+            if active_tech:
+                var += (s_tech - mean) ** 2
+            if active_ml:
+                var += (s_ml - mean) ** 2
+            if active_risk:
+                var += (s_risk - mean) ** 2
+            
+            if math.sqrt(var / n) > 0.5:  # High disagreement
+                conf *= 0.8
         
-        return np.clip(weighted_conf, 0.0, 1.0)
+        if conf < 0.0:
+            return 0.0
+        if conf > 1.0:
+            return 1.0
+        return conf
     
     def _create_hold_decision(
         self,
-        reasoning_chain: List[str],
-        veto_reasons: List[str],
-        warnings: List[str]
+        reasoning_chain: Sequence[str],
+        veto_reasons: Sequence[str],
+        warnings: Sequence[str]
     ) -> MetaDecision:
         """Create a HOLD decision"""
         return MetaDecision(
@@ -284,6 +465,13 @@ class MetaAgentOrchestrator:
         """Update risk agent balance after trade"""
         self.risk_agent.update_balance(new_balance)
     
+    def reset(self, account_balance: float):
+        """
+        Reset account state for a new run (e.g. next walk-forward window)
+        without rebuilding the agents
+        """
+        self.risk_agent.reset(account_balance)
+    
     def get_status(self) -> Dict:
         """Get current status of all agents"""
         return {
@@ -291,5 +479,5 @@ class MetaAgentOrchestrator:
             'current_drawdown': self.risk_agent._calculate_current_drawdown(),
             'open_positions': len(self.risk_agent.open_positions),
             'peak_balance': self.risk_agent.peak_balance,
-            'weights': self.weights
+            'weights': dict(self._weights)
         }
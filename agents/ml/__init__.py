@@ -4,6 +4,6 @@ ML Agent for predictive analytics
 
 from agents.ml.ml_agent import MLAgent, MLAgentOutput
 from agents.ml.feature_engineer import FeatureEngineer
-from agents.ml.models import MLModel, RandomForestModel, XGBoostModel, EnsembleModel
+from agents.ml.models import MLModel, RandomForestModel, HistRandomForestModel, XGBoostModel, EnsembleModel
 
-__all__ = ['MLAgent', 'MLAgentOutput', 'FeatureEngineer', 'MLModel', 'RandomForestModel', 'XGBoostModel', 'EnsembleModel']
+__all__ = ['MLAgent', 'MLAgentOutput', 'FeatureEngineer', 'MLModel', 'RandomForestModel', 'HistRandomForestModel', 'XGBoostModel', 'EnsembleModel']
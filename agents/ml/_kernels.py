@@ -0,0 +1,709 @@
+"""
+Numba kernels for FeatureEngineer indicators and the ML agent hot paths.
+"""
+
+import numpy as np
+
+from utils._njit import njit, prange
+
+
+@njit(cache=True)
+def rsi_sma(prices, period):
+    """
+    RSI with simple moving averages of gains/losses over `period` bars.
+
+    Running-window sums, O(N). Matches the pandas version:
+    diff -> clip to gains/losses (NaN deltas count as 0) -> rolling mean,
+    so the first period - 1 values are NaN; a window without gains and
+    losses is NaN and one without losses is 100.
+
+    Args:
+        prices: float64 array of prices
+        period: RSI period
+
+    Returns:
+        float64 array of RSI values (0 to 100)
+    """
+    n = prices.shape[0]
+    rsi = np.full(n, np.nan)
+    gains = np.zeros(n)
+    losses = np.zeros(n)
+    for i in range(1, n):
+        delta = prices[i] - prices[i - 1]
+        if delta > 0:
+            gains[i] = delta
+        elif delta < 0:
+            losses[i] = -delta
+
+    gain_sum = 0.0
+    loss_sum = 0.0
+    # Nonzero entries in the window; an all-zero window sums to exactly 0
+    gain_count = 0
+    loss_count = 0
+    for i in range(n):
+        gain_sum += gains[i]
+        loss_sum += losses[i]
+        gain_count += gains[i] != 0
+        loss_count += losses[i] != 0
+        if i >= period:
+            gain_sum -= gains[i - period]
+            loss_sum -= losses[i - period]
+            gain_count -= gains[i - period] != 0
+            loss_count -= losses[i - period] != 0
+        if i < period - 1:
+            continue
+
+        avg_gain = gain_sum / period if gain_count > 0 else 0.0
+        avg_loss = loss_sum / period if loss_count > 0 else 0.0
+        if avg_loss > 0:
+            rsi[i] = 100.0 - 100.0 / (1.0 + max(avg_gain, 0.0) / avg_loss)
+        elif avg_gain > 0:
+            rsi[i] = 100.0
+
+    return rsi
+
+
+@njit(cache=True)
+def rolling_sum(values, period):
+    """
+    rolling(period).sum() with a running sum (O(1) per step).
+
+    Windows containing NaN (or fewer than `period` values) are NaN, as in
+    pandas with the default min_periods; all-zero windows are exactly 0.
+    The sum is rebuilt from the window once per period so it does not
+    drift over long histories.
+    """
+    n = values.shape[0]
+    out = np.full(n, np.nan)
+    total = 0.0
+    nan_count = 0
+    nonzero_count = 0
+    for i in range(n):
+        x = values[i]
+        if np.isnan(x):
+            nan_count += 1
+        else:
+            total += x
+            nonzero_count += x != 0
+        if i >= period:
+            old = values[i - period]
+            if np.isnan(old):
+                nan_count -= 1
+            else:
+                total -= old
+                nonzero_count -= old != 0
+        if i < period - 1:
+            continue
+
+        if (i + 1) % period == 0:
+            total = 0.0
+            for j in range(i - period + 1, i + 1):
+                if not np.isnan(values[j]):
+                    total += values[j]
+        if nan_count == 0:
+            out[i] = total if nonzero_count > 0 else 0.0
+
+    return out
+
+
+@njit(cache=True)
+def rolling_mean(values, period):
+    """rolling(period).mean(); see rolling_sum for NaN handling."""
+    return rolling_sum(values, period) / period
+
+
+@njit(cache=True)
+def _ewm_step(weighted, old_wt, cur, alpha):
+    """
+    One step of pandas ewm(adjust=False, ignore_na=False).mean().
+
+    Returns:
+        Tuple of (weighted, old_wt) after consuming `cur`
+    """
+    if not np.isnan(weighted):
+        old_wt *= 1.0 - alpha
+        if not np.isnan(cur):
+            if weighted != cur:
+                weighted = (old_wt * weighted + alpha * cur) / (old_wt + alpha)
+            old_wt = 1.0
+    elif not np.isnan(cur):
+        weighted = cur
+    return weighted, old_wt
+
+
+@njit(cache=True)
+def macd(prices, fast, slow, signal):
+    """
+    MACD line, signal line and histogram in one pass.
+
+    The three EMAs (fast, slow, signal of macd) follow pandas
+    ewm(span=..., adjust=False).mean().
+
+    Returns:
+        Tuple of (macd, macd_signal, macd_hist) float64 arrays
+    """
+    n = prices.shape[0]
+    macd_line = np.empty(n)
+    macd_signal = np.empty(n)
+    macd_hist = np.empty(n)
+    if n == 0:
+        return macd_line, macd_signal, macd_hist
+
+    alpha_fast = 2.0 / (fast + 1.0)
+    alpha_slow = 2.0 / (slow + 1.0)
+    alpha_signal = 2.0 / (signal + 1.0)
+
+    ema_fast = prices[0]
+    ema_slow = prices[0]
+    wt_fast = 1.0
+    wt_slow = 1.0
+    wt_signal = 1.0
+    ema_signal = ema_fast - ema_slow
+    for i in range(n):
+        if i > 0:
+            ema_fast, wt_fast = _ewm_step(ema_fast, wt_fast, prices[i], alpha_fast)
+            ema_slow, wt_slow = _ewm_step(ema_slow, wt_slow, prices[i], alpha_slow)
+        m = ema_fast - ema_slow
+        if i > 0:
+            ema_signal, wt_signal = _ewm_step(ema_signal, wt_signal, m, alpha_signal)
+        macd_line[i] = m
+        macd_signal[i] = ema_signal
+        macd_hist[i] = m - ema_signal
+
+    return macd_line, macd_signal, macd_hist
+
+
+@njit(cache=True)
+def rolling_mean_std(values, period):
+    """
+    rolling(period).mean() and .std() from one pass.
+
+    Welford-style add/remove updates (O(1) per step) with sample std
+    (ddof=1), like pandas. NaN values are skipped and windows with fewer
+    than `period` valid values are NaN.
+
+    Returns:
+        Tuple of (mean, std) float64 arrays
+    """
+    n = values.shape[0]
+    means = np.full(n, np.nan)
+    stds = np.full(n, np.nan)
+
+    nobs = 0
+    mean = 0.0
+    ssqdm = 0.0
+    # Run of identical trailing values: the window is flat, std is exactly 0
+    prev = np.nan
+    same_count = 0
+    for i in range(n):
+        x = values[i]
+        if not np.isnan(x):
+            nobs += 1
+            delta = x - mean
+            mean += delta / nobs
+            ssqdm += (nobs - 1) * delta * delta / nobs
+            if x == prev:
+                same_count += 1
+            else:
+                same_count = 1
+            prev = x
+
+        if i >= period:
+            old = values[i - period]
+            if not np.isnan(old):
+                nobs -= 1
+                if nobs > 0:
+                    delta = old - mean
+                    mean -= delta / nobs
+                    ssqdm -= (nobs + 1) * delta * delta / nobs
+                else:
+                    mean = 0.0
+                    ssqdm = 0.0
+
+        # Re-anchor once per full window (amortized O(1)) so the add/remove
+        # updates do not drift over long histories
+        if i >= period - 1 and (i + 1) % period == 0 and nobs > 0:
+            total = 0.0
+            for j in range(i - period + 1, i + 1):
+                if not np.isnan(values[j]):
+                    total += values[j]
+            mean = total / nobs
+            ssqdm = 0.0
+            for j in range(i - period + 1, i + 1):
+                if not np.isnan(values[j]):
+                    ssqdm += (values[j] - mean) ** 2
+
+        if nobs < period or nobs < 2:
+            continue
+
+        if same_count >= nobs:
+            mean = prev
+            ssqdm = 0.0
+        means[i] = mean
+        stds[i] = np.sqrt(max(ssqdm / (nobs - 1), 0.0))
+
+    return means, stds
+
+
+@njit(cache=True, error_model='numpy')
+def rolling_corr(x, y, period):
+    """
+    x.rolling(period).corr(y) in one pass.
+
+    Running co-moments with Welford-style add/remove updates instead of
+    raw sums of x, y, x*x, y*y, x*y, which cancel badly at gold price and
+    volume magnitudes. Only pairs where both values are valid count, and
+    windows with fewer than `period` pairs are NaN. A flat window has no
+    correlation and gives NaN.
+    """
+    n = x.shape[0]
+    out = np.full(n, np.nan)
+
+    nobs = 0
+    mean_x = 0.0
+    mean_y = 0.0
+    sxx = 0.0
+    syy = 0.0
+    sxy = 0.0
+    # Runs of identical trailing x / y values: a flat window has no
+    # correlation even if re-anchoring leaves rounding residue in sxx/syy
+    prev_x = np.nan
+    prev_y = np.nan
+    same_x = 0
+    same_y = 0
+    for i in range(n):
+        xi = x[i]
+        yi = y[i]
+        if not (np.isnan(xi) or np.isnan(yi)):
+            nobs += 1
+            dx = xi - mean_x
+            dy = yi - mean_y
+            mean_x += dx / nobs
+            mean_y += dy / nobs
+            sxx += dx * (xi - mean_x)
+            syy += dy * (yi - mean_y)
+            sxy += dx * (yi - mean_y)
+            same_x = same_x + 1 if xi == prev_x else 1
+            same_y = same_y + 1 if yi == prev_y else 1
+            prev_x = xi
+            prev_y = yi
+
+        if i >= period:
+            xo = x[i - period]
+            yo = y[i - period]
+            if not (np.isnan(xo) or np.isnan(yo)):
+                nobs -= 1
+                if nobs > 0:
+                    dx = xo - mean_x
+                    dy = yo - mean_y
+                    mean_x -= dx / nobs
+                    mean_y -= dy / nobs
+                    sxx -= dx * (xo - mean_x)
+                    syy -= dy * (yo - mean_y)
+                    sxy -= dx * (yo - mean_y)
+                else:
+                    mean_x = 0.0
+                    mean_y = 0.0
+                    sxx = 0.0
+                    syy = 0.0
+                    sxy = 0.0
+
+        # Re-anchor once per full window, as in rolling_mean_std
+        if i >= period - 1 and (i + 1) % period == 0 and nobs > 0:
+            total_x = 0.0
+            total_y = 0.0
+            for j in range(i - period + 1, i + 1):
+                if not (np.isnan(x[j]) or np.isnan(y[j])):
+                    total_x += x[j]
+                    total_y += y[j]
+            mean_x = total_x / nobs
+            mean_y = total_y / nobs
+            sxx = 0.0
+            syy = 0.0
+            sxy = 0.0
+            for j in range(i - period + 1, i + 1):
+                if not (np.isnan(x[j]) or np.isnan(y[j])):
+                    dx = x[j] - mean_x
+                    dy = y[j] - mean_y
+                    sxx += dx * dx
+                    syy += dy * dy
+                    sxy += dx * dy
+
+        if nobs < period or nobs < 2 or sxx <= 0.0 or syy <= 0.0:
+            continue
+        if same_x >= nobs or same_y >= nobs:
+            continue
+
+        corr = sxy / np.sqrt(sxx * syy)
+        out[i] = min(1.0, max(-1.0, corr))
+
+    return out
+
+
+@njit(cache=True)
+def bollinger_bands(prices, period, num_std):
+    """
+    Bollinger Bands from one rolling mean/std pass (see rolling_mean_std).
+
+    Returns:
+        Tuple of (upper, middle, lower) float64 arrays
+    """
+    middle, std = rolling_mean_std(prices, period)
+    return middle + std * num_std, middle, middle - std * num_std
+
+
+@njit(cache=True)
+def rolling_max(values, period):
+    """rolling(period).max(); windows containing NaN are NaN."""
+    n = values.shape[0]
+    out = np.full(n, np.nan)
+    for i in range(period - 1, n):
+        best = values[i]
+        for j in range(i - period + 1, i):
+            if values[j] > best or np.isnan(values[j]):
+                best = values[j]
+                if np.isnan(best):
+                    break
+        out[i] = best
+    return out
+
+
+@njit(cache=True)
+def rolling_min(values, period):
+    """rolling(period).min(); windows containing NaN are NaN."""
+    n = values.shape[0]
+    out = np.full(n, np.nan)
+    for i in range(period - 1, n):
+        best = values[i]
+        for j in range(i - period + 1, i):
+            if values[j] < best or np.isnan(values[j]):
+                best = values[j]
+                if np.isnan(best):
+                    break
+        out[i] = best
+    return out
+
+
+@njit(cache=True, parallel=True, nogil=True, error_model='numpy')
+def lookback_block(close, periods):
+    """
+    Per-period SMA, EMA, close/SMA ratio, momentum and ROC in one block.
+
+    Periods are independent and run in parallel (prange). Division follows
+    NumPy semantics (x / 0 -> inf/NaN) like the pandas expressions.
+
+    Returns:
+        (n, 5 * len(periods)) float64 array; columns for each period are
+        [sma, ema, close_sma_ratio, momentum, roc], periods in input order
+    """
+    n = close.shape[0]
+    n_periods = periods.shape[0]
+    out = np.empty((n, 5 * n_periods))
+    for k in prange(n_periods):
+        period = periods[k]
+        col = 5 * k
+
+        sma = rolling_mean(close, period)
+        alpha = 2.0 / (period + 1.0)
+        ema = close[0] if n > 0 else 0.0
+        wt = 1.0
+        for i in range(n):
+            c = close[i]
+            if i > 0:
+                ema, wt = _ewm_step(ema, wt, c, alpha)
+            out[i, col] = sma[i]
+            out[i, col + 1] = ema
+            out[i, col + 2] = c / sma[i]
+            if i >= period:
+                prev = close[i - period]
+                out[i, col + 3] = c - prev
+                out[i, col + 4] = (c - prev) / prev * 100
+            else:
+                out[i, col + 3] = np.nan
+                out[i, col + 4] = np.nan
+
+    return out
+
+
+@njit(cache=True)
+def ema(values, span):
+    """pandas ewm(span=span, adjust=False).mean() as a single recurrence."""
+    n = values.shape[0]
+    out = np.empty(n)
+    if n == 0:
+        return out
+
+    alpha = 2.0 / (span + 1.0)
+    weighted = values[0]
+    wt = 1.0
+    out[0] = weighted
+    for i in range(1, n):
+        weighted, wt = _ewm_step(weighted, wt, values[i], alpha)
+        out[i] = weighted
+
+    return out
+
+
+@njit(cache=True)
+def candle_patterns(opens, highs, lows, closes):
+    """
+    Candle shape features and pattern flags in one pass.
+
+    Returns:
+        Tuple of
+        - (n, 4) float64 array: [body, upper_shadow, lower_shadow, body_ratio]
+        - (n, 5) int8 array: [is_bullish, is_doji, is_hammer,
+          bullish_engulfing, bearish_engulfing]
+    """
+    n = closes.shape[0]
+    shapes = np.empty((n, 4))
+    flags = np.zeros((n, 5), dtype=np.int8)
+    for i in range(n):
+        o = opens[i]
+        h = highs[i]
+        l = lows[i]
+        c = closes[i]
+        body = abs(c - o)
+        upper_shadow = h - max(c, o)
+        lower_shadow = min(c, o) - l
+        shapes[i, 0] = body
+        shapes[i, 1] = upper_shadow
+        shapes[i, 2] = lower_shadow
+        shapes[i, 3] = body / (h - l + 1e-10)
+
+        bullish = c > o
+        flags[i, 0] = bullish
+        flags[i, 1] = body < (h - l) * 0.1
+        flags[i, 2] = lower_shadow > body * 2 and upper_shadow < body * 0.5
+        if i > 0:
+            prev_open = opens[i - 1]
+            prev_close = closes[i - 1]
+            prev_bullish = prev_close > prev_open
+            flags[i, 3] = bullish and not prev_bullish and o < prev_close and c > prev_open
+            flags[i, 4] = not bullish and prev_bullish and o > prev_close and c < prev_open
+
+    return shapes, flags
+
+
+@njit(cache=True, error_model='numpy')
+def volume_flows(highs, lows, closes, volumes):
+    """
+    Cumulative volume indicators in one pass.
+
+    - vpt: cumulative pct_change(close) * volume (NaN terms are skipped and
+      left NaN, like pandas cumsum)
+    - obv: cumulative +volume / -volume on up / down closes
+    - clv: close location value, ((c - l) - (h - c)) / (h - l + 1e-10)
+    - ad_line: cumulative clv * volume
+
+    Returns:
+        Tuple of (vpt, obv, clv, ad_line) float64 arrays
+    """
+    n = closes.shape[0]
+    vpt = np.empty(n)
+    obv = np.empty(n)
+    clv = np.empty(n)
+    ad_line = np.empty(n)
+
+    vpt_sum = 0.0
+    obv_sum = 0.0
+    ad_sum = 0.0
+    for i in range(n):
+        c = closes[i]
+        v = volumes[i]
+
+        if i > 0:
+            term = (c / closes[i - 1] - 1.0) * v
+            if np.isnan(term):
+                vpt[i] = np.nan
+            else:
+                vpt_sum += term
+                vpt[i] = vpt_sum
+
+            price_change = c - closes[i - 1]
+            if price_change > 0:
+                obv_sum += v
+            elif price_change < 0:
+                obv_sum -= v
+        else:
+            vpt[i] = np.nan
+        obv[i] = obv_sum
+
+        h = highs[i]
+        l = lows[i]
+        clv_i = ((c - l) - (h - c)) / (h - l + 1e-10)
+        clv[i] = clv_i
+        ad_sum += clv_i * v
+        ad_line[i] = ad_sum
+
+    return vpt, obv, clv, ad_line
+
+
+@njit(cache=True, parallel=True, nogil=True, error_model='numpy')
+def statistical_block(highs, lows, closes, periods):
+    """
+    Per-period volatility, high-low range and returns in one block.
+
+    Periods are independent and run in parallel (prange).
+
+    Returns:
+        (n, 3 * len(periods)) float64 array; columns for each period are
+        [volatility (rolling std), high_low_range, returns (pct_change)]
+    """
+    n = closes.shape[0]
+    n_periods = periods.shape[0]
+    out = np.empty((n, 3 * n_periods))
+    for k in prange(n_periods):
+        period = periods[k]
+        col = 3 * k
+
+        _, volatility = rolling_mean_std(closes, period)
+        highest = rolling_max(highs, period)
+        lowest = rolling_min(lows, period)
+        for i in range(n):
+            c = closes[i]
+            out[i, col] = volatility[i]
+            out[i, col + 1] = (highest[i] - lowest[i]) / c
+            out[i, col + 2] = c / closes[i - period] - 1.0 if i >= period else np.nan
+
+    return out
+
+
+@njit(cache=True, parallel=True, nogil=True)
+def money_flow_index(positive_mf, negative_mf, periods):
+    """
+    MFI for several periods from positive/negative money flow.
+
+    Periods run in parallel (prange).
+
+    Returns:
+        (n, len(periods)) float64 array, one MFI column per period
+    """
+    n = positive_mf.shape[0]
+    n_periods = periods.shape[0]
+    out = np.empty((n, n_periods))
+    for k in prange(n_periods):
+        positive_sum = rolling_sum(positive_mf, periods[k])
+        negative_sum = rolling_sum(negative_mf, periods[k])
+        for i in range(n):
+            money_ratio = positive_sum[i] / (negative_sum[i] + 1e-10)
+            out[i, k] = 100 - (100 / (1 + money_ratio))
+
+    return out
+
+
+@njit(cache=True, parallel=True, nogil=True)
+def ffill_fill0(values):
+    """
+    In place: forward-fill NaN down each column, 0 where no earlier value.
+
+    Same result as DataFrame.ffill().fillna(0) in one pass; columns run in
+    parallel (prange). Best with a Fortran-ordered (column-major) array.
+    """
+    n, m = values.shape
+    for j in prange(m):
+        last = 0.0
+        for i in range(n):
+            if np.isnan(values[i, j]):
+                values[i, j] = last
+            else:
+                last = values[i, j]
+
+
+@njit(cache=True, nogil=True)
+def greedy_decorrelate(above_bits):
+    """
+    Greedy pruning of correlated features on a packed bitmap.
+
+    Walks the columns in order and keeps a column only if it is not above
+    the correlation threshold with any column kept so far; columns that were
+    already dropped are not compared against. Row j of `above_bits` has bit
+    i set (word i // 64, bit i % 64) when |corr(i, j)| > threshold, and the
+    kept set is the same kind of bitmap, so each test is F / 64 word ANDs.
+
+    Args:
+        above_bits: (F, ceil(F / 64)) uint64 bitmap rows
+
+    Returns:
+        int64 array of kept column indices (ascending)
+    """
+    n_features, n_words = above_bits.shape
+    kept_bits = np.zeros(n_words, dtype=np.uint64)
+    kept = np.empty(n_features, dtype=np.int64)
+    n_kept = 0
+    one = np.uint64(1)
+    for j in range(n_features):
+        redundant = False
+        for w in range(n_words):
+            if above_bits[j, w] & kept_bits[w]:
+                redundant = True
+                break
+        if not redundant:
+            kept[n_kept] = j
+            n_kept += 1
+            kept_bits[j >> 6] |= one << np.uint64(j & 63)
+    return kept[:n_kept]
+
+
+@njit(cache=True, error_model='numpy')
+def signal_postprocess(adx, sma_fast, sma_slow, atr, close, prob_up, prob_down):
+    """
+    Continuous signals of MLAgent.analyze() from the last-row indicators.
+
+    A missing indicator is passed as NaN (engineered features are already
+    forward-filled, so a real value is never NaN). Caps follow Python's
+    min(x, 1.0), i.e. NaN propagates instead of becoming 1.0.
+
+    Args:
+        adx: ADX(14) or NaN
+        sma_fast, sma_slow: SMA(20) and SMA(50) or NaN
+        atr: ATR(14) or NaN
+        close: last close price
+        prob_up, prob_down: model probabilities
+
+    Returns:
+        (trend_strength, volatility, momentum)
+    """
+    if not np.isnan(adx):
+        trend_strength = adx / 100.0
+    elif not np.isnan(sma_fast) and not np.isnan(sma_slow):
+        trend_strength = abs(sma_fast - sma_slow) / ((sma_fast + sma_slow) / 2)
+    else:
+        trend_strength = 0.5
+    if 1.0 < trend_strength:
+        trend_strength = 1.0
+
+    if not np.isnan(atr):
+        volatility = atr / close * 10
+        if 1.0 < volatility:
+            volatility = 1.0
+    else:
+        volatility = 0.5
+
+    momentum = (prob_up - prob_down) * trend_strength
+    return trend_strength, volatility, momentum
+
+
+@njit(cache=True, parallel=True, nogil=True)
+def soft_vote(up_probas):
+    """
+    Soft-voting labels of EnsembleModel in one fused pass.
+
+    Same arithmetic as averaging with np.add then dividing by the number
+    of models (sum in model order, then / K), so the label always agrees
+    with predict_proba()[:, 1] >= 0.5.
+
+    Args:
+        up_probas: (n_models, n) float64 array of P(UP) per model
+
+    Returns:
+        int8 array of labels (1 = UP)
+    """
+    n_models, n = up_probas.shape
+    out = np.empty(n, dtype=np.int8)
+    for i in prange(n):
+        s = up_probas[0, i]
+        for k in range(1, n_models):
+            s += up_probas[k, i]
+        out[i] = 1 if s / n_models >= 0.5 else 0
+    return out
@@ -0,0 +1,108 @@
+"""
+Optional ONNX Runtime inference برای tree ensemble ها.
+
+جایگزین Treelite (agents/ml/_treelite.py): RandomForest با skl2onnx و XGBoost
+با onnxmltools به ONNX تبدیل می‌شوند و با ONNX Runtime (C++) اجرا می‌شوند؛
+هم برای predict تک‌سطری analyze() و هم batch های backtest.
+
+اگر skl2onnx/onnxmltools/onnxruntime نصب نباشند یا model پشتیبانی نشود،
+build_predictor مقدار None برمی‌گرداند و caller از predict_proba معمولی
+استفاده می‌کند.
+"""
+
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+
+from agents.ml.models import MLModel, RandomForestModel, HistRandomForestModel, XGBoostModel, EnsembleModel
+
+try:
+    import onnxruntime as ort
+    from skl2onnx import convert_sklearn
+    from skl2onnx.common.data_types import FloatTensorType
+    ONNX_AVAILABLE = True
+except ImportError:  # pragma: no cover - depends on environment
+    ort = None
+    ONNX_AVAILABLE = False
+
+try:
+    import onnxmltools
+except ImportError:  # pragma: no cover - depends on environment
+    onnxmltools = None
+
+
+class OnnxPredictor:
+    """
+    Soft-voting predictor روی session های ONNX Runtime
+
+    خروجی predict_proba همان [P(DOWN), P(UP)] در EnsembleModel است
+    (میانگین احتمال‌های model ها).
+    """
+
+    def __init__(self, model_paths: List[Path]):
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = 1
+        self._sessions = [
+            ort.InferenceSession(str(path), options, providers=['CPUExecutionProvider'])
+            for path in model_paths
+        ]
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        # خروجی دوم هر model (بعد از label) احتمال‌های (n, 2) است
+        proba = np.asarray(self._sessions[0].run(None, {'input': X})[1], dtype=np.float64)
+        for session in self._sessions[1:]:
+            proba += session.run(None, {'input': X})[1]
+        return proba / len(self._sessions)
+
+
+def _to_onnx(model: MLModel, n_features: int):
+    """تبدیل یک model درختی به ONNX (None اگر پشتیبانی نشود)"""
+    initial_types = [('input', FloatTensorType([None, n_features]))]
+    if isinstance(model, (RandomForestModel, HistRandomForestModel)):
+        # zipmap=False: احتمال‌ها به صورت tensor (n, 2) به جای لیست dict
+        return convert_sklearn(
+            model.model,
+            initial_types=initial_types,
+            options={id(model.model): {'zipmap': False}}
+        )
+    if isinstance(model, XGBoostModel) and onnxmltools is not None:
+        return onnxmltools.convert_xgboost(model.model, initial_types=initial_types)
+    return None
+
+
+def build_predictor(model: MLModel, n_features: int, model_dir: Path) -> Optional[OnnxPredictor]:
+    """
+    Export model (RandomForest/HistGradientBoosting/XGBoost/Ensemble آن‌ها) به ONNX و ساخت OnnxPredictor
+
+    Args:
+        model: model آموزش‌دیده
+        n_features: تعداد ستون‌های ورودی
+        model_dir: پوشه فایل‌های .onnx
+
+    Returns:
+        OnnxPredictor یا None اگر وابستگی‌ها نصب نباشند یا model پشتیبانی نشود
+    """
+    if not ONNX_AVAILABLE or not model.is_trained:
+        return None
+
+    members: List[MLModel] = model.models if isinstance(model, EnsembleModel) else [model]
+    if not members:
+        return None
+
+    onnx_models = [_to_onnx(m, n_features) for m in members]
+    if any(m is None for m in onnx_models):
+        return None
+
+    model_dir.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for i, onnx_model in enumerate(onnx_models):
+        path = model_dir / f"model_{i}.onnx"
+        path.write_bytes(onnx_model.SerializeToString())
+        paths.append(path)
+
+    return OnnxPredictor(paths)
+
+
+__all__ = ["OnnxPredictor", "build_predictor", "ONNX_AVAILABLE"]
@@ -0,0 +1,128 @@
+"""
+Optional Treelite inference برای tree ensemble ها.
+
+analyze() در هر tick فقط یک row را predict می‌کند؛ در این حالت هزینه اصلی
+overhead پایتون و ساخت DMatrix در XGBoost/sklearn است، نه پیمایش درخت‌ها.
+اگر treelite نصب باشد، RandomForest و XGBoost به یک model Treelite تبدیل
+می‌شوند و (اگر tl2cgen هم باشد) به shared library کامپایل می‌شوند.
+
+اگر treelite نصب نباشد یا model پشتیبانی نشود، build_predictor مقدار None
+برمی‌گرداند و caller باید از predict_proba معمولی استفاده کند.
+"""
+
+import os
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+
+from agents.ml.models import MLModel, RandomForestModel, XGBoostModel, EnsembleModel
+
+try:
+    import treelite
+    import treelite.gtil
+    import treelite.sklearn
+    TREELITE_AVAILABLE = True
+except ImportError:  # pragma: no cover - depends on environment
+    treelite = None
+    TREELITE_AVAILABLE = False
+
+try:
+    import tl2cgen
+except ImportError:  # pragma: no cover - depends on environment
+    tl2cgen = None
+
+
+class TreelitePredictor:
+    """
+    Soft-voting predictor روی model های Treelite
+
+    خروجی predict_proba همان [P(DOWN), P(UP)] در EnsembleModel است
+    (میانگین احتمال‌های model ها).
+    """
+
+    def __init__(self, tl_models: list, libdir: Optional[Path] = None):
+        self._predict_fns = []
+
+        for i, tl_model in enumerate(tl_models):
+            if tl2cgen is not None and libdir is not None:
+                libdir.mkdir(parents=True, exist_ok=True)
+                libpath = libdir / f"model_{i}.so"
+                if not libpath.exists():
+                    # libdir بر اساس محتوای model است، پس library موجود همین model است؛
+                    # build در فایل موقت و بعد rename تا .so ای که قبلاً dlopen شده
+                    # هیچ‌وقت بازنویسی نشود
+                    tmp_path = libdir / f".model_{i}.{os.getpid()}.so"
+                    tl2cgen.export_lib(
+                        tl_model,
+                        toolchain='gcc',
+                        libpath=str(tmp_path),
+                        params={'parallel_comp': 8}
+                    )
+                    os.replace(tmp_path, libpath)
+                predictor = tl2cgen.Predictor(str(libpath), nthread=1)
+                self._predict_fns.append(
+                    lambda X, p=predictor: p.predict(tl2cgen.DMatrix(X))
+                )
+            else:
+                # بدون compiler: GTIL هم بدون DMatrix/validation پایتون اجرا می‌شود
+                self._predict_fns.append(
+                    lambda X, m=tl_model: treelite.gtil.predict(m, X, nthread=1)
+                )
+
+    @staticmethod
+    def _to_binary_proba(raw: np.ndarray) -> np.ndarray:
+        """خروجی Treelite → آرایه (n, 2)"""
+        raw = np.asarray(raw, dtype=np.float64).reshape(raw.shape[0], -1)
+        if raw.shape[1] == 1:
+            # binary:logistic فقط P(UP) را برمی‌گرداند
+            return np.column_stack([1.0 - raw[:, 0], raw[:, 0]])
+        return raw[:, :2]
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        proba = self._to_binary_proba(self._predict_fns[0](X))
+        for fn in self._predict_fns[1:]:
+            proba += self._to_binary_proba(fn(X))
+        return proba / len(self._predict_fns)
+
+
+def _to_treelite(model: MLModel):
+    """تبدیل یک model درختی به Treelite (None اگر پشتیبانی نشود)"""
+    if isinstance(model, RandomForestModel):
+        return treelite.sklearn.import_model(model.model)
+    if isinstance(model, XGBoostModel):
+        booster = model.model.get_booster()
+        if hasattr(treelite, 'frontend'):
+            return treelite.frontend.from_xgboost(booster)
+        return treelite.Model.from_xgboost(booster)
+    return None
+
+
+def build_predictor(model: MLModel, libdir: Optional[Path] = None) -> Optional[TreelitePredictor]:
+    """
+    ساخت TreelitePredictor برای model (RandomForest/XGBoost/Ensemble آن‌ها)
+
+    Args:
+        model: model آموزش‌دیده
+        libdir: پوشه shared library ها (فقط وقتی tl2cgen نصب باشد)؛ باید مخصوص
+            همین model باشد چون library های موجود در آن دوباره استفاده می‌شوند
+
+    Returns:
+        TreelitePredictor یا None اگر treelite نصب نباشد یا model پشتیبانی نشود
+    """
+    if not TREELITE_AVAILABLE or not model.is_trained:
+        return None
+
+    members: List[MLModel] = model.models if isinstance(model, EnsembleModel) else [model]
+    if not members:
+        return None
+
+    tl_models = [_to_treelite(m) for m in members]
+    if any(m is None for m in tl_models):
+        return None
+
+    return TreelitePredictor(tl_models, libdir)
+
+
+__all__ = ["TreelitePredictor", "build_predictor", "TREELITE_AVAILABLE"]
@@ -3,13 +3,84 @@ Feature Engineering for ML models
 استخراج ویژگی‌های تکنیکال برای مدل‌های ML
 """
 
-from typing import List, Dict
+from typing import Callable, List, Dict, Optional, Tuple
+from functools import lru_cache
 import numpy as np
 import pandas as pd
 from datetime import datetime
 
+from agents.ml._kernels import (
+    rsi_sma, macd as macd_kernel, bollinger_bands, lookback_block, rolling_mean, ema,
+    candle_patterns, volume_flows, statistical_block, money_flow_index, rolling_mean_std,
+    rolling_corr, ffill_fill0
+)
 from data_layer.models import OHLCV, MarketData
 
+try:
+    import bottleneck as bn
+except ImportError:  # pragma: no cover - optional dependency
+    bn = None
+
+
+_HOUR_NS = 3_600_000_000_000
+
+# sin/cos ساعت روز (0..23) - یک بار محاسبه، سپس فقط index گرفتن برای هر row
+_HOUR_SIN = np.sin(2 * np.pi * np.arange(24) / 24)
+_HOUR_COS = np.cos(2 * np.pi * np.arange(24) / 24)
+
+# ستون‌های target (بقیه ستون‌ها feature هستند)
+_TARGET_COLUMNS = frozenset({'target', 'target_return', 'future_close'})
+
+
+# الگوی نام ستون‌های خروجی kernel های چند-دوره‌ای (به ترتیب ستون‌ها برای هر دوره)
+_LOOKBACK_COLUMNS = ('sma_{}', 'ema_{}', 'close_sma_{}_ratio', 'momentum_{}', 'roc_{}')
+_STATISTICAL_COLUMNS = ('volatility_{}', 'high_low_range_{}', 'returns_{}')
+_MFI_COLUMNS = ('mfi_{}',)
+
+
+@lru_cache(maxsize=None)
+def _block_layout(periods: Tuple[int, ...], templates: Tuple[str, ...]) -> Tuple[np.ndarray, Tuple[str, ...]]:
+    """
+    ورودی و نام ستون‌های یک kernel چند-دوره‌ای، یک بار برای هر پیکربندی
+    
+    Returns:
+        (آرایه int64 دوره‌ها برای kernel، نام ستون‌ها به ترتیب خروجی kernel)
+    """
+    names = tuple(template.format(period) for period in periods for template in templates)
+    return np.asarray(periods, dtype=np.int64), names
+
+
+def _roll_mean(values: np.ndarray, period: int) -> np.ndarray:
+    """rolling(period).mean() روی آرایه: bottleneck اگر نصب باشد، وگرنه kernel"""
+    if bn is not None:
+        return bn.move_mean(values, period, min_count=period)
+    return rolling_mean(values, period)
+
+
+def _roll_std(values: np.ndarray, period: int) -> np.ndarray:
+    """rolling(period).std() (ddof=1) روی آرایه: bottleneck اگر نصب باشد، وگرنه kernel"""
+    if bn is not None:
+        return bn.move_std(values, period, min_count=period, ddof=1)
+    return rolling_mean_std(values, period)[1]
+
+
+def _shift(values: np.ndarray, period: int) -> np.ndarray:
+    """
+    Series.shift(period) روی آرایه float64 (period منفی = مقدار آینده)
+    
+    یک np.empty و یک کپی، بدون ساخت Series و index جدید
+    """
+    shifted = np.empty(len(values), dtype=np.float64)
+    if period >= 0:
+        period = min(period, len(values))
+        shifted[:period] = np.nan
+        shifted[period:] = values[:len(values) - period]
+    else:
+        period = min(-period, len(values))
+        shifted[len(values) - period:] = np.nan
+        shifted[:len(values) - period] = values[period:]
+    return shifted
+
 
 class FeatureEngineer:
     """
@@ -26,17 +97,23 @@ class FeatureEngineer:
         self,
         lookback_periods: List[int] = [5, 10, 20, 50],
         include_time_features: bool = True,
-        include_price_patterns: bool = True
+        include_price_patterns: bool = True,
+        feature_dtype: Optional[type] = np.float32
     ):
         """
         Args:
             lookback_periods: دوره‌های مختلف برای محاسبه indicators
             include_time_features: شامل کردن features زمانی
             include_price_patterns: شامل کردن الگوهای قیمتی
+            feature_dtype: dtype ستون‌های float در خروجی (None = float64)؛
+                محاسبات همیشه float64 هستند و ستون‌های target تغییر نمی‌کنند
         """
         self.lookback_periods = lookback_periods
         self.include_time_features = include_time_features
         self.include_price_patterns = include_price_patterns
+        self.feature_dtype = feature_dtype
+        self._pipeline_key = None
+        self._pipeline_stages = ()
     
     def extract_features(self, market_data: MarketData) -> pd.DataFrame:
         """
@@ -47,325 +124,461 @@ class FeatureEngineer:
         """
         df = self._market_data_to_df(market_data)
         
-        # Technical indicators
-        df = self._add_technical_indicators(df)
-        
-        # Price patterns
-        if self.include_price_patterns:
-            df = self._add_price_patterns(df)
-        
-        # Microstructure features
-        df = self._add_microstructure_features(df)
-        
-        # Multi-timeframe features
-        df = self._add_multi_timeframe_features(df)
-        
-        # Statistical features
-        df = self._add_statistical_features(df)
-        
-        # Time features
-        if self.include_time_features:
-            df = self._add_time_features(df)
-        
-        # Target variable (آینده قیمت - برای classification)
-        df = self._add_target(df)
+        for stage in self._pipeline():
+            df = stage(df)
         
         # حذف NaN ها - فقط rows که target نداشته باشند یا خیلی NaN داشته باشند
         # Keep rows with at least 50% valid data
         threshold = len(df.columns) * 0.5
         df = df.dropna(thresh=threshold)
         
-        # Fill remaining NaN با forward fill سپس 0
-        df = df.ffill().fillna(0)
+        # Fill remaining NaN با forward fill سپس 0 (فقط ستون‌های float می‌توانند NaN داشته باشند)
+        df = self._ffill_fill0(df)
+        
+        # Features با دقت کمتر (نصف حافظه برای مدل‌ها؛ XGBoost و درخت‌های sklearn
+        # در هر صورت با float32 کار می‌کنند)
+        if self.feature_dtype is not None:
+            df = df.astype({
+                col: self.feature_dtype
+                for col, dtype in df.dtypes.items()
+                if dtype == np.float64 and col not in _TARGET_COLUMNS
+            })
         
         return df
     
+    @staticmethod
+    def _ffill_fill0(df: pd.DataFrame) -> pd.DataFrame:
+        """معادل df.ffill().fillna(0) با یک پیمایش kernel روی ستون‌های float64"""
+        float_columns = [col for col, dtype in df.dtypes.items() if dtype == np.float64]
+        if not float_columns:
+            return df
+        
+        # کپی ستونی (column-major) - kernel روی آن in-place کار می‌کند
+        values = np.array(df[float_columns], dtype=np.float64, order='F')
+        ffill_fill0(values)
+        
+        filled = pd.DataFrame(values, index=df.index, columns=float_columns)
+        others = df.drop(columns=float_columns)
+        return pd.concat([filled, others], axis=1)[df.columns]
+    
+    def _pipeline(self) -> Tuple[Callable[[pd.DataFrame], pd.DataFrame], ...]:
+        """
+        مراحل ساخت features برای پیکربندی فعلی
+        
+        فقط وقتی lookback_periods یا include_* تغییر کنند دوباره ساخته می‌شود
+        """
+        key = (tuple(self.lookback_periods), self.include_time_features, self.include_price_patterns)
+        if key != self._pipeline_key:
+            # Technical indicators
+            stages = [self._add_technical_indicators]
+            
+            # Price patterns
+            if self.include_price_patterns:
+                stages.append(self._add_price_patterns)
+            
+            # Microstructure, Multi-timeframe, Statistical features
+            stages += [
+                self._add_microstructure_features,
+                self._add_multi_timeframe_features,
+                self._add_statistical_features
+            ]
+            
+            # Time features
+            if self.include_time_features:
+                stages.append(self._add_time_features)
+            
+            # Target variable (آینده قیمت - برای classification)
+            stages.append(self._add_target)
+            
+            self._pipeline_stages = tuple(stages)
+            self._pipeline_key = key
+        return self._pipeline_stages
+    
     def _market_data_to_df(self, market_data: MarketData) -> pd.DataFrame:
-        """تبدیل MarketData به DataFrame"""
-        data = {
-            'datetime': [bar.datetime for bar in market_data.data],
-            'open': [bar.open for bar in market_data.data],
-            'high': [bar.high for bar in market_data.data],
-            'low': [bar.low for bar in market_data.data],
-            'close': [bar.close for bar in market_data.data],
-            'volume': [bar.volume if bar.volume else 0 for bar in market_data.data]
-        }
-        df = pd.DataFrame(data)
-        df.set_index('datetime', inplace=True)
-        return df
+        """تبدیل MarketData به DataFrame (از آرایه‌های ستونی cache شده در MarketData)"""
+        arrays = market_data.to_arrays()
+        return pd.DataFrame(
+            {
+                'open': arrays['open'],
+                'high': arrays['high'],
+                'low': arrays['low'],
+                'close': arrays['close'],
+                'volume': arrays['volume']
+            },
+            index=pd.DatetimeIndex(arrays['datetime'], name='datetime')
+        )
     
     def _add_technical_indicators(self, df: pd.DataFrame) -> pd.DataFrame:
         """اضافه کردن indicators تکنیکال"""
         
-        for period in self.lookback_periods:
-            # Moving Averages
-            df[f'sma_{period}'] = df['close'].rolling(window=period).mean()
-            df[f'ema_{period}'] = df['close'].ewm(span=period, adjust=False).mean()
-            
-            # Price relative to MA
-            df[f'close_sma_{period}_ratio'] = df['close'] / df[f'sma_{period}']
-            
-            # Momentum
-            df[f'momentum_{period}'] = df['close'] - df['close'].shift(period)
-            df[f'roc_{period}'] = (df['close'] - df['close'].shift(period)) / df['close'].shift(period) * 100
+        close = df['close']
+        
+        # Moving Averages, price relative to MA, Momentum - همه دوره‌ها در یک kernel
+        periods, names = _block_layout(tuple(self.lookback_periods), _LOOKBACK_COLUMNS)
+        block = lookback_block(close.to_numpy(dtype=np.float64), periods)
+        columns = dict(zip(names, block.T))
         
         # RSI
-        df['rsi_14'] = self._calculate_rsi(df['close'], 14)
-        df['rsi_7'] = self._calculate_rsi(df['close'], 7)
-        df['rsi_21'] = self._calculate_rsi(df['close'], 21)
+        columns['rsi_14'] = self._calculate_rsi(close, 14)
+        columns['rsi_7'] = self._calculate_rsi(close, 7)
+        columns['rsi_21'] = self._calculate_rsi(close, 21)
         
         # MACD
-        df['macd'], df['macd_signal'], df['macd_hist'] = self._calculate_macd(df['close'])
+        columns['macd'], columns['macd_signal'], columns['macd_hist'] = self._calculate_macd(close)
         
         # Bollinger Bands
-        df['bb_upper'], df['bb_middle'], df['bb_lower'] = self._calculate_bollinger_bands(df['close'], 20, 2)
-        df['bb_width'] = (df['bb_upper'] - df['bb_lower']) / df['bb_middle']
-        df['bb_position'] = (df['close'] - df['bb_lower']) / (df['bb_upper'] - df['bb_lower'])
+        bb_upper, bb_middle, bb_lower = self._calculate_bollinger_bands(close, 20, 2)
+        columns['bb_upper'] = bb_upper
+        columns['bb_middle'] = bb_middle
+        columns['bb_lower'] = bb_lower
+        columns['bb_width'] = (bb_upper - bb_lower) / bb_middle
+        columns['bb_position'] = (close - bb_lower) / (bb_upper - bb_lower)
         
         # ATR (Average True Range)
-        df['atr_14'] = self._calculate_atr(df, 14)
-        df['atr_7'] = self._calculate_atr(df, 7)
+        columns['atr_14'] = self._calculate_atr(df, 14)
+        columns['atr_7'] = self._calculate_atr(df, 7)
         
         # Volume indicators
-        df['volume_sma_20'] = df['volume'].rolling(window=20).mean()
-        df['volume_ratio'] = df['volume'] / df['volume_sma_20']
+        volume_sma_20 = _roll_mean(df['volume'].to_numpy(dtype=np.float64), 20)
+        columns['volume_sma_20'] = volume_sma_20
+        columns['volume_ratio'] = df['volume'] / volume_sma_20
         
-        return df
+        return self._append_columns(df, columns)
     
     def _add_price_patterns(self, df: pd.DataFrame) -> pd.DataFrame:
         """اضافه کردن الگوهای قیمتی"""
         
-        # Candle body and shadows
-        df['body'] = abs(df['close'] - df['open'])
-        df['upper_shadow'] = df['high'] - df[['close', 'open']].max(axis=1)
-        df['lower_shadow'] = df[['close', 'open']].min(axis=1) - df['low']
-        df['body_ratio'] = df['body'] / (df['high'] - df['low'] + 1e-10)
-        
-        # Bullish/Bearish
-        df['is_bullish'] = (df['close'] > df['open']).astype(int)
-        
-        # Doji pattern
-        df['is_doji'] = (df['body'] < (df['high'] - df['low']) * 0.1).astype(int)
-        
-        # Hammer/Hanging Man pattern
-        df['is_hammer'] = (
-            (df['lower_shadow'] > df['body'] * 2) & 
-            (df['upper_shadow'] < df['body'] * 0.5)
-        ).astype(int)
-        
-        # Engulfing patterns
-        df['bullish_engulfing'] = (
-            (df['is_bullish'] == 1) &
-            (df['is_bullish'].shift(1) == 0) &
-            (df['open'] < df['close'].shift(1)) &
-            (df['close'] > df['open'].shift(1))
-        ).astype(int)
-        
-        df['bearish_engulfing'] = (
-            (df['is_bullish'] == 0) &
-            (df['is_bullish'].shift(1) == 1) &
-            (df['open'] > df['close'].shift(1)) &
-            (df['close'] < df['open'].shift(1))
-        ).astype(int)
-        
-        return df
+        # Candle body and shadows + Bullish/Bearish, Doji, Hammer, Engulfing
+        # (یک پیمایش؛ flag ها به صورت int8)
+        shapes, flags = candle_patterns(
+            df['open'].to_numpy(dtype=np.float64),
+            df['high'].to_numpy(dtype=np.float64),
+            df['low'].to_numpy(dtype=np.float64),
+            df['close'].to_numpy(dtype=np.float64)
+        )
+        columns = {
+            'body': shapes[:, 0],
+            'upper_shadow': shapes[:, 1],
+            'lower_shadow': shapes[:, 2],
+            'body_ratio': shapes[:, 3],
+            'is_bullish': flags[:, 0],
+            'is_doji': flags[:, 1],
+            'is_hammer': flags[:, 2],
+            'bullish_engulfing': flags[:, 3],
+            'bearish_engulfing': flags[:, 4]
+        }
+        return self._append_columns(df, columns)
     
     def _add_microstructure_features(self, df: pd.DataFrame) -> pd.DataFrame:
         """اضافه کردن ویژگی‌های ریزساختار بازار"""
         
+        high = df['high']
+        low = df['low']
+        close = df['close']
+        volume = df['volume']
+        columns = {}
+        
         # Typical Price (HLC3)
-        df['hlc3'] = (df['high'] + df['low'] + df['close']) / 3
-        df['typical_price'] = df['hlc3']
+        typical_price = (high + low + close) / 3
+        columns['hlc3'] = typical_price
+        columns['typical_price'] = typical_price
         
         # Money Flow Index (MFI)
-        df['money_flow'] = df['typical_price'] * df['volume']
-        df['positive_mf'] = np.where(df['typical_price'] > df['typical_price'].shift(1), 
-                                    df['money_flow'], 0)
-        df['negative_mf'] = np.where(df['typical_price'] < df['typical_price'].shift(1), 
-                                    df['money_flow'], 0)
-        
-        for period in [14, 21]:
-            positive_sum = df['positive_mf'].rolling(period).sum()
-            negative_sum = df['negative_mf'].rolling(period).sum()
-            money_ratio = positive_sum / (negative_sum + 1e-10)  # جلوگیری از تقسیم بر صفر
-            df[f'mfi_{period}'] = 100 - (100 / (1 + money_ratio))
+        money_flow = typical_price * volume
+        prev_typical_price = typical_price.shift(1)
+        positive_mf = pd.Series(np.where(typical_price > prev_typical_price, money_flow, 0), index=df.index)
+        negative_mf = pd.Series(np.where(typical_price < prev_typical_price, money_flow, 0), index=df.index)
+        columns['money_flow'] = money_flow
+        columns['positive_mf'] = positive_mf
+        columns['negative_mf'] = negative_mf
+        
+        # +1e-10 در مخرج برای جلوگیری از تقسیم بر صفر (داخل kernel)
+        periods, names = _block_layout((14, 21), _MFI_COLUMNS)
+        mfi = money_flow_index(
+            positive_mf.to_numpy(dtype=np.float64),
+            negative_mf.to_numpy(dtype=np.float64),
+            periods
+        )
+        columns.update(zip(names, mfi.T))
+        
+        close_np = close.to_numpy(dtype=np.float64)
+        volume_np = volume.to_numpy(dtype=np.float64)
         
         # Price-Volume Divergence
-        df['pv_trend'] = df['close'].rolling(10).apply(
-            lambda x: 1 if x.iloc[-1] > x.iloc[0] else -1, raw=False
-        )
-        df['volume_trend'] = df['volume'].rolling(10).apply(
-            lambda x: 1 if x.iloc[-1] > x.iloc[0] else -1, raw=False
+        pv_trend = self._window_trend(close_np, 10)
+        volume_trend = self._window_trend(volume_np, 10)
+        columns['pv_trend'] = pv_trend
+        columns['volume_trend'] = volume_trend
+        columns['pv_divergence'] = (pv_trend != volume_trend).astype(int)
+        
+        # VPT, OBV و A/D - هر سه جمع تجمعی در یک پیمایش
+        vpt, obv, clv, ad_line = (
+            pd.Series(values, index=df.index)
+            for values in volume_flows(
+                high.to_numpy(dtype=np.float64),
+                low.to_numpy(dtype=np.float64),
+                close_np,
+                volume_np
+            )
         )
-        df['pv_divergence'] = (df['pv_trend'] != df['volume_trend']).astype(int)
         
         # Volume Price Trend (VPT)
-        df['vpt'] = (df['close'].pct_change() * df['volume']).cumsum()
-        df['vpt_sma_10'] = df['vpt'].rolling(10).mean()
-        df['vpt_signal'] = np.where(df['vpt'] > df['vpt_sma_10'], 1, -1)
+        vpt_sma_10 = _roll_mean(vpt.to_numpy(), 10)
+        columns['vpt'] = vpt
+        columns['vpt_sma_10'] = vpt_sma_10
+        columns['vpt_signal'] = np.where(vpt > vpt_sma_10, 1, -1)
         
         # On-Balance Volume (OBV)
-        df['price_change'] = df['close'].diff()
-        df['obv'] = np.where(df['price_change'] > 0, df['volume'],
-                    np.where(df['price_change'] < 0, -df['volume'], 0)).cumsum()
-        df['obv_sma_20'] = df['obv'].rolling(20).mean()
-        df['obv_signal'] = np.where(df['obv'] > df['obv_sma_20'], 1, -1)
+        price_change = close.diff()
+        obv_sma_20 = _roll_mean(obv.to_numpy(), 20)
+        columns['price_change'] = price_change
+        columns['obv'] = obv
+        columns['obv_sma_20'] = obv_sma_20
+        columns['obv_signal'] = np.where(obv > obv_sma_20, 1, -1)
         
         # Accumulation/Distribution Line (A/D)
-        df['clv'] = ((df['close'] - df['low']) - (df['high'] - df['close'])) / (df['high'] - df['low'] + 1e-10)
-        df['ad_line'] = (df['clv'] * df['volume']).cumsum()
-        df['ad_sma_14'] = df['ad_line'].rolling(14).mean()
+        columns['clv'] = clv
+        columns['ad_line'] = ad_line
+        columns['ad_sma_14'] = _roll_mean(ad_line.to_numpy(), 14)
         
         # Volume Rate of Change
         for period in [10, 20]:
-            df[f'volume_roc_{period}'] = (df['volume'] - df['volume'].shift(period)) / (df['volume'].shift(period) + 1e-10) * 100
+            prev_volume = _shift(volume_np, period)
+            columns[f'volume_roc_{period}'] = (volume_np - prev_volume) / (prev_volume + 1e-10) * 100
         
         # Price-Volume Relationship
-        df['price_volume_corr_10'] = df['close'].rolling(10).corr(df['volume'])
-        df['price_volume_corr_20'] = df['close'].rolling(20).corr(df['volume'])
+        for period in [10, 20]:
+            columns[f'price_volume_corr_{period}'] = rolling_corr(close_np, volume_np, period)
         
-        return df
+        return self._append_columns(df, columns)
+    
+    @staticmethod
+    def _window_trend(values: np.ndarray, window: int) -> np.ndarray:
+        """
+        جهت تغییر در یک پنجره: 1 اگر آخرین مقدار از اولین بیشتر باشد، وگرنه -1
+        
+        معادل rolling(window).apply(lambda x: 1 if x.iloc[-1] > x.iloc[0] else -1)
+        ولی با یک shift به جای callback برای هر پنجره (پنجره‌های ناقص NaN)
+        """
+        first = _shift(values, window - 1)
+        trend = np.where(values > first, 1.0, -1.0)
+        trend[np.isnan(first) | np.isnan(values)] = np.nan
+        return trend
     
     def _add_multi_timeframe_features(self, df: pd.DataFrame) -> pd.DataFrame:
         """اضافه کردن ویژگی‌های چند timeframe"""
         
         # فرض: داده ورودی 1H است، 4H و 1D را شبیه‌سازی می‌کنیم
+        # (تجمیع مستقیم روی آرایه‌ها به جای resample + join)
+        times = df.index.asi8
+        origin = df.index.min().normalize().value if len(df) else 0
+        
+        # bucket های روزانه (مثل resample('1D')) در ساعت محلی حساب می‌شوند
+        if df.index.tz is not None and len(df):
+            day_times = df.index.tz_localize(None).asi8
+            day_origin = df.index.min().normalize().tz_localize(None).value
+        else:
+            day_times, day_origin = times, origin
         
         # 4H timeframe simulation از 1H data
-        try:
-            # Resample to 4H
-            df_4h = df.resample('4H', label='right').agg({
-                'open': 'first',
-                'high': 'max', 
-                'low': 'min',
-                'close': 'last',
-                'volume': 'sum'
-            }).dropna()
+        bars_4h = self._aggregate_bars(df, times, origin, 4)
+        if bars_4h is not None and len(bars_4h[0]) > 20:  # اطمینان از داشتن داده کافی
+            labels, _, high_4h, low_4h, close_4h = bars_4h
             
-            if len(df_4h) > 20:  # اطمینان از داشتن داده کافی
-                # Calculate 4H indicators
-                df_4h['rsi_4h'] = self._calculate_rsi(df_4h['close'], 14)
-                df_4h['sma_20_4h'] = df_4h['close'].rolling(20).mean()
-                df_4h['ema_12_4h'] = df_4h['close'].ewm(span=12, adjust=False).mean()
-                df_4h['macd_4h'], _, _ = self._calculate_macd(df_4h['close'])
-                df_4h['atr_4h'] = self._calculate_atr(df_4h, 14)
-                
-                # Bollinger Bands 4H
-                df_4h['bb_upper_4h'], df_4h['bb_middle_4h'], df_4h['bb_lower_4h'] = self._calculate_bollinger_bands(df_4h['close'], 20, 2)
-                df_4h['bb_position_4h'] = (df_4h['close'] - df_4h['bb_lower_4h']) / (df_4h['bb_upper_4h'] - df_4h['bb_lower_4h'] + 1e-10)
-                
-                # Join back to 1H (forward fill)
-                df = df.join(df_4h[['rsi_4h', 'sma_20_4h', 'ema_12_4h', 'macd_4h', 'atr_4h', 
-                                   'bb_upper_4h', 'bb_middle_4h', 'bb_lower_4h', 'bb_position_4h']], 
-                            how='left').ffill()
-        except Exception:
-            # در صورت خطا، مقادیر NaN قرار می‌دهیم
-            for col in ['rsi_4h', 'sma_20_4h', 'ema_12_4h', 'macd_4h', 'atr_4h', 
-                       'bb_upper_4h', 'bb_middle_4h', 'bb_lower_4h', 'bb_position_4h']:
-                df[col] = np.nan
+            # Calculate 4H indicators
+            bb_upper_4h, bb_middle_4h, bb_lower_4h = bollinger_bands(close_4h, 20, 2)
+            features_4h = {
+                'rsi_4h': rsi_sma(close_4h, 14),
+                'sma_20_4h': rolling_mean(close_4h, 20),
+                'ema_12_4h': ema(close_4h, 12),
+                'macd_4h': macd_kernel(close_4h, 12, 26, 9)[0],
+                'atr_4h': self._calculate_atr(
+                    pd.DataFrame({'high': high_4h, 'low': low_4h, 'close': close_4h}), 14
+                ).to_numpy(),
+                'bb_upper_4h': bb_upper_4h,
+                'bb_middle_4h': bb_middle_4h,
+                'bb_lower_4h': bb_lower_4h,
+                'bb_position_4h': (close_4h - bb_lower_4h) / (bb_upper_4h - bb_lower_4h + 1e-10)
+            }
+            
+            # Join back to 1H (forward fill)
+            df = self._join_higher_timeframe(df, times, labels, features_4h)
         
         # Daily timeframe simulation
-        try:
-            df_1d = df.resample('1D', label='right').agg({
-                'open': 'first',
-                'high': 'max', 
-                'low': 'min',
-                'close': 'last',
-                'volume': 'sum'
-            }).dropna()
+        bars_1d = self._aggregate_bars(df, day_times, day_origin, 24)
+        if bars_1d is not None and len(bars_1d[0]) > 20:
+            labels, _, _, _, close_1d = bars_1d
+            
+            # Calculate daily indicators
+            features_1d = {
+                'rsi_1d': rsi_sma(close_1d, 14),
+                'sma_20_1d': rolling_mean(close_1d, 20),
+                'ema_12_1d': ema(close_1d, 12)
+            }
             
-            if len(df_1d) > 20:
-                # Calculate daily indicators
-                df_1d['rsi_1d'] = self._calculate_rsi(df_1d['close'], 14)
-                df_1d['sma_20_1d'] = df_1d['close'].rolling(20).mean()
-                df_1d['ema_12_1d'] = df_1d['close'].ewm(span=12, adjust=False).mean()
-                
-                # Join back to 1H
-                df = df.join(df_1d[['rsi_1d', 'sma_20_1d', 'ema_12_1d']], how='left').ffill()
-        except Exception:
-            for col in ['rsi_1d', 'sma_20_1d', 'ema_12_1d']:
-                df[col] = np.nan
+            # Join back to 1H
+            df = self._join_higher_timeframe(df, day_times, labels, features_1d)
+        
+        # ufunc های NumPy روی آرایه‌ها (بدون Series موقت)
+        close = df['close'].to_numpy(dtype=np.float64)
+        columns = {}
         
         # Trend alignment features
-        df['trend_1h'] = np.where(df['close'] > df['sma_20'], 1, -1)
+        trend_1h = np.where(close > df['sma_20'].to_numpy(), 1, -1)
+        columns['trend_1h'] = trend_1h
         
         # 4H trend alignment
         if 'sma_20_4h' in df.columns:
-            df['trend_4h'] = np.where(df['close'] > df['sma_20_4h'], 1, -1)
-            df['trend_alignment_4h'] = (df['trend_1h'] == df['trend_4h']).astype(int)
+            trend_4h = np.where(close > df['sma_20_4h'].to_numpy(), 1, -1)
+            columns['trend_4h'] = trend_4h
+            columns['trend_alignment_4h'] = (trend_1h == trend_4h).astype(int)
         else:
-            df['trend_4h'] = 0
-            df['trend_alignment_4h'] = 0
+            trend_4h = 0
+            columns['trend_4h'] = 0
+            columns['trend_alignment_4h'] = 0
         
         # Daily trend alignment
         if 'sma_20_1d' in df.columns:
-            df['trend_1d'] = np.where(df['close'] > df['sma_20_1d'], 1, -1)
-            df['trend_alignment_1d'] = (df['trend_1h'] == df['trend_1d']).astype(int)
-            df['full_trend_alignment'] = ((df['trend_1h'] == df['trend_4h']) & 
-                                         (df['trend_1h'] == df['trend_1d'])).astype(int)
+            trend_1d = np.where(close > df['sma_20_1d'].to_numpy(), 1, -1)
+            columns['trend_1d'] = trend_1d
+            columns['trend_alignment_1d'] = (trend_1h == trend_1d).astype(int)
+            columns['full_trend_alignment'] = ((trend_1h == trend_4h) & 
+                                               (trend_1h == trend_1d)).astype(int)
         else:
-            df['trend_1d'] = 0
-            df['trend_alignment_1d'] = 0
-            df['full_trend_alignment'] = 0
+            columns['trend_1d'] = 0
+            columns['trend_alignment_1d'] = 0
+            columns['full_trend_alignment'] = 0
         
         # RSI divergence بین timeframes
         if 'rsi_4h' in df.columns and 'rsi_1d' in df.columns:
-            df['rsi_divergence_4h'] = abs(df['rsi_14'] - df['rsi_4h'])
-            df['rsi_divergence_1d'] = abs(df['rsi_14'] - df['rsi_1d'])
+            rsi_14 = df['rsi_14'].to_numpy()
+            columns['rsi_divergence_4h'] = np.abs(rsi_14 - df['rsi_4h'].to_numpy())
+            columns['rsi_divergence_1d'] = np.abs(rsi_14 - df['rsi_1d'].to_numpy())
         else:
-            df['rsi_divergence_4h'] = 0
-            df['rsi_divergence_1d'] = 0
+            columns['rsi_divergence_4h'] = 0
+            columns['rsi_divergence_1d'] = 0
         
         # Higher timeframe momentum
         if 'ema_12_4h' in df.columns:
-            df['momentum_4h'] = (df['close'] - df['ema_12_4h']) / df['ema_12_4h'] * 100
+            ema_12_4h = df['ema_12_4h'].to_numpy()
+            columns['momentum_4h'] = (close - ema_12_4h) / ema_12_4h * 100
         else:
-            df['momentum_4h'] = 0
+            columns['momentum_4h'] = 0
             
         if 'ema_12_1d' in df.columns:
-            df['momentum_1d'] = (df['close'] - df['ema_12_1d']) / df['ema_12_1d'] * 100
+            ema_12_1d = df['ema_12_1d'].to_numpy()
+            columns['momentum_1d'] = (close - ema_12_1d) / ema_12_1d * 100
         else:
-            df['momentum_1d'] = 0
+            columns['momentum_1d'] = 0
         
-        return df
+        return self._append_columns(df, columns)
+    
+    @staticmethod
+    def _aggregate_bars(df: pd.DataFrame, times: np.ndarray, origin: int, hours: int):
+        """
+        تجمیع bars به timeframe بزرگ‌تر روی آرایه‌های NumPy
+        
+        معادل df.resample(f'{hours}H', label='right').agg(open first, high max,
+        low min, close last).dropna(): bucket ها از origin (نیمه‌شب روز اول) شروع
+        می‌شوند، label هر bucket لبه راست آن است و bucket های خالی (gap) حذف می‌شوند.
+        
+        Args:
+            df: داده 1H
+            times: df.index به صورت int64 نانوثانیه
+            origin: نیمه‌شب روز اول به صورت int64 نانوثانیه
+            hours: طول هر bucket
+        
+        Returns:
+            (labels_ns, open, high, low, close) مرتب بر اساس زمان، یا None اگر df خالی باشد
+        """
+        if len(times) == 0:
+            return None
+        
+        width = hours * _HOUR_NS
+        buckets = (times - origin) // width
+        order = np.argsort(buckets, kind='stable')
+        buckets = buckets[order]
+        starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+        ends = np.r_[starts[1:], len(buckets)] - 1
+        
+        labels = (buckets[starts] + 1) * width + origin
+        opens = df['open'].to_numpy(dtype=np.float64)[order][starts]
+        highs = np.fmax.reduceat(df['high'].to_numpy(dtype=np.float64)[order], starts)
+        lows = np.fmin.reduceat(df['low'].to_numpy(dtype=np.float64)[order], starts)
+        closes = df['close'].to_numpy(dtype=np.float64)[order][ends]
+        return labels, opens, highs, lows, closes
+    
+    @staticmethod
+    def _join_higher_timeframe(
+        df: pd.DataFrame,
+        times: np.ndarray,
+        labels: np.ndarray,
+        features: Dict[str, np.ndarray]
+    ) -> pd.DataFrame:
+        """
+        اضافه کردن features timeframe بزرگ‌تر به 1H
+        
+        مقدار هر bucket روی ردیفی قرار می‌گیرد که زمانش برابر label آن است
+        (مثل join روی index)، سپس کل DataFrame forward fill می‌شود.
+        """
+        pos = np.searchsorted(labels, times)
+        matched = pos < len(labels)
+        matched[matched] = labels[pos[matched]] == times[matched]
+        rows = np.flatnonzero(matched)
+        pos = pos[rows]
+        
+        columns = {}
+        for name, values in features.items():
+            column = np.full(len(df), np.nan)
+            column[rows] = values[pos]
+            columns[name] = column
+        
+        return FeatureEngineer._append_columns(df, columns).ffill()
     
     def _add_statistical_features(self, df: pd.DataFrame) -> pd.DataFrame:
         """اضافه کردن features آماری"""
         
-        for period in [5, 10, 20]:
-            # Volatility (استاندارد deviation)
-            df[f'volatility_{period}'] = df['close'].rolling(window=period).std()
-            
-            # Price range
-            df[f'high_low_range_{period}'] = (
-                df['high'].rolling(window=period).max() - 
-                df['low'].rolling(window=period).min()
-            ) / df['close']
-            
-            # Returns
-            df[f'returns_{period}'] = df['close'].pct_change(periods=period)
+        high = df['high']
+        low = df['low']
+        close = df['close']
+        columns = {}
+        
+        # Volatility (استاندارد deviation), Price range, Returns - دوره‌ها موازی در یک kernel
+        periods, names = _block_layout((5, 10, 20), _STATISTICAL_COLUMNS)
+        block = statistical_block(
+            high.to_numpy(dtype=np.float64),
+            low.to_numpy(dtype=np.float64),
+            close.to_numpy(dtype=np.float64),
+            periods
+        )
+        columns.update(zip(names, block.T))
         
         # Z-score (چقدر قیمت دور از میانگین است)
-        df['zscore_20'] = (df['close'] - df['close'].rolling(20).mean()) / df['close'].rolling(20).std()
+        close_np = close.to_numpy(dtype=np.float64)
+        columns['zscore_20'] = (close_np - _roll_mean(close_np, 20)) / _roll_std(close_np, 20)
         
-        return df
+        return self._append_columns(df, columns)
     
     def _add_time_features(self, df: pd.DataFrame) -> pd.DataFrame:
         """اضافه کردن features زمانی"""
+        index = df.index
+        columns = {}
         
         # Hour of day
-        df['hour'] = df.index.hour
-        df['hour_sin'] = np.sin(2 * np.pi * df['hour'] / 24)
-        df['hour_cos'] = np.cos(2 * np.pi * df['hour'] / 24)
+        hour = index.hour.to_numpy()
+        columns['hour'] = hour
+        columns['hour_sin'] = _HOUR_SIN[hour]
+        columns['hour_cos'] = _HOUR_COS[hour]
         
         # Day of week
-        df['dayofweek'] = df.index.dayofweek
-        df['is_weekend'] = (df['dayofweek'] >= 5).astype(int)
+        dayofweek = index.dayofweek.to_numpy()
+        columns['dayofweek'] = dayofweek
+        columns['is_weekend'] = (dayofweek >= 5).astype(int)
         
         # Week of month
-        df['week_of_month'] = (df.index.day - 1) // 7 + 1
+        columns['week_of_month'] = (index.day.to_numpy() - 1) // 7 + 1
         
-        return df
+        return self._append_columns(df, columns)
     
     def _add_target(self, df: pd.DataFrame, horizon: int = 1) -> pd.DataFrame:
         """
@@ -374,22 +587,32 @@ class FeatureEngineer:
         Target: آیا قیمت در N کندل آینده بالا می‌رود؟
         0 = Down, 1 = Up
         """
-        df['future_close'] = df['close'].shift(-horizon)
-        df['target'] = (df['future_close'] > df['close']).astype(int)
+        close = df['close'].to_numpy(dtype=np.float64)
+        future_close = _shift(close, -horizon)
+        columns = {
+            'future_close': future_close,
+            # int8 کافی است (0/1) - یک بایت به جای هشت برای هر row
+            'target': (future_close > close).astype(np.int8),
+            
+            # Target برای regression (درصد تغییر)
+            'target_return': (future_close - close) / close * 100
+        }
         
-        # Target برای regression (درصد تغییر)
-        df['target_return'] = (df['future_close'] - df['close']) / df['close'] * 100
+        return self._append_columns(df, columns)
+    
+    @staticmethod
+    def _append_columns(df: pd.DataFrame, columns: Dict[str, object]) -> pd.DataFrame:
+        """
+        اضافه کردن همه ستون‌های جدید یک مرحله با یک concat
         
-        return df
+        (به جای df[name] = ... برای هر ستون که هر بار BlockManager را بزرگ می‌کند)
+        """
+        return pd.concat([df, pd.DataFrame(columns, index=df.index)], axis=1)
     
     def _calculate_rsi(self, prices: pd.Series, period: int = 14) -> pd.Series:
-        """محاسبه RSI"""
-        delta = prices.diff()
-        gain = (delta.where(delta > 0, 0)).rolling(window=period).mean()
-        loss = (-delta.where(delta < 0, 0)).rolling(window=period).mean()
-        rs = gain / loss
-        rsi = 100 - (100 / (1 + rs))
-        return rsi
+        """محاسبه RSI (kernel با running sums، یک پیمایش)"""
+        rsi = rsi_sma(prices.to_numpy(dtype=np.float64), period)
+        return pd.Series(rsi, index=prices.index)
     
     def _calculate_macd(
         self, 
@@ -398,13 +621,10 @@ class FeatureEngineer:
         slow: int = 26, 
         signal: int = 9
     ) -> tuple[pd.Series, pd.Series, pd.Series]:
-        """محاسبه MACD"""
-        ema_fast = prices.ewm(span=fast, adjust=False).mean()
-        ema_slow = prices.ewm(span=slow, adjust=False).mean()
-        macd = ema_fast - ema_slow
-        macd_signal = macd.ewm(span=signal, adjust=False).mean()
-        macd_hist = macd - macd_signal
-        return macd, macd_signal, macd_hist
+        """محاسبه MACD (سه EMA در یک kernel)"""
+        index = prices.index
+        macd, macd_signal, macd_hist = macd_kernel(prices.to_numpy(dtype=np.float64), fast, slow, signal)
+        return pd.Series(macd, index=index), pd.Series(macd_signal, index=index), pd.Series(macd_hist, index=index)
     
     def _calculate_bollinger_bands(
         self, 
@@ -412,29 +632,31 @@ class FeatureEngineer:
         period: int = 20, 
         num_std: float = 2.0
     ) -> tuple[pd.Series, pd.Series, pd.Series]:
-        """محاسبه Bollinger Bands"""
-        middle = prices.rolling(window=period).mean()
-        std = prices.rolling(window=period).std()
-        upper = middle + (std * num_std)
-        lower = middle - (std * num_std)
-        return upper, middle, lower
+        """محاسبه Bollinger Bands (mean و std در یک rolling pass)"""
+        index = prices.index
+        upper, middle, lower = bollinger_bands(prices.to_numpy(dtype=np.float64), period, num_std)
+        return pd.Series(upper, index=index), pd.Series(middle, index=index), pd.Series(lower, index=index)
     
     def _calculate_atr(self, df: pd.DataFrame, period: int = 14) -> pd.Series:
         """محاسبه Average True Range"""
-        high = df['high']
-        low = df['low']
-        close = df['close']
+        high = df['high'].to_numpy(dtype=np.float64)
+        low = df['low'].to_numpy(dtype=np.float64)
+        close = df['close'].to_numpy(dtype=np.float64)
+        prev_close = np.empty_like(close)
+        prev_close[:1] = np.nan
+        prev_close[1:] = close[:-1]
         
         tr1 = high - low
-        tr2 = abs(high - close.shift())
-        tr3 = abs(low - close.shift())
+        tr2 = np.abs(high - prev_close)
+        tr3 = np.abs(low - prev_close)
         
-        tr = pd.concat([tr1, tr2, tr3], axis=1).max(axis=1)
-        atr = tr.rolling(window=period).mean()
+        # fmax مثل max(axis=1) در pandas از NaN (کندل اول) صرف‌نظر می‌کند
+        tr = np.fmax.reduce([tr1, tr2, tr3])
+        atr = rolling_mean(tr, period)
         
-        return atr
+        return pd.Series(atr, index=df.index)
     
     def get_feature_names(self) -> List[str]:
         """لیست نام features"""
         # این را بعد از اولین extract_features صدا بزنید
-        return [col for col in self._last_df.columns if col not in ['target', 'target_return', 'future_close']]
+        return [col for col in self._last_df.columns if col not in _TARGET_COLUMNS]
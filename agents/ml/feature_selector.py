@@ -6,17 +6,45 @@ Advanced Feature Selection for ML models
 from typing import List, Dict, Optional, Tuple
 import numpy as np
 import pandas as pd
+from joblib import Parallel, delayed
 from sklearn.feature_selection import (
-    SelectKBest, f_classif, chi2, mutual_info_classif,
-    RFE, RFECV, VarianceThreshold
+    SelectKBest, f_classif, chi2, mutual_info_classif, RFE
 )
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.linear_model import LassoCV
-from sklearn.model_selection import cross_val_score, TimeSeriesSplit
+from sklearn.ensemble import HistGradientBoostingClassifier
+from sklearn.linear_model import lasso_path
+
+from agents.ml._kernels import greedy_decorrelate
+from agents.ml.models import _hist_gain_importances
 import warnings
 warnings.filterwarnings('ignore')
 
 
+# زیر این تعداد feature، sort کامل سریع‌تر از partition + sort نامزدها است
+# (اندازه‌گیری: ~2x سریع‌تر در 200 feature، ~2x کندتر در 1000)
+_TOP_K_SORT_CUTOFF = 512
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    اندیس k امتیاز بزرگ‌تر به ترتیب نزولی
+
+    همان np.argsort(-scores, kind='stable')[:k] (features هم‌امتیاز به ترتیب
+    اصلی)، ولی با partition به جای sort کامل: O(F + k log k) به جای O(F log F)
+    """
+    n = len(scores)
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    if k >= n or n <= _TOP_K_SORT_CUTOFF or np.isnan(scores).any():
+        # آرایه کوچک: یک argsort از چند call partition سریع‌تر است
+        # NaN: در argsort آخر ولی در partition بزرگ‌ترین حساب می‌شود
+        return np.argsort(-scores, kind='stable')[:k]
+    
+    kth = np.partition(scores, n - k)[n - k]  # k-امین امتیاز بزرگ
+    # همه امتیازهای >= kth (شامل هم‌امتیازهای مرزی) به ترتیب index، سپس sort پایدار
+    candidates = np.flatnonzero(scores >= kth)
+    return candidates[np.argsort(-scores[candidates], kind='stable')[:k]]
+
+
 class AdvancedFeatureSelector:
     """
     انتخاب بهترین features به صورت اتوماتیک
@@ -25,8 +53,8 @@ class AdvancedFeatureSelector:
     1. حذف features با variance پایین
     2. حذف features با همبستگی بالا
     3. انتخاب آماری (f_classif, mutual_info)
-    4. انتخاب مبتنی بر model (RFE با RandomForest)
-    5. انتخاب مبتنی بر Lasso regularization
+    4. انتخاب مبتنی بر model (gain importance با HistGradientBoosting)
+    5. انتخاب مبتنی بر Lasso regularization (lasso_path)
     """
     
     def __init__(
@@ -34,25 +62,37 @@ class AdvancedFeatureSelector:
         n_features: int = 30,
         correlation_threshold: float = 0.95,
         variance_threshold: float = 0.01,
-        cv_folds: int = 3
+        cv_folds: int = 3,
+        verbose: bool = True
     ):
         """
         Args:
             n_features: تعداد نهایی features مورد نظر
             correlation_threshold: حد آستانه برای حذف features همبسته
             variance_threshold: حد آستانه برای حذف features با variance پایین
-            cv_folds: تعداد folds برای cross-validation
+            cv_folds: تعداد folds برای cross-validation (روش‌های فعلی CV ندارند؛ برای سازگاری نگه داشته شده)
+            verbose: چاپ مراحل selection (برای HPO / train های پشت سر هم False)
         """
         self.n_features = n_features
         self.correlation_threshold = correlation_threshold
         self.variance_threshold = variance_threshold
         self.cv_folds = cv_folds
+        self.verbose = verbose
         
         # Selected features tracker
         self.selected_features: Optional[List[str]] = None
-        self.feature_scores: Optional[Dict[str, float]] = None
+        # امتیازها به صورت آرایه نگه داشته می‌شوند؛ dict فقط هنگام نیاز (feature_scores)
+        self._score_names: Optional[pd.Index] = None
+        self._score_values: Optional[np.ndarray] = None
+        self._feature_scores: Optional[Dict[str, float]] = None
         self.selection_history: Dict[str, List[str]] = {}
         
+        # X استاندارد شده (float32) بعد از فیلترها - مشترک بین correlation و lasso
+        self._standardized: Optional[Tuple[pd.Index, np.ndarray]] = None
+        
+        # موقعیت ستون‌های انتخاب شده برای آخرین columns دیده شده در transform()
+        self._transform_cache: Optional[Tuple[pd.Index, List[str], np.ndarray]] = None
+        
     def select_features(
         self, 
         X: pd.DataFrame, 
@@ -70,21 +110,45 @@ class AdvancedFeatureSelector:
         Returns:
             DataFrame با features انتخاب شده
         """
-        print(f"🔍 شروع Feature Selection با {len(X.columns)} features...")
+        if self.verbose:
+            print(f"🔍 شروع Feature Selection با {len(X.columns)} features...")
         
         # 1. Data cleaning
         X_clean = self._clean_features(X, y)
-        print(f"✅ بعد از cleaning: {len(X_clean.columns)} features")
+        if self.verbose:
+            print(f"✅ بعد از cleaning: {len(X_clean.columns)} features")
+        
+        # اگر features از قبل در بودجه n_features جا می‌شوند، همه را نگه دار
+        # (بدون ماتریس همبستگی و بدون fit مدل‌ها)
+        if len(X_clean.columns) <= self.n_features:
+            self.selected_features = list(X_clean.columns)
+            self.selection_history['after_variance'] = self.selected_features
+            self.selection_history['after_correlation'] = self.selected_features
+            self.selection_history['final'] = self.selected_features
+            self._standardized = None
+            self._set_scores(X_clean.columns[:0], np.empty(0))
+            if self.verbose:
+                print(f"✅ Features نهایی: {len(X_clean.columns)} (کمتر از n_features={self.n_features})")
+            return X_clean
+        
+        # مراحل فیلتر روی یک آرایه float32 (یک بار تبدیل) و نام ستون‌ها کار می‌کنند
+        values = X_clean.to_numpy(dtype=np.float32)
+        columns = X_clean.columns
         
         # 2. Remove low variance features
-        X_variance = self._remove_low_variance_features(X_clean)
-        print(f"✅ بعد از حذف low variance: {len(X_variance.columns)} features")
-        self.selection_history['after_variance'] = list(X_variance.columns)
+        values, columns = self._remove_low_variance_features(values, columns)
+        if self.verbose:
+            print(f"✅ بعد از حذف low variance: {len(columns)} features")
+        self.selection_history['after_variance'] = list(columns)
+        
+        # 3. Remove highly correlated features (یک بار استاندارد سازی برای correlation و lasso)
+        standardized, columns = self._remove_correlated_features(self._standardize(values), columns)
+        if self.verbose:
+            print(f"✅ بعد از حذف correlated: {len(columns)} features")
+        self.selection_history['after_correlation'] = list(columns)
+        self._standardized = (columns, standardized)
         
-        # 3. Remove highly correlated features
-        X_corr = self._remove_correlated_features(X_variance)
-        print(f"✅ بعد از حذف correlated: {len(X_corr.columns)} features")
-        self.selection_history['after_correlation'] = list(X_corr.columns)
+        X_corr = X_clean[columns]
         
         # 4. Feature selection based on method
         if method == 'statistical':
@@ -98,62 +162,105 @@ class AdvancedFeatureSelector:
         else:
             raise ValueError(f"Unknown method: {method}")
         
-        print(f"✅ Features نهایی: {len(X_selected.columns)}")
+        if self.verbose:
+            print(f"✅ Features نهایی: {len(X_selected.columns)}")
         self.selected_features = list(X_selected.columns)
         self.selection_history['final'] = self.selected_features
         
         return X_selected
     
     def _clean_features(self, X: pd.DataFrame, y: pd.Series) -> pd.DataFrame:
-        """پاک‌سازی اولیه features"""
-        # Remove features with too many NaN values
-        X_clean = X.copy()
-        
-        # Remove columns with >50% NaN
-        nan_threshold = len(X_clean) * 0.5
-        X_clean = X_clean.dropna(thresh=nan_threshold, axis=1)
-        
-        # Remove infinite values
-        X_clean = X_clean.replace([np.inf, -np.inf], np.nan)
-        
-        # Fill remaining NaN with median
-        X_clean = X_clean.fillna(X_clean.median())
-        
-        # Remove features that are constant
-        nunique = X_clean.nunique()
-        constant_features = nunique[nunique == 1].index
-        X_clean = X_clean.drop(columns=constant_features)
+        """
+        پاک‌سازی اولیه features
         
-        return X_clean
+        یک کپی از داده (انتخاب ستون‌ها)، یک mask برای inf و NaN و یک DataFrame در انتها
+        """
+        # بدون کپی اگر X از قبل float64 یکدست باشد - X تغییر نمی‌کند
+        values = X.to_numpy(dtype=np.float64)
+        
+        # Remove columns with >50% NaN (inf هنوز مقدار معتبر حساب می‌شود)
+        nan_threshold = len(values) * 0.5
+        keep = np.count_nonzero(~np.isnan(values), axis=0) >= nan_threshold
+        values = values[:, keep]  # تنها کپی داده (fancy indexing همیشه کپی می‌کند)
+        columns = X.columns[keep]
+        
+        # Remove infinite values و Fill remaining NaN with median - یک mask برای هر دو؛
+        # np.nanmedian (partition، نه sort) فقط روی ستون‌هایی که NaN/inf دارند
+        rows, cols = np.nonzero(~np.isfinite(values))
+        if len(rows):
+            values[rows, cols] = np.nan
+            nan_columns = np.unique(cols)
+            medians = np.empty(values.shape[1])
+            medians[nan_columns] = np.nanmedian(values[:, nan_columns], axis=0)
+            values[rows, cols] = medians[cols]
+        
+        # Remove features that are constant (ستون تماماً NaN مثل قبل نگه داشته می‌شود)
+        constant = (values.max(axis=0) - values.min(axis=0)) == 0
+        if constant.any():
+            values = values[:, ~constant]
+            columns = columns[~constant]
+        
+        return pd.DataFrame(values, columns=columns, index=X.index)
     
-    def _remove_low_variance_features(self, X: pd.DataFrame) -> pd.DataFrame:
-        """حذف features با variance پایین"""
-        selector = VarianceThreshold(threshold=self.variance_threshold)
-        
+    def _remove_low_variance_features(
+        self,
+        values: np.ndarray,
+        columns: pd.Index
+    ) -> Tuple[np.ndarray, pd.Index]:
+        """حذف features با variance پایین (روی آرایه، بدون ساخت DataFrame)"""
         try:
-            X_selected = selector.fit_transform(X)
-            selected_columns = X.columns[selector.get_support()]
-            return pd.DataFrame(X_selected, columns=selected_columns, index=X.index)
+            # یک reduction به جای VarianceThreshold (بدون validation و کپی sklearn)
+            mask = values.var(axis=0, dtype=np.float64) > self.variance_threshold
         except Exception:
-            # اگر خطا بود، همه features را نگه دار
-            return X
-    
-    def _remove_correlated_features(self, X: pd.DataFrame) -> pd.DataFrame:
-        """حذف features با همبستگی بالا"""
-        corr_matrix = X.corr().abs()
-        
-        # Find upper triangle of correlation matrix
-        upper_tri = corr_matrix.where(
-            np.triu(np.ones(corr_matrix.shape), k=1).astype(bool)
-        )
+            mask = None
         
-        # Find features with correlation greater than threshold
-        to_drop = [
-            column for column in upper_tri.columns 
-            if any(upper_tri[column] > self.correlation_threshold)
-        ]
+        if mask is None or not mask.any():
+            # اگر خطا بود یا هیچ feature ای نماند، همه features را نگه دار
+            return values, columns
+        return values[:, mask], columns[mask]
+    
+    @staticmethod
+    def _standardize(values: np.ndarray) -> np.ndarray:
+        """
+        (values - mean) / std به صورت float32
         
-        return X.drop(columns=to_drop)
+        میانگین و std با انباشت float64 حساب می‌شوند تا ستون‌های بزرگ (OBV، VPT) دقت
+        خود را از دست ندهند؛ NaN ها قبلاً در _clean_features پر شده‌اند
+        """
+        values = np.asarray(values, dtype=np.float32)
+        standardized = values - values.mean(axis=0, dtype=np.float64).astype(np.float32)
+        standardized /= (standardized.std(axis=0, dtype=np.float64) + 1e-12).astype(np.float32)
+        return standardized
+    
+    def _standardized_features(self, X: pd.DataFrame) -> np.ndarray:
+        """X استاندارد شده؛ از cache مرحله correlation اگر همان ستون‌ها باشد"""
+        if self._standardized is not None and self._standardized[0].equals(X.columns):
+            return self._standardized[1]
+        return self._standardize(X.to_numpy(dtype=np.float32))
+    
+    def _remove_correlated_features(
+        self,
+        standardized: np.ndarray,
+        columns: pd.Index
+    ) -> Tuple[np.ndarray, pd.Index]:
+        """حذف features با همبستگی بالا (روی آرایه استاندارد شده، بدون ساخت DataFrame)"""
+        # انتخاب بعدی در هر صورت همه را نگه می‌دارد - ماتریس همبستگی لازم نیست
+        if len(columns) < 2 or len(columns) <= self.n_features:
+            return standardized, columns
+        
+        # همبستگی با یک ضرب ماتریسی float32 (sgemm) به جای X.corr() - دقت float32
+        # برای مقایسه با threshold کافی است
+        corr_matrix = np.abs(standardized.T @ standardized) / len(standardized)
+        
+        # ماتریس "بالای threshold" به صورت bitmap فشرده (هر row: F/64 کلمه uint64)
+        n_features = len(columns)
+        above = np.packbits(corr_matrix > self.correlation_threshold, axis=1, bitorder='little')
+        above_bits = np.zeros((n_features, -(-n_features // 64) * 8), dtype=np.uint8)
+        above_bits[:, :above.shape[1]] = above
+        
+        # حذف greedy: هر ستون فقط با ستون‌های نگه داشته شده مقایسه می‌شود
+        keep = greedy_decorrelate(above_bits.view('<u8'))
+        return standardized[:, keep], columns[keep]
     
     def _statistical_selection(self, X: pd.DataFrame, y: pd.Series) -> pd.DataFrame:
         """انتخاب مبتنی بر آمار"""
@@ -164,63 +271,43 @@ class AdvancedFeatureSelector:
         )
         
         try:
-            X_selected = selector_f.fit_transform(X, y)
-            selected_features = X.columns[selector_f.get_support()]
+            # فقط fit و mask - بدون ساخت آرایه جدید با fit_transform
+            mask = selector_f.fit(X, y).get_support()
+            selected_features = X.columns[mask]
             
             # Store scores
-            scores = selector_f.scores_
-            self.feature_scores = dict(zip(selected_features, scores[selector_f.get_support()]))
+            self._set_scores(selected_features, selector_f.scores_[mask])
             
-            return pd.DataFrame(X_selected, columns=selected_features, index=X.index)
+            return X.loc[:, mask]
         except Exception:
             # اگر خطا بود، اولین n_features را برگردان
             return X.iloc[:, :self.n_features]
     
     def _model_based_selection(self, X: pd.DataFrame, y: pd.Series) -> pd.DataFrame:
-        """انتخاب مبتنی بر RandomForest"""
-        rf = RandomForestClassifier(
-            n_estimators=50, 
-            random_state=42,
-            n_jobs=-1,
-            max_depth=5  # جلوگیری از overfitting
+        """انتخاب مبتنی بر HistGradientBoosting (top n_features بر اساس gain importance)"""
+        # binning هیستوگرامی + early stopping: چند برابر سریع‌تر از RandomForest
+        model = HistGradientBoostingClassifier(
+            max_iter=100,
+            max_depth=5,  # جلوگیری از overfitting
+            early_stopping=True,
+            random_state=42
         )
         
         try:
-            # استفاده از TimeSeriesSplit برای cross-validation
-            cv = TimeSeriesSplit(n_splits=self.cv_folds)
-            
-            selector = RFECV(
-                estimator=rf,
-                step=1,
-                cv=cv,
-                scoring='accuracy',
-                n_jobs=-1,
-                min_features_to_select=min(10, self.n_features)
-            )
+            # یک fit و رتبه‌بندی با feature importance به جای RFECV
+            # (که برای هر حذف و هر fold یک forest جدید می‌ساخت)
+            model.fit(X, y)
+            importances = _hist_gain_importances(model, len(X.columns))
+            if not importances.any():
+                raise ValueError("model هیچ split ای نساخت")
             
-            X_selected = selector.fit_transform(X, y)
-            selected_features = X.columns[selector.get_support()]
+            # Sort by importance and select top n_features
+            top = _top_k(importances, self.n_features)
+            selected_features = X.columns[top]
             
-            # اگر بیش از حد نظر features انتخاب شد، کاهش بده
-            if len(selected_features) > self.n_features:
-                # بر اساس feature importance انتخاب کن
-                rf.fit(X[selected_features], y)
-                importances = rf.feature_importances_
-                
-                # Sort by importance and select top n_features
-                feature_importance = list(zip(selected_features, importances))
-                feature_importance.sort(key=lambda x: x[1], reverse=True)
-                
-                final_features = [f[0] for f in feature_importance[:self.n_features]]
-                selected_features = final_features
-                X_selected = X[selected_features]
+            self._set_scores(selected_features, importances[top])
             
-            self.feature_scores = dict(zip(
-                selected_features, 
-                [selector.estimator_.feature_importances_[i] for i in range(len(selected_features))]
-            ))
-            
-            return pd.DataFrame(X_selected, columns=selected_features, index=X.index)
+            return X[selected_features]
             
         except Exception as e:
             print(f"⚠️ خطا در model-based selection: {e}")
@@ -230,36 +317,33 @@ class AdvancedFeatureSelector:
     def _lasso_selection(self, X: pd.DataFrame, y: pd.Series) -> pd.DataFrame:
         """انتخاب مبتنی بر Lasso regularization"""
         try:
-            # استفاده از LassoCV برای انتخاب بهترین alpha
-            lasso = LassoCV(
-                cv=TimeSeriesSplit(n_splits=self.cv_folds),
-                random_state=42,
-                max_iter=1000
-            )
+            # یک lasso_path (warm start روی مسیر regularization) به جای LassoCV که
+            # برای هر alpha و هر fold از صفر fit می‌کرد
+            X_std = self._standardized_features(X)
+            y_centered = (y.to_numpy(dtype=np.float64) - y.mean()).astype(X_std.dtype)
+            
+            # شبکه alpha مثل LassoCV: از alpha_max (همه ضرایب صفر) تا 1e-3 * alpha_max
+            alpha_max = np.abs(X_std.T @ y_centered).max() / len(X_std)
+            alphas = np.geomspace(alpha_max, alpha_max * 1e-3, 30)
+            _, coefs, _ = lasso_path(X_std, y_centered, alphas=alphas, max_iter=1000)
             
-            lasso.fit(X, y)
+            # alpha ای که تعداد features آن به n_features نزدیک‌تر است
+            n_nonzero = (coefs != 0).sum(axis=0)
+            coef_abs = np.abs(coefs[:, np.argmin(np.abs(n_nonzero - self.n_features))])
             
             # Features with non-zero coefficients
-            selected_mask = lasso.coef_ != 0
-            selected_features = X.columns[selected_mask]
+            selected = np.flatnonzero(coef_abs)
             
             # اگر خیلی کم features انتخاب شد، از statistical fallback استفاده کن
-            if len(selected_features) < 5:
+            if len(selected) < 5:
                 return self._statistical_selection(X, y)
             
             # اگر خیلی زیاد انتخاب شد، top n_features را بر اساس abs(coefficient) انتخاب کن
-            if len(selected_features) > self.n_features:
-                coef_abs = np.abs(lasso.coef_[selected_mask])
-                feature_coef = list(zip(selected_features, coef_abs))
-                feature_coef.sort(key=lambda x: x[1], reverse=True)
-                
-                final_features = [f[0] for f in feature_coef[:self.n_features]]
-                selected_features = final_features
+            if len(selected) > self.n_features:
+                selected = _top_k(coef_abs, self.n_features)
             
-            self.feature_scores = dict(zip(
-                selected_features,
-                np.abs(lasso.coef_[X.columns.isin(selected_features)])
-            ))
+            selected_features = X.columns[selected]
+            self._set_scores(selected_features, coef_abs[selected])
             
             return X[selected_features]
             
@@ -270,63 +354,67 @@ class AdvancedFeatureSelector:
     def _combined_selection(self, X: pd.DataFrame, y: pd.Series) -> pd.DataFrame:
         """ترکیب چند روش برای انتخاب بهترین features"""
         
-        # 1. Statistical selection (50% of target features)
-        n_statistical = max(self.n_features // 2, 10)
-        try:
-            X_stat = self._statistical_selection(X, y)
-            if len(X_stat.columns) > n_statistical:
-                X_stat = X_stat.iloc[:, :n_statistical]
-            stat_features = set(X_stat.columns)
-        except Exception:
-            stat_features = set()
-        
-        # 2. Model-based selection
-        try:
-            X_model = self._model_based_selection(X, y)
-            model_features = set(X_model.columns)
-        except Exception:
-            model_features = set()
+        # سه روش مستقل از هم هستند و هر کدام بیشتر وقت را در کد native (بدون GIL)
+        # می‌گذرانند، پس با thread ها همزمان اجرا می‌شوند (زمان = کندترین روش)
+        # 1. Statistical selection, 2. Model-based selection, 3. Lasso selection
+        stat_features, model_features, lasso_features = Parallel(n_jobs=3, prefer='threads')(
+            delayed(self._selected_feature_set)(selection, X, y)
+            for selection in (
+                self._statistical_selection,
+                self._model_based_selection,
+                self._lasso_selection
+            )
+        )
         
-        # 3. Lasso selection
-        try:
-            X_lasso = self._lasso_selection(X, y)
-            lasso_features = set(X_lasso.columns)
-        except Exception:
-            lasso_features = set()
+        # Statistical selection: فقط 50% of target features
+        n_statistical = max(self.n_features // 2, 10)
+        stat_features = stat_features[:n_statistical]
         
-        # Combine: features that appear in at least 2 methods
+        # Combine: شمارش vote ها روی index ستون‌ها با یک bincount
         all_methods = [stat_features, model_features, lasso_features]
-        vote_count = {}
-        
-        for features in all_methods:
-            for feature in features:
-                vote_count[feature] = vote_count.get(feature, 0) + 1
+        indices = np.concatenate([X.columns.get_indexer(features) for features in all_methods])
+        votes = np.bincount(indices[indices >= 0], minlength=len(X.columns))
         
-        # Select features with at least 2 votes, or top voted ones
-        high_voted = [f for f, votes in vote_count.items() if votes >= 2]
+        # Select features with at least 2 votes, or top voted ones (به ترتیب ستون‌ها)
+        selected = np.flatnonzero(votes >= 2)
         
-        if len(high_voted) < self.n_features:
-            # اضافه کردن features با بیشترین vote
-            sorted_features = sorted(vote_count.items(), key=lambda x: x[1], reverse=True)
-            for feature, _ in sorted_features:
-                if feature not in high_voted and len(high_voted) < self.n_features:
-                    high_voted.append(feature)
+        if len(selected) < self.n_features:
+            # اضافه کردن features با یک vote
+            selected = np.concatenate([selected, np.flatnonzero(votes == 1)])
         
         # محدود کردن به n_features
-        if len(high_voted) > self.n_features:
-            high_voted = high_voted[:self.n_features]
+        selected = selected[:self.n_features]
         
-        # اطمینان از اینکه features موجود هستند
-        final_features = [f for f in high_voted if f in X.columns]
-        
-        if len(final_features) == 0:
+        if len(selected) == 0:
             # fallback: اولین n_features
-            final_features = list(X.columns[:self.n_features])
+            selected = np.arange(min(self.n_features, len(X.columns)))
         
-        self.feature_scores = {f: vote_count.get(f, 0) for f in final_features}
+        final_features = X.columns[selected]
+        self._set_scores(final_features, votes[selected])
         
         return X[final_features]
     
+    @staticmethod
+    def _selected_feature_set(selection, X: pd.DataFrame, y: pd.Series) -> List[str]:
+        """اجرای یک روش انتخاب؛ اگر خطا بود لیست خالی"""
+        try:
+            return list(selection(X, y).columns)
+        except Exception:
+            return []
+    
+    @property
+    def feature_scores(self) -> Optional[Dict[str, float]]:
+        """امتیاز features انتخاب شده در آخرین روش (dict یک بار و فقط هنگام نیاز ساخته می‌شود)"""
+        if self._feature_scores is None and self._score_names is not None:
+            self._feature_scores = dict(zip(self._score_names, self._score_values.tolist()))
+        return self._feature_scores
+    
+    def _set_scores(self, names: pd.Index, values: np.ndarray) -> None:
+        """ذخیره امتیازها به صورت آرایه (بدون ساخت dict)"""
+        self._score_names = names
+        self._score_values = np.asarray(values)
+        self._feature_scores = None
+    
     def get_selection_report(self) -> Dict:
         """گزارش کامل از فرآیند انتخاب features"""
         if not self.selected_features:
@@ -337,22 +425,42 @@ class AdvancedFeatureSelector:
             "selected_features": self.selected_features,
             "feature_scores": self.feature_scores,
             "selection_history": self.selection_history,
-            "top_features": sorted(
-                self.feature_scores.items() if self.feature_scores else [],
-                key=lambda x: x[1], 
-                reverse=True
-            )[:10] if self.feature_scores else []
+            "top_features": self._top_features(10)
         }
     
-    def transform(self, X: pd.DataFrame) -> pd.DataFrame:
-        """اعمال feature selection به داده جدید"""
+    def _top_features(self, n: int) -> List[Tuple[str, float]]:
+        """n feature با بیشترین امتیاز (top-k روی آرایه امتیازها)"""
+        if self._score_names is None or len(self._score_values) == 0:
+            return []
+        top = _top_k(self._score_values, n)
+        return list(zip(self._score_names[top], self._score_values[top].tolist()))
+    
+    def transform(self, X: pd.DataFrame, as_array: bool = False):
+        """
+        اعمال feature selection به داده جدید
+        
+        Args:
+            X: DataFrame با features
+            as_array: اگر True، ndarray برمی‌گرداند (برای predict مستقیم مدل)
+            
+        Returns:
+            DataFrame (یا ndarray) با features انتخاب شده
+        """
         if not self.selected_features:
             raise ValueError("ابتدا باید select_features() را صدا بزنید")
         
-        # انتخاب فقط features که در training انتخاب شده‌اند
-        available_features = [f for f in self.selected_features if f in X.columns]
+        # انتخاب فقط features که در training انتخاب شده‌اند - موقعیت‌ها برای همان
+        # columns (همان Index) و همان انتخاب cache می‌شوند
+        cache = self._transform_cache
+        if cache is not None and cache[0] is X.columns and cache[1] is self.selected_features:
+            positions = cache[2]
+        else:
+            positions = X.columns.get_indexer(self.selected_features)
+            positions = positions[positions >= 0]
+            self._transform_cache = (X.columns, self.selected_features, positions)
         
-        if len(available_features) == 0:
+        if len(positions) == 0:
             raise ValueError("هیچ‌کدام از features انتخاب شده در داده جدید موجود نیست")
         
-        return X[available_features]
\ No newline at end of file
+        selected = X.iloc[:, positions]
+        return selected.to_numpy() if as_array else selected
\ No newline at end of file
@@ -2,20 +2,32 @@
 ML Agent - Machine Learning Agent for predictive analytics
 """
 
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, NamedTuple, Deque, Tuple
+from collections import deque
 from datetime import datetime
 from dataclasses import dataclass
+import logging
 import pandas as pd
 import numpy as np
-import pickle
+import joblib
 from pathlib import Path
 
 from agents.base import BaseAgent, AgentOutput, AgentType
-from agents.ml.feature_engineer import FeatureEngineer
+from agents.ml.feature_engineer import FeatureEngineer, _TARGET_COLUMNS as _NON_FEATURE_COLS
 from agents.ml.feature_selector import AdvancedFeatureSelector
-from agents.ml.models import MLModel, RandomForestModel, XGBoostModel, EnsembleModel
+from agents.ml.models import (
+    MLModel, RandomForestModel, XGBoostModel, EnsembleModel,
+    _as_float32, _dump_model_data, _load_model_data
+)
+from agents.ml._kernels import signal_postprocess
+from agents.ml import _onnx, _treelite
 from data_layer.models import MarketData
 
+logger = logging.getLogger(__name__)
+
+# اندازه هر tile ورودی predict در backtest (حدود L2)
+_BACKTEST_TILE_BYTES = 256 * 1024
+
 
 @dataclass
 class MLAgentOutput:
@@ -40,6 +52,16 @@ class MLAgentOutput:
     metadata: Dict[str, Any]
 
 
+class _FeatureLayout(NamedTuple):
+    """layout ستون‌های df خروجی feature engineer (cache شده در MLAgent)"""
+    columns: pd.Index  # ستون‌های df
+    positions: np.ndarray  # موقعیت ستون‌های ورودی model در df
+    names: Tuple[str, ...]  # نام ستون‌های ورودی model
+    col_to_idx: Dict[str, int]  # ستون → index در df
+    selected: Optional[List[str]]  # selected_features زمان ساخت (مقایسه identity)
+    selection_enabled: bool  # enable_feature_selection زمان ساخت
+
+
 class MLAgent(BaseAgent):
     """
     ML Agent - Continuous Signal Generator
@@ -79,7 +101,11 @@ class MLAgent(BaseAgent):
         feature_selector: Optional[AdvancedFeatureSelector] = None,
         model: Optional[MLModel] = None,
         model_path: Optional[str] = None,
-        enable_feature_selection: bool = True
+        enable_feature_selection: bool = True,
+        confidence_threshold: float = 0.6,
+        use_onnx: bool = False,
+        use_treelite: bool = False,
+        verbose: bool = True
     ):
         """
         Args:
@@ -88,12 +114,20 @@ class MLAgent(BaseAgent):
             model: MLModel instance (اختیاری، default: Ensemble)
             model_path: مسیر برای save/load model
             enable_feature_selection: فعال‌سازی feature selection اتوماتیک
+            confidence_threshold: حداقل confidence برای high-confidence trades در backtest
+            use_onnx: inference با ONNX Runtime (اگر نصب باشد)
+            use_treelite: inference با model کامپایل‌شده Treelite (اگر نصب باشد؛
+                با tl2cgen یک shared library با gcc ساخته می‌شود)
+            verbose: چاپ گزارش backtest و مراحل feature selection
+                (گزارش train همیشه از logging است)
         """
         super().__init__(agent_type=AgentType.ML, name="ML Signal Generator")
         
         self.feature_engineer = feature_engineer or FeatureEngineer()
-        self.feature_selector = feature_selector or AdvancedFeatureSelector(n_features=25)
+        self.feature_selector = feature_selector or AdvancedFeatureSelector(n_features=25, verbose=verbose)
         self.enable_feature_selection = enable_feature_selection
+        self.confidence_threshold = confidence_threshold
+        self.verbose = verbose
         
         # اگر model داده نشد، Ensemble بساز
         if model is None:
@@ -107,9 +141,220 @@ class MLAgent(BaseAgent):
         self.model_path = model_path or "models/ml_agent_model.pkl"
         
         # آمار
-        self.training_history: List[Dict] = []
-        self.last_features: Optional[pd.DataFrame] = None
+        # ring buffer: فقط آخرین 64 train نگه داشته می‌شود (agent های long-running)
+        self.training_history: Deque[Dict] = deque(maxlen=64)
+        self.last_features = None
         self.selected_features: Optional[List[str]] = None
+        
+        # True بعد از train/load؛ تا آن موقع analyze() وضعیت model و فایل را چک می‌کند
+        self._model_loaded = False
+        
+        # predictor کامپایل‌شده (Treelite یا ONNX Runtime) برای analyze/backtest
+        # (lazy، بعد از train/load ساخته می‌شود)
+        self.use_onnx = use_onnx
+        self.use_treelite = use_treelite
+        self._compiled_predictor = None
+        self._compiled_checked = False
+        
+        # feature importance مرتب‌شده (lazy، بعد از train/load ساخته می‌شود)
+        self._importance: Optional[tuple] = None
+        
+        # cache layout ستون‌های df و buffer float32 ورودی model در analyze()
+        self._feature_layout: Optional[_FeatureLayout] = None
+        self._feat_buf: Optional[np.ndarray] = None
+        
+        # features آخرین series دیده‌شده در analyze(): (key, df)
+        self._fe_state: Optional[tuple] = None
+    
+    @property
+    def model(self) -> MLModel:
+        return self._model
+    
+    @model.setter
+    def model(self, value: MLModel):
+        # predictor کامپایل‌شده، importance و layout مربوط به model قبلی هستند
+        self._model = value
+        self._model_loaded = False
+        self._reset_inference_cache()
+    
+    @property
+    def feature_engineer(self) -> FeatureEngineer:
+        return self._feature_engineer
+    
+    @feature_engineer.setter
+    def feature_engineer(self, value: FeatureEngineer):
+        # features cache شده را feature engineer قبلی ساخته است
+        self._feature_engineer = value
+        self._fe_state = None
+    
+    @property
+    def last_features(self) -> Optional[pd.DataFrame]:
+        """features آخرین analyze() به صورت DataFrame تک‌سطری (lazy ساخته می‌شود)"""
+        if self._last_features is None and self._last_feature_row is not None:
+            self._last_features = pd.DataFrame(
+                self._last_feature_row[np.newaxis, :],
+                columns=self._feature_layout.names
+            )
+        return self._last_features
+    
+    @last_features.setter
+    def last_features(self, value: Optional[pd.DataFrame]):
+        self._last_features = value
+        self._last_feature_row = None
+    
+    def _layout(self, df: pd.DataFrame) -> _FeatureLayout:
+        """
+        layout ستون‌های df خروجی feature engineer
+        
+        تا وقتی ستون‌های df، selected_features (همان list) و
+        enable_feature_selection عوض نشوند، نتیجه از cache برمی‌گردد
+        (به جای list comprehension روی همه ستون‌ها در هر analyze).
+        """
+        cached = self._feature_layout
+        # df تکراری از cache features همان Index را دارد → مقایسه identity کافی است
+        if (
+            cached is not None
+            and cached.selected is self.selected_features
+            and cached.selection_enabled == self.enable_feature_selection
+            and (cached.columns is df.columns or cached.columns.equals(df.columns))
+        ):
+            return cached
+        
+        feature_cols = tuple(df.columns[~df.columns.isin(_NON_FEATURE_COLS)])
+        
+        # اگر feature selection استفاده شده، فقط selected features را بگیر
+        if self.enable_feature_selection and self.selected_features:
+            # اطمینان از اینکه features موجود هستند
+            available_features = tuple(f for f in self.selected_features if f in df.columns)
+            if len(available_features) > 0:
+                feature_cols = available_features
+            else:
+                logger.warning("No selected features found in current data, using all features")
+        
+        self._feature_layout = _FeatureLayout(
+            columns=df.columns,
+            positions=df.columns.get_indexer(feature_cols),
+            names=feature_cols,
+            col_to_idx={col: i for i, col in enumerate(df.columns)},
+            selected=self.selected_features,
+            selection_enabled=self.enable_feature_selection
+        )
+        # buffer ثابت float32 برای row ورودی model (estimator ها بدون copy می‌خوانند)
+        if self._feat_buf is None or self._feat_buf.shape[1] != len(feature_cols):
+            self._feat_buf = np.empty((1, len(feature_cols)), dtype=np.float32)
+        return self._feature_layout
+    
+    @staticmethod
+    def _series_key(market_data: MarketData) -> tuple:
+        """
+        کلید series برای cache features
+        
+        شامل OHLCV کندل آخر است تا update شدن کندل در حال تشکیل (همان datetime)
+        هم cache را باطل کند. مستقیم از object های bar خوانده می‌شود (نه از
+        to_arrays که خودش cache است).
+        """
+        first, last = market_data.data[0], market_data.data[-1]
+        return (
+            len(market_data.data), first.datetime, last.datetime,
+            last.open, last.high, last.low, last.close, last.volume
+        )
+    
+    def _engineered_features(self, market_data: MarketData) -> pd.DataFrame:
+        """
+        features برای train/analyze/backtest_predictions با reuse بین call ها
+        
+        اگر series از آخرین call تغییر نکرده باشد (مثلاً backtest بعد از train روی
+        همان داده، explain_prediction یا چند consumer روی همان tick) همان df
+        برمی‌گردد (هیچ‌کدام df را تغییر نمی‌دهند)؛ با رسیدن کندل جدید
+        extract_features کامل اجرا می‌شود. به‌روزرسانی تک‌کندلی indicator ها
+        دقیق نیست: EMA/MACD، OBV/A-D/VPT (جمع تجمعی)، resample تایم‌فریم‌های
+        بالاتر و forward-fill همه به کل history وابسته‌اند و مقدارشان باید با
+        features زمان train یکی باشد.
+        """
+        key = self._series_key(market_data)
+        if self._fe_state is not None and self._fe_state[0] == key:
+            return self._fe_state[1]
+        
+        df = self.feature_engineer.extract_features(market_data)
+        self._fe_state = (key, df)
+        return df
+    
+    def _ensure_model_loaded(self):
+        """
+        قبل از اولین analyze: model آموزش‌دیده است یا از model_path load می‌شود
+        
+        بعد از آن _model_loaded کش می‌شود و analyze() دیگر stat فایل نمی‌کند.
+        """
+        if not self.model.is_trained:
+            # سعی کن model را load کنی
+            if Path(self.model_path).exists():
+                self.load_model()
+            else:
+                raise ValueError("Model not trained! Call train() first or provide a trained model path.")
+        self._model_loaded = True
+    
+    def _reset_inference_cache(self):
+        """بعد از train/load باید predictor، importance و layout ستون‌ها دوباره ساخته شوند"""
+        self._compiled_predictor = None
+        self._compiled_checked = False
+        self._importance = None
+        self._feature_layout = None
+        self._feat_buf = None
+        self.last_features = None
+    
+    def _artifact_dir(self, backend: str) -> Path:
+        """
+        پوشه فایل‌های کامپایل‌شده برای model فعلی
+        
+        نام پوشه hash محتوای model است، پس retrain یا add_estimators به پوشه
+        جدید می‌رود و library ای که قبلاً (در همین process یا agent دیگری)
+        load شده بازنویسی نمی‌شود.
+        """
+        model_path = Path(self.model_path)
+        return model_path.parent / f"{model_path.stem}_{backend}" / joblib.hash(self.model)
+    
+    def _predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """
+        predict_proba برای analyze() و backtest_predictions()
+        
+        با use_onnx=True از ONNX Runtime و با use_treelite=True از model
+        کامپایل‌شده Treelite استفاده می‌شود؛ در غیر این صورت (یا اگر export
+        ممکن نباشد) همان self.model.predict_proba
+        """
+        if not self._compiled_checked:
+            self._compiled_checked = True
+            if self.use_onnx or self.use_treelite:
+                backend = "ONNX" if self.use_onnx else "Treelite"
+                try:
+                    artifact_dir = self._artifact_dir(backend.lower())
+                    if self.use_onnx:
+                        self._compiled_predictor = _onnx.build_predictor(
+                            self.model, X.shape[1], artifact_dir
+                        )
+                    else:
+                        self._compiled_predictor = _treelite.build_predictor(
+                            self.model, artifact_dir
+                        )
+                except Exception as e:
+                    logger.warning("%s export failed (%s), using native predict", backend, e)
+                    self._compiled_predictor = None
+        
+        if self._compiled_predictor is not None:
+            return self._compiled_predictor.predict_proba(X)
+        return self.model.predict_proba(X)
+    
+    def _predict_labels(self, X: np.ndarray, proba: np.ndarray) -> np.ndarray:
+        """
+        label های batch با همان قاعده self.model.predict، از روی proba موجود
+        
+        soft voting: P(UP) >= 0.5؛ model تکی: argmax (tie → DOWN)؛
+        hard voting به رأی تک‌تک model ها نیاز دارد و predict صدا زده می‌شود
+        """
+        if isinstance(self.model, EnsembleModel):
+            if self.model.voting == 'hard':
+                return self.model.predict(X)
+            return proba[:, 1] >= 0.5
+        return proba[:, 1] > proba[:, 0]
     
     def load_model(self, path: Optional[str] = None):
         """
@@ -118,14 +363,12 @@ class MLAgent(BaseAgent):
         Args:
             path: مسیر model (اختیاری، default: self.model_path)
         """
-        import pickle
-        
         model_path = path or self.model_path
         
-        print(f"Loading model from {model_path}...")
+        logger.info("Loading model from %s...", model_path)
+        self._reset_inference_cache()
         
-        with open(model_path, 'rb') as f:
-            model_data = pickle.load(f)
+        model_data = _load_model_data(model_path)
         
         # Load model
         if isinstance(model_data, dict):
@@ -134,13 +377,15 @@ class MLAgent(BaseAgent):
             self.selected_features = model_data.get('selected_features')
             self.enable_feature_selection = model_data.get('enable_feature_selection', True)
             
-            print(f"✅ Model loaded")
-            print(f"   Selected features: {len(self.selected_features) if self.selected_features else 'None'}")
+            logger.info(
+                "Model loaded, selected features: %s",
+                len(self.selected_features) if self.selected_features else 'None'
+            )
         else:
             # Old format (just model)
             self.model = model_data
             self.selected_features = None
-            print(f"✅ Model loaded (old format - no selected features)")
+            logger.info("Model loaded (old format - no selected features)")
     
     def train(
         self,
@@ -159,74 +404,80 @@ class MLAgent(BaseAgent):
         Returns:
             Training metrics
         """
-        print(f"\n{'='*60}")
-        print(f"Training ML Agent")
-        print(f"{'='*60}")
-        print(f"Data: {len(market_data)} candles")
-        print(f"Validation split: {val_split:.1%}")
+        logger.info("Training ML Agent: %d candles, validation split %.1f%%", len(market_data), val_split * 100)
         
         # Feature extraction
-        print(f"\nExtracting features...")
-        df = self.feature_engineer.extract_features(market_data)
+        logger.info("Extracting features...")
+        df = self._engineered_features(market_data)
         
-        print(f"Features extracted: {len(df)} samples, {len(df.columns)-2} features")
+        logger.info("Features extracted: %d samples, %d features", len(df), len(df.columns) - 2)
         
         # Split features and target
-        feature_cols = [col for col in df.columns if col not in ['target', 'target_return', 'future_close']]
+        feature_cols = df.columns[~df.columns.isin(_NON_FEATURE_COLS)]
         X = df[feature_cols]
         y = df['target']
         
         # Feature Selection
         if self.enable_feature_selection:
-            print(f"\nPerforming feature selection...")
+            logger.info("Performing feature selection...")
             X_selected = self.feature_selector.select_features(X, y, method='combined')
             self.selected_features = list(X_selected.columns)
             
             # Get selection report
             selection_report = self.feature_selector.get_selection_report()
-            print(f"Selected {len(self.selected_features)} features out of {len(X.columns)}")
-            print(f"Top features: {[f[0] for f in selection_report.get('top_features', [])[:5]]}")
+            logger.info("Selected %d features out of %d", len(self.selected_features), len(X.columns))
+            logger.info("Top features: %s", [f[0] for f in selection_report.get('top_features', [])[:5]])
             
             X = X_selected
         else:
             self.selected_features = list(X.columns)
         
-        # Train/Val split
-        split_idx = int(len(X) * (1 - val_split))
+        # X یک بار به آرایه float32 و C-contiguous تبدیل می‌شود (نه جداگانه در هر
+        # model) و target همان int8 خروجی feature engineer می‌ماند
+        X_np = _as_float32(X)
+        y_np = y.to_numpy(dtype=np.int8)
+        
+        # Train/Val split: view های همان آرایه (بدون copy)؛ DataFrame فقط برای نام
+        # ستون‌ها (feature importance) دور view پیچیده می‌شود و models هم بدون copy
+        # آن را به float32 می‌خوانند
+        split_idx = int(len(X_np) * (1 - val_split))
         
-        X_train = X.iloc[:split_idx]
-        y_train = y.iloc[:split_idx]
-        X_val = X.iloc[split_idx:]
-        y_val = y.iloc[split_idx:]
+        X_train = pd.DataFrame(X_np[:split_idx], columns=X.columns, copy=False)
+        y_train = y_np[:split_idx]
+        X_val = pd.DataFrame(X_np[split_idx:], columns=X.columns, copy=False)
+        y_val = y_np[split_idx:]
         
-        print(f"\nTrain samples: {len(X_train)}")
-        print(f"Validation samples: {len(X_val)}")
-        print(f"Class distribution (train): UP={sum(y_train)}, DOWN={len(y_train)-sum(y_train)}")
+        n_up = int(y_train.sum())
+        logger.info("Train samples: %d, validation samples: %d", len(X_train), len(X_val))
+        logger.info("Class distribution (train): UP=%d, DOWN=%d", n_up, len(y_train) - n_up)
         
         # Train model
-        print(f"\nTraining {self.model.name} model...")
+        logger.info("Training %s model...", self.model.name)
         metrics = self.model.train(X_train, y_train, X_val, y_val)
-        
-        # نمایش metrics
-        print(f"\n{'='*60}")
-        print(f"Training Results:")
-        print(f"{'='*60}")
-        
-        for key, value in metrics.items():
-            if isinstance(value, dict):
-                print(f"\n{key}:")
-                for k, v in value.items():
-                    print(f"  {k}: {v:.4f}")
-            else:
-                print(f"{key}: {value:.4f}")
-        
-        # Feature importance
-        importance = self.model.get_feature_importance()
-        if importance:
-            print(f"\nTop 10 Important Features:")
-            sorted_importance = sorted(importance.items(), key=lambda x: x[1], reverse=True)
-            for i, (feature, score) in enumerate(sorted_importance[:10], 1):
-                print(f"  {i}. {feature}: {score:.4f}")
+        self._reset_inference_cache()
+        self._model_loaded = True
+        
+        # موقعیت ستون‌های selected در df از همین حالا ثابت می‌شود
+        # (analyze/backtest روی همین layout فقط index integer می‌گیرند)
+        self._layout(df)
+        
+        # نمایش metrics و feature importance (فقط اگر سطح INFO فعال باشد)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Training Results:")
+            for key, value in metrics.items():
+                if isinstance(value, dict):
+                    logger.info("%s:", key)
+                    for k, v in value.items():
+                        logger.info("  %s: %.4f", k, v)
+                else:
+                    logger.info("%s: %.4f", key, value)
+            
+            # Feature importance
+            importance = self.get_feature_importance(top_n=10)
+            if importance:
+                logger.info("Top 10 Important Features:")
+                for i, (feature, score) in enumerate(importance.items(), 1):
+                    logger.info("  %d. %s: %.4f", i, feature, score)
         
         # ذخیره history
         self.training_history.append({
@@ -237,7 +488,7 @@ class MLAgent(BaseAgent):
         
         # Save model + selected features
         if save_model:
-            print(f"\nSaving model to {self.model_path}...")
+            logger.info("Saving model to %s...", self.model_path)
             
             # Save model data
             model_data = {
@@ -245,19 +496,46 @@ class MLAgent(BaseAgent):
                 'selected_features': self.selected_features,  # ✅ ذخیره selected features
                 'enable_feature_selection': self.enable_feature_selection
             }
+            _dump_model_data(model_data, self.model_path)
             
-            import pickle
-            Path(self.model_path).parent.mkdir(parents=True, exist_ok=True)
-            with open(self.model_path, 'wb') as f:
-                pickle.dump(model_data, f)
-            
-            print(f"Model saved successfully!")
-            print(f"Selected features: {len(self.selected_features) if self.selected_features else 'None'}")
-        
-        print(f"{'='*60}\n")
+            logger.info(
+                "Model saved successfully! Selected features: %s",
+                len(self.selected_features) if self.selected_features else 'None'
+            )
         
         return metrics
     
+    def add_estimators(self, market_data: MarketData, n_estimators: int = 10):
+        """
+        ادامه training model فعلی روی market_data با n_estimators درخت/round جدید
+        
+        برای retrain در walk-forward: به جای train کامل (و feature selection دوباره)
+        فقط درخت‌های جدید روی پنجره جدید fit می‌شوند؛ features همان selected
+        features قبلی هستند. model ذخیره نمی‌شود.
+        
+        Args:
+            market_data: داده پنجره جدید
+            n_estimators: تعداد درخت (RandomForest) یا boosting round (XGBoost) جدید
+        """
+        self._ensure_model_loaded()
+        
+        df = self._engineered_features(market_data)
+        layout = self._layout(df)
+        X = pd.DataFrame(
+            _as_float32(df.iloc[:, layout.positions]),
+            columns=list(layout.names),
+            copy=False
+        )
+        y = df['target'].to_numpy(dtype=np.int8)
+        
+        logger.info("Adding %d estimators on %d samples...", n_estimators, len(X))
+        try:
+            self.model.add_estimators(n_estimators, X, y)
+        finally:
+            # predictor کامپایل‌شده و importance مربوط به model قبلی هستند
+            # (حتی اگر fit وسط کار خطا بدهد)
+            self._reset_inference_cache()
+    
     def analyze(self, market_data: MarketData) -> MLAgentOutput:
         """
         تولید سیگنال‌های مداوم از market data
@@ -272,78 +550,63 @@ class MLAgent(BaseAgent):
             - volatility: نوسان
             - momentum: مومنتوم
         """
-        if not self.model.is_trained:
-            # سعی کن model را load کنی
-            if Path(self.model_path).exists():
-                print(f"Loading model from {self.model_path}...")
-                self.model.load(self.model_path)
-            else:
-                raise ValueError("Model not trained! Call train() first or provide a trained model path.")
-        
-        # Feature extraction
-        df = self.feature_engineer.extract_features(market_data)
+        if not self._model_loaded:
+            self._ensure_model_loaded()
         
-        # آخرین row (current state)
-        feature_cols = [col for col in df.columns if col not in ['target', 'target_return', 'future_close']]
-        current_features = df[feature_cols].iloc[[-1]]
+        # Feature extraction (reuse اگر series تغییر نکرده باشد)
+        df = self._engineered_features(market_data)
         
-        # اگر feature selection استفاده شده، فقط selected features را بگیر
-        if self.enable_feature_selection and self.selected_features:
-            # اطمینان از اینکه features موجود هستند
-            available_features = [f for f in self.selected_features if f in current_features.columns]
-            if len(available_features) > 0:
-                current_features = current_features[available_features]
-            else:
-                print("⚠️ Warning: No selected features found in current data, using all features")
+        # آخرین row (current state) یک بار به numpy
+        layout = self._layout(df)
+        last = df.iloc[-1].to_numpy(dtype=np.float64)
+        # کندل آخر از آرایه‌های ستونی MarketData (همان که feature engineer خوانده)
+        arrays = market_data.to_arrays()
+        current_price = float(arrays['close'][-1])
         
-        self.last_features = current_features
+        # فقط ستون‌های ورودی model (موقعیت‌های integer ثابت)، در buffer float32
+        feature_row = last[layout.positions]
+        self._feat_buf[0, :] = feature_row
+        self.last_features = None
+        self._last_feature_row = feature_row
         
         # ========================================
         # 1️⃣ Probability Prediction (نه Classification!)
         # ========================================
-        proba = self.model.predict_proba(current_features)[0]  # [P(DOWN), P(UP)]
+        proba = self._predict_proba(self._feat_buf)[0]  # [P(DOWN), P(UP)]
         
         prob_down = float(proba[0])
         prob_up = float(proba[1])
         
         # ========================================
         # 2️⃣ Trend Strength از features
-        # ========================================
-        # استفاده از ADX یا SMA slopes
-        if 'adx_14' in df.columns:
-            trend_strength = float(min(df['adx_14'].iloc[-1] / 100.0, 1.0))
-        else:
-            # fallback: از تفاوت SMA‌ها
-            if 'sma_20' in df.columns and 'sma_50' in df.columns:
-                sma_diff = abs(df['sma_20'].iloc[-1] - df['sma_50'].iloc[-1])
-                sma_avg = (df['sma_20'].iloc[-1] + df['sma_50'].iloc[-1]) / 2
-                trend_strength = float(min(sma_diff / sma_avg, 1.0))
-            else:
-                trend_strength = 0.5  # default
-        
-        # ========================================
         # 3️⃣ Volatility از ATR
+        # 4️⃣ Momentum = (prob_up - prob_down) * trend_strength
+        #    محدوده: -1 (strong down) تا +1 (strong up)
         # ========================================
-        if 'atr_14' in df.columns:
-            current_price = float(market_data.data[-1].close)
-            atr = float(df['atr_14'].iloc[-1])
-            volatility = float(min(atr / current_price * 10, 1.0))  # normalize
-        else:
-            volatility = 0.5  # default
-        
-        # ========================================
-        # 4️⃣ Momentum
-        # ========================================
-        # Momentum = (prob_up - prob_down) * trend_strength
-        # محدوده: -1 (strong down) تا +1 (strong up)
-        momentum = float((prob_up - prob_down) * trend_strength)
+        # indicator ها با index از row numpy خوانده می‌شوند؛ نبودن ستون = NaN
+        # (trend از ADX یا در نبود آن از تفاوت SMA‌ها، default ها 0.5)
+        col_to_idx = layout.col_to_idx
+        
+        def indicator(name: str) -> np.float64:
+            idx = col_to_idx.get(name)
+            return last[idx] if idx is not None else np.float64(np.nan)
+        
+        trend_strength, volatility, momentum = (float(v) for v in signal_postprocess(
+            indicator('adx_14'),
+            indicator('sma_20'),
+            indicator('sma_50'),
+            indicator('atr_14'),
+            current_price,
+            prob_up,
+            prob_down
+        ))
         
         # Metadata
         metadata = {
             'model': self.model.name,
-            'current_price': float(market_data.data[-1].close),
-            'timestamp': market_data.data[-1].datetime.isoformat(),
-            'features_used': list(current_features.columns),
+            'current_price': current_price,
+            'timestamp': arrays['datetime'][-1].isoformat(),
+            'features_used': list(layout.names),
             'raw_prediction': int(1 if prob_up > prob_down else 0)  # برای reference
         }
         
@@ -363,27 +626,31 @@ class MLAgent(BaseAgent):
         if not Path(model_path).exists():
             raise FileNotFoundError(f"Model file not found: {model_path}")
         
-        print(f"Loading model from {model_path}...")
+        logger.info("Loading model from %s...", model_path)
+        self._reset_inference_cache()
         
         # ✅ بارگذاری با selected_features
-        with open(model_path, 'rb') as f:
-            model_data = pickle.load(f)
+        model_data = _load_model_data(model_path)
         
         # Restore model
         if isinstance(model_data, dict):
             self.model = model_data['model']
             self.selected_features = model_data.get('selected_features')
-            print(f"✅ Model loaded with {len(self.selected_features) if self.selected_features else 'all'} features")
+            logger.info(
+                "Model loaded with %s features",
+                len(self.selected_features) if self.selected_features else 'all'
+            )
         else:
             # Old format compatibility
             self.model = model_data
-            print(f"⚠️  Old model format loaded (no selected_features)")
+            logger.warning("Old model format loaded (no selected_features)")
         
         # Ensure trained flag
         if hasattr(self.model, 'is_trained'):
             self.model.is_trained = True
         
-        print(f"Model loaded successfully!")
+        self._model_loaded = True
+        logger.info("Model loaded successfully!")
     
     def get_feature_importance(self, top_n: int = 20) -> Dict[str, float]:
         """
@@ -398,10 +665,17 @@ class MLAgent(BaseAgent):
         if not self.model.is_trained:
             return {}
         
-        importance = self.model.get_feature_importance()
-        sorted_importance = sorted(importance.items(), key=lambda x: x[1], reverse=True)
-        
-        return dict(sorted_importance[:top_n])
+        # (names, scores, ترتیب نزولی) یک بار بعد از train/load ساخته می‌شود
+        if self._importance is None:
+            importance = self.model.get_feature_importance()
+            scores = np.fromiter(importance.values(), dtype=np.float64, count=len(importance))
+            # stable: ترتیب features هم‌امتیاز مثل sorted(..., reverse=True) حفظ می‌شود
+            order = np.argsort(-scores, kind='stable')
+            self._importance = (list(importance), scores, order)
+        
+        names, scores, order = self._importance
+        top = order[:top_n]
+        return dict(zip([names[i] for i in top], scores[top].tolist()))
     
     def explain_prediction(self, market_data: MarketData) -> Dict[str, Any]:
         """
@@ -454,51 +728,50 @@ class MLAgent(BaseAgent):
         Returns:
             Backtest results با accuracy و metrics
         """
-        print(f"\n{'='*60}")
-        print(f"Backtesting ML Predictions")
-        print(f"{'='*60}")
-        
-        predictions = []
-        actuals = []
-        confidences = []
-        
-        # استخراج features یک بار
-        df = self.feature_engineer.extract_features(market_data)
-        feature_cols = [col for col in df.columns if col not in ['target', 'target_return', 'future_close']]
-        
-        # Simulate rolling predictions
-        for i in range(window_size, len(df)):
-            X = df[feature_cols].iloc[[i]]
-            y_true = df['target'].iloc[i]
-            
-            pred = self.model.predict(X)[0]
-            proba = self.model.predict_proba(X)[0]
-            conf = proba[1] if pred == 1 else proba[0]
-            
-            predictions.append(pred)
-            actuals.append(y_true)
-            confidences.append(conf)
-        
-        predictions = np.array(predictions)
-        actuals = np.array(actuals)
-        confidences = np.array(confidences)
-        
-        # محاسبه metrics
-        from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, confusion_matrix
-        
-        accuracy = accuracy_score(actuals, predictions)
-        precision = precision_score(actuals, predictions, zero_division=0)
-        recall = recall_score(actuals, predictions, zero_division=0)
-        f1 = f1_score(actuals, predictions, zero_division=0)
-        cm = confusion_matrix(actuals, predictions)
+        if self.verbose:
+            print(f"\n{'='*60}")
+            print(f"Backtesting ML Predictions")
+            print(f"{'='*60}")
+        
+        # استخراج features یک بار (یا reuse اگر همین series قبلاً دیده شده)
+        df = self._engineered_features(market_data)
+        
+        # predict_proba batched به جای یک call برای هر row
+        # (model روی selected features آموزش دیده)
+        X_all = df.iloc[window_size:, self._layout(df).positions].to_numpy(dtype=np.float32)
+        actuals = df['target'].iloc[window_size:].to_numpy(dtype=np.int8)
+        
+        # predict در tile های هم‌اندازه L2 (ورودی float32) تا درخت‌ها بین row ها در cache بمانند
+        # خروجی‌ها از قبل allocate می‌شوند و هر tile مستقیم در slice خودش نوشته می‌شود
+        n_rows, n_features = X_all.shape
+        tile = max(1, _BACKTEST_TILE_BYTES // (max(n_features, 1) * 4))
+        predictions = np.empty(n_rows, dtype=np.int8)
+        confidences = np.empty(n_rows, dtype=np.float64)
+        for start in range(0, n_rows, tile):
+            rows = slice(start, start + tile)
+            proba = self._predict_proba(X_all[rows])
+            up = self._predict_labels(X_all[rows], proba)
+            predictions[rows] = up
+            confidences[rows] = np.where(up, proba[:, 1], proba[:, 0])
+        
+        # محاسبه metrics: confusion matrix با یک bincount، بقیه از روی آن
+        cm = np.bincount(
+            2 * actuals.astype(np.int64) + predictions,
+            minlength=4
+        ).reshape(2, 2)
+        tn, fp, fn, tp = (int(v) for v in cm.ravel())
+        
+        accuracy = (tp + tn) / len(predictions) if len(predictions) else 0.0
+        precision = tp / (tp + fp) if tp + fp else 0.0
+        recall = tp / (tp + fn) if tp + fn else 0.0
+        f1 = 2 * tp / (2 * tp + fp + fn) if tp else 0.0
         
         # Trades based on confidence threshold
         high_conf_mask = confidences >= self.confidence_threshold
-        if high_conf_mask.sum() > 0:
-            high_conf_accuracy = accuracy_score(
-                actuals[high_conf_mask],
-                predictions[high_conf_mask]
-            )
+        if high_conf_mask.any():
+            high_conf_accuracy = float(np.mean(
+                actuals[high_conf_mask] == predictions[high_conf_mask]
+            ))
         else:
             high_conf_accuracy = 0
         
@@ -511,22 +784,23 @@ class MLAgent(BaseAgent):
             'confusion_matrix': cm.tolist(),
             'high_confidence_trades': int(high_conf_mask.sum()),
             'high_confidence_accuracy': high_conf_accuracy,
-            'avg_confidence': float(np.mean(confidences))
+            'avg_confidence': float(np.mean(confidences)) if n_rows else 0.0
         }
         
         # نمایش
-        print(f"\nBacktest Results:")
-        print(f"  Total Predictions: {results['total_predictions']}")
-        print(f"  Accuracy: {results['accuracy']:.2%}")
-        print(f"  Precision: {results['precision']:.2%}")
-        print(f"  Recall: {results['recall']:.2%}")
-        print(f"  F1 Score: {results['f1_score']:.2%}")
-        print(f"\nHigh Confidence Trades (>={self.confidence_threshold:.0%}):")
-        print(f"  Count: {results['high_confidence_trades']}")
-        print(f"  Accuracy: {results['high_confidence_accuracy']:.2%}")
-        print(f"\nConfusion Matrix:")
-        print(f"  [[TN={cm[0,0]}, FP={cm[0,1]}]")
-        print(f"   [FN={cm[1,0]}, TP={cm[1,1]}]]")
-        print(f"{'='*60}\n")
+        if self.verbose:
+            print(f"\nBacktest Results:")
+            print(f"  Total Predictions: {results['total_predictions']}")
+            print(f"  Accuracy: {results['accuracy']:.2%}")
+            print(f"  Precision: {results['precision']:.2%}")
+            print(f"  Recall: {results['recall']:.2%}")
+            print(f"  F1 Score: {results['f1_score']:.2%}")
+            print(f"\nHigh Confidence Trades (>={self.confidence_threshold:.0%}):")
+            print(f"  Count: {results['high_confidence_trades']}")
+            print(f"  Accuracy: {results['high_confidence_accuracy']:.2%}")
+            print(f"\nConfusion Matrix:")
+            print(f"  [[TN={cm[0,0]}, FP={cm[0,1]}]")
+            print(f"   [FN={cm[1,0]}, TP={cm[1,1]}]]")
+            print(f"{'='*60}\n")
         
         return results
@@ -4,14 +4,117 @@ ML Models for price prediction
 """
 
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from typing import Dict, Any, Tuple, Optional
 import numpy as np
 import pandas as pd
+import joblib
+from joblib import Parallel, delayed
 from datetime import datetime
-import pickle
+import os
 import json
+import logging
 from pathlib import Path
 
+from agents.ml._kernels import soft_vote
+
+logger = logging.getLogger(__name__)
+
+
+def _as_float32(X) -> np.ndarray:
+    """
+    ورودی estimator ها: آرایه float32 و C-contiguous
+    
+    RandomForest و XGBoost هر دو داخلی روی float32 کار می‌کنند؛ اگر ورودی از قبل
+    float32 باشد (مثل buffer تک‌سطری MLAgent) هیچ copy ای انجام نمی‌شود.
+    estimator ها بدون feature names fit می‌شوند تا DataFrame و ndarray هر دو
+    بدون warning قابل predict باشند (ترتیب ستون‌ها با caller است).
+    """
+    return np.ascontiguousarray(X, dtype=np.float32)
+
+
+def _hist_gain_importances(model, n_features: int) -> np.ndarray:
+    """
+    Feature importance یک HistGradientBoostingClassifier آموزش‌دیده بر اساس
+    مجموع gain split ها (نرمال‌شده، مثل feature_importances_ در RandomForest)
+    
+    sklearn برای HistGradientBoosting خاصیت feature_importances_ ندارد؛ gain ها از
+    node های درخت‌های fit شده خوانده می‌شوند (بدون permutation و predict اضافه).
+    """
+    gains = np.zeros(n_features, dtype=np.float64)
+    for iteration in model._predictors:
+        for predictor in iteration:
+            nodes = predictor.nodes[~predictor.nodes['is_leaf'].astype(bool)]
+            gains += np.bincount(
+                nodes['feature_idx'], weights=nodes['gain'], minlength=n_features
+            )
+    
+    total = gains.sum()
+    return gains / total if total > 0 else gains
+
+
+# فشرده‌سازی فایل model ها: lz4 (decompress سریع‌تر از خواندن خام دیسک) اگر نصب
+# باشد، وگرنه zlib که همیشه در دسترس است
+try:
+    import lz4  # noqa: F401
+    _COMPRESS = ('lz4', 3)
+except ImportError:  # pragma: no cover - depends on environment
+    _COMPRESS = ('zlib', 3)
+
+
+def _dump_model_data(model_data: Dict[str, Any], path: str):
+    """ذخیره model_data با joblib (فشرده؛ آرایه‌های numpy درخت‌ها به صورت باینری خام)"""
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    joblib.dump(model_data, path, compress=_COMPRESS)
+
+
+def _load_model_data(path: str) -> Any:
+    """بارگذاری model_data (فایل‌های joblib و همچنین pickle قدیمی)"""
+    return joblib.load(path)
+
+
+@lru_cache(maxsize=None)
+def _cuda_available() -> bool:
+    """
+    آیا XGBoost می‌تواند روی GPU (CUDA) train کند؟
+    
+    build خود xgboost باید با CUDA باشد و حداقل یک device دیده شود
+    (از طریق cupy یا torch، هر کدام که نصب باشد).
+    """
+    try:
+        import xgboost as xgb
+        if not xgb.build_info().get('USE_CUDA'):
+            return False
+    except Exception:
+        return False
+    
+    try:
+        import cupy
+        return cupy.cuda.runtime.getDeviceCount() > 0
+    except Exception:
+        pass
+    try:
+        import torch
+        return torch.cuda.is_available()
+    except Exception:
+        return False
+
+
+# Thread pool مشترک برای predict موازی اعضای ensemble (lazy ساخته می‌شود)
+_PREDICT_POOL: Optional[ThreadPoolExecutor] = None
+
+
+def _predict_pool() -> ThreadPoolExecutor:
+    """
+    RandomForest و XGBoost در predict GIL را آزاد می‌کنند، پس thread کافی است
+    (بدون pickle کردن model ها مثل process pool).
+    """
+    global _PREDICT_POOL
+    if _PREDICT_POOL is None:
+        _PREDICT_POOL = ThreadPoolExecutor(max_workers=2, thread_name_prefix="ensemble-predict")
+    return _PREDICT_POOL
+
 
 class MLModel(ABC):
     """
@@ -56,15 +159,11 @@ class MLModel(ABC):
             'training_metrics': self.training_metrics
         }
         
-        Path(path).parent.mkdir(parents=True, exist_ok=True)
-        
-        with open(path, 'wb') as f:
-            pickle.dump(model_data, f)
+        _dump_model_data(model_data, path)
     
     def load(self, path: str):
         """بارگذاری model"""
-        with open(path, 'rb') as f:
-            model_data = pickle.load(f)
+        model_data = _load_model_data(path)
         
         self.name = model_data['name']
         self.model = model_data['model']
@@ -75,6 +174,20 @@ class MLModel(ABC):
     def get_feature_importance(self) -> Dict[str, float]:
         """Feature importance"""
         return self.feature_importance or {}
+    
+    def add_estimators(self, n: int, X: pd.DataFrame, y: pd.Series):
+        """
+        ادامه training با n درخت/round جدید روی (X, y) به جای fit از صفر
+        (مثلاً retrain در walk-forward)
+        """
+        self._check_add_estimators()
+    
+    def _check_add_estimators(self):
+        """قبل از هر تغییری: TypeError اگر model پشتیبانی نکند، ValueError اگر train نشده"""
+        if type(self).add_estimators is MLModel.add_estimators:
+            raise TypeError(f"{self.name} does not support incremental training")
+        if not self.is_trained:
+            raise ValueError("Model not trained yet!")
 
 
 class RandomForestModel(MLModel):
@@ -91,7 +204,8 @@ class RandomForestModel(MLModel):
         min_samples_leaf: int = 1,
         max_features: str = 'sqrt',  # ✅ Changed from 'auto' to 'sqrt'
         class_weight: Optional[Dict[int, float]] = None,
-        random_state: int = 42
+        random_state: int = 42,
+        n_jobs: int = -1
     ):
         super().__init__("RandomForest")
         self.n_estimators = n_estimators
@@ -101,6 +215,7 @@ class RandomForestModel(MLModel):
         self.max_features = max_features
         self.class_weight = class_weight
         self.random_state = random_state
+        self.n_jobs = n_jobs
     
     def train(
         self,
@@ -122,11 +237,12 @@ class RandomForestModel(MLModel):
             max_features=self.max_features,
             class_weight=self.class_weight,
             random_state=self.random_state,
-            n_jobs=-1
+            n_jobs=self.n_jobs,
+            warm_start=True  # add_estimators فقط درخت‌های جدید را fit می‌کند
         )
         
         # Train
-        self.model.fit(X_train, y_train)
+        self.model.fit(_as_float32(X_train), y_train)
         self.is_trained = True
         
         # Feature importance
@@ -155,17 +271,146 @@ class RandomForestModel(MLModel):
         
         return metrics
     
+    def add_estimators(self, n: int, X: pd.DataFrame, y: pd.Series):
+        """
+        n درخت جدید روی (X, y) به forest اضافه می‌شود (warm_start)؛
+        درخت‌های قبلی دست نمی‌خورند
+        """
+        self._check_add_estimators()
+        
+        self.model.set_params(n_estimators=self.model.n_estimators + n)
+        self.model.fit(_as_float32(X), y)
+        
+        self.feature_importance = dict(zip(
+            X.columns,
+            self.model.feature_importances_
+        ))
+    
+    def predict(self, X: pd.DataFrame) -> np.ndarray:
+        """Predict class (0 or 1)"""
+        if not self.is_trained:
+            raise ValueError("Model not trained yet!")
+        return self.model.predict(_as_float32(X))
+    
+    def predict_proba(self, X: pd.DataFrame) -> np.ndarray:
+        """Predict probabilities [P(class=0), P(class=1)]"""
+        if not self.is_trained:
+            raise ValueError("Model not trained yet!")
+        return self.model.predict_proba(_as_float32(X))
+
+
+class HistRandomForestModel(MLModel):
+    """
+    Histogram-based Gradient Boosting (sklearn HistGradientBoostingClassifier)
+    جایگزین سریع‌تر Random Forest برای داده‌های بزرگ
+    
+    features در حداکثر 255 bin (uint8) گسسته می‌شوند و split ها با جمع histogram
+    پیدا می‌شوند (نه sort مقادیر در هر node)؛ هم حافظه کمتر و هم training سریع‌تر.
+    """
+    
+    def __init__(
+        self,
+        max_iter: int = 100,
+        max_depth: Optional[int] = 10,
+        learning_rate: float = 0.1,
+        max_bins: int = 255,
+        min_samples_leaf: int = 20,
+        early_stopping: bool = True,
+        class_weight: Optional[Dict[int, float]] = None,
+        random_state: int = 42
+    ):
+        super().__init__("HistGradientBoosting")
+        self.max_iter = max_iter
+        self.max_depth = max_depth
+        self.learning_rate = learning_rate
+        self.max_bins = max_bins
+        self.min_samples_leaf = min_samples_leaf
+        self.early_stopping = early_stopping
+        self.class_weight = class_weight
+        self.random_state = random_state
+    
+    def train(
+        self,
+        X_train: pd.DataFrame,
+        y_train: pd.Series,
+        X_val: Optional[pd.DataFrame] = None,
+        y_val: Optional[pd.Series] = None
+    ) -> Dict[str, float]:
+        """Train HistGradientBoosting"""
+        from sklearn.ensemble import HistGradientBoostingClassifier
+        from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score
+        
+        # ساخت model
+        # early stopping روی بخش داخلی train (validation_fraction) انجام می‌شود تا
+        # val metrics روی داده‌ای باشد که در انتخاب تعداد iteration ها دخالت نداشته
+        self.model = HistGradientBoostingClassifier(
+            max_iter=self.max_iter,
+            max_depth=self.max_depth,
+            learning_rate=self.learning_rate,
+            max_bins=self.max_bins,
+            min_samples_leaf=self.min_samples_leaf,
+            early_stopping=self.early_stopping,
+            class_weight=self.class_weight,
+            random_state=self.random_state
+        )
+        
+        # Train
+        self.model.fit(_as_float32(X_train), y_train)
+        self.is_trained = True
+        
+        # Feature importance
+        self.feature_importance = dict(zip(
+            X_train.columns,
+            _hist_gain_importances(self.model, X_train.shape[1])
+        ))
+        
+        # Validation metrics
+        metrics = {}
+        
+        if X_val is not None and y_val is not None:
+            y_pred = self.predict(X_val)
+            
+            metrics['val_accuracy'] = accuracy_score(y_val, y_pred)
+            metrics['val_precision'] = precision_score(y_val, y_pred, zero_division=0)
+            metrics['val_recall'] = recall_score(y_val, y_pred, zero_division=0)
+            metrics['val_f1'] = f1_score(y_val, y_pred, zero_division=0)
+        
+        # Training metrics
+        y_train_pred = self.predict(X_train)
+        metrics['train_accuracy'] = accuracy_score(y_train, y_train_pred)
+        
+        self.training_metrics = metrics
+        
+        return metrics
+    
+    def add_estimators(self, n: int, X: pd.DataFrame, y: pd.Series):
+        """
+        n iteration جدید روی (X, y) با warm_start؛ درخت‌های قبلی دست نمی‌خورند
+        (با early stopping ممکن است زودتر متوقف شود)
+        """
+        self._check_add_estimators()
+        
+        # max_iter از تعداد iteration های واقعی (n_iter_) حساب می‌شود، نه max_iter
+        # قبلی که با early stopping ممکن است بیشتر باشد
+        self.model.set_params(warm_start=True, max_iter=self.model.n_iter_ + n)
+        self.model.fit(_as_float32(X), y)
+        
+        self.feature_importance = dict(zip(
+            X.columns,
+            _hist_gain_importances(self.model, X.shape[1])
+        ))
+    
     def predict(self, X: pd.DataFrame) -> np.ndarray:
         """Predict class (0 or 1)"""
         if not self.is_trained:
             raise ValueError("Model not trained yet!")
-        return self.model.predict(X)
+        return self.model.predict(_as_float32(X))
     
     def predict_proba(self, X: pd.DataFrame) -> np.ndarray:
         """Predict probabilities [P(class=0), P(class=1)]"""
         if not self.is_trained:
             raise ValueError("Model not trained yet!")
-        return self.model.predict_proba(X)
+        return self.model.predict_proba(_as_float32(X))
 
 
 class XGBoostModel(MLModel):
@@ -179,13 +424,22 @@ class XGBoostModel(MLModel):
         n_estimators: int = 100,
         max_depth: int = 6,
         learning_rate: float = 0.1,
-        random_state: int = 42
+        random_state: int = 42,
+        device: str = "auto",
+        n_jobs: Optional[int] = None
     ):
+        """
+        Args:
+            device: 'auto' (اگر GPU در دسترس باشد cuda، وگرنه cpu)، 'cuda' یا 'cpu'
+            n_jobs: تعداد thread های XGBoost (None = پیش‌فرض xgboost، همه هسته‌ها)
+        """
         super().__init__("XGBoost")
         self.n_estimators = n_estimators
         self.max_depth = max_depth
         self.learning_rate = learning_rate
         self.random_state = random_state
+        self.device = device
+        self.n_jobs = n_jobs
     
     def train(
         self,
@@ -201,26 +455,25 @@ class XGBoostModel(MLModel):
         except ImportError:
             raise ImportError("xgboost not installed. Run: pip install xgboost")
         
-        # ساخت model
-        self.model = xgb.XGBClassifier(
-            n_estimators=self.n_estimators,
-            max_depth=self.max_depth,
-            learning_rate=self.learning_rate,
-            random_state=self.random_state,
-            use_label_encoder=False,
-            eval_metric='logloss'
-        )
+        device = self.device
+        if device == "auto":
+            device = "cuda" if _cuda_available() else "cpu"
         
-        # Train با early stopping
-        eval_set = [(X_train, y_train)]
-        if X_val is not None and y_val is not None:
-            eval_set.append((X_val, y_val))
+        X_train_arr = _as_float32(X_train)
+        X_val_arr = _as_float32(X_val) if X_val is not None and y_val is not None else None
         
-        self.model.fit(
-            X_train, y_train,
-            eval_set=eval_set,
-            verbose=False
-        )
+        try:
+            self._fit(xgb, device, X_train_arr, y_train, X_val_arr, y_val)
+        except Exception:
+            if device == "cpu":
+                raise
+            # GPU در دسترس نیست یا خطا داد → همان training روی CPU
+            device = "cpu"
+            self._fit(xgb, device, X_train_arr, y_train, X_val_arr, y_val)
+        
+        if device != "cpu":
+            # predict (مخصوصاً تک‌سطری در analyze) روی CPU و NumPy می‌ماند
+            self.model.set_params(device="cpu")
         
         self.is_trained = True
         
@@ -248,17 +501,106 @@ class XGBoostModel(MLModel):
         
         return metrics
     
+    def _fit(self, xgb, device: str, X_train: np.ndarray, y_train, X_val: Optional[np.ndarray], y_val):
+        """ساخت و fit کردن XGBClassifier روی device"""
+        # ساخت model
+        self.model = xgb.XGBClassifier(
+            n_estimators=self.n_estimators,
+            max_depth=self.max_depth,
+            learning_rate=self.learning_rate,
+            random_state=self.random_state,
+            tree_method='hist',
+            device=device,
+            n_jobs=self.n_jobs,
+            use_label_encoder=False,
+            eval_metric='logloss'
+        )
+        
+        if device != "cpu":
+            # داده مستقیم روی GPU (بدون copy ضمنی host → device در هر iteration)
+            import cupy
+            X_train = cupy.asarray(X_train)
+            if X_val is not None:
+                X_val = cupy.asarray(X_val)
+        
+        # Train با early stopping
+        eval_set = [(X_train, y_train)]
+        if X_val is not None:
+            eval_set.append((X_val, y_val))
+        
+        self.model.fit(
+            X_train, y_train,
+            eval_set=eval_set,
+            verbose=False
+        )
+    
+    def add_estimators(self, n: int, X: pd.DataFrame, y: pd.Series):
+        """
+        n boosting round جدید روی (X, y)، ادامه از booster فعلی (xgb_model)
+        """
+        self._check_add_estimators()
+        
+        booster = self.model.get_booster()
+        self.model.set_params(n_estimators=n)
+        self.model.fit(_as_float32(X), y, xgb_model=booster, verbose=False)
+        # n_estimators دوباره تعداد کل round ها
+        self.model.set_params(n_estimators=self.model.get_booster().num_boosted_rounds())
+        
+        self.feature_importance = dict(zip(
+            X.columns,
+            self.model.feature_importances_
+        ))
+    
     def predict(self, X: pd.DataFrame) -> np.ndarray:
         """Predict class"""
         if not self.is_trained:
             raise ValueError("Model not trained yet!")
-        return self.model.predict(X)
+        return self.model.predict(_as_float32(X))
     
     def predict_proba(self, X: pd.DataFrame) -> np.ndarray:
-        """Predict probabilities"""
+        """
+        Predict probabilities
+        
+        مستقیم با booster.inplace_predict (بدون wrapper sklearn و validation آن)؛
+        برای predict تک‌سطری در analyze() بیشتر latency همین overhead است.
+        """
         if not self.is_trained:
             raise ValueError("Model not trained yet!")
-        return self.model.predict_proba(X)
+        
+        proba = self.model.get_booster().inplace_predict(_as_float32(X))
+        if proba.ndim == 1:
+            # binary:logistic فقط P(class=1) را برمی‌گرداند
+            return np.column_stack([1.0 - proba, proba])
+        return proba
+
+
+def _fit_one(
+    model: MLModel,
+    n_jobs: Optional[int],
+    X_train: pd.DataFrame,
+    y_train: pd.Series,
+    X_val: Optional[pd.DataFrame],
+    y_val: Optional[pd.Series]
+) -> Dict[str, float]:
+    """
+    Train یک عضو ensemble
+    
+    n_jobs سقف thread های RandomForest/XGBoost فقط در همین fit است (None = بدون
+    تغییر)؛ بعد از train مقدار خود model برمی‌گردد تا predict و add_estimators
+    بعدی با تنظیمات کاربر اجرا شوند.
+    """
+    logger.info("Training %s...", model.name)
+    if n_jobs is None or not isinstance(model, (RandomForestModel, XGBoostModel)):
+        return model.train(X_train, y_train, X_val, y_val)
+    
+    configured = model.n_jobs
+    model.n_jobs = n_jobs
+    try:
+        return model.train(X_train, y_train, X_val, y_val)
+    finally:
+        model.n_jobs = configured
+        if model.model is not None:
+            model.model.set_params(n_jobs=configured)
 
 
 class EnsembleModel(MLModel):
@@ -288,15 +630,11 @@ class EnsembleModel(MLModel):
             'training_metrics': self.training_metrics
         }
         
-        Path(path).parent.mkdir(parents=True, exist_ok=True)
-        
-        with open(path, 'wb') as f:
-            pickle.dump(model_data, f)
+        _dump_model_data(model_data, path)
     
     def load(self, path: str):
         """بارگذاری ensemble"""
-        with open(path, 'rb') as f:
-            model_data = pickle.load(f)
+        model_data = _load_model_data(path)
         
         self.name = model_data['name']
         self.models = model_data['models']
@@ -317,9 +655,17 @@ class EnsembleModel(MLModel):
         
         all_metrics = {}
         
-        for i, model in enumerate(self.models):
-            print(f"Training {model.name}...")
-            metrics = model.train(X_train, y_train, X_val, y_val)
+        # models مستقل هستند → fit همزمان روی thread ها (RandomForest و XGBoost در fit
+        # GIL را آزاد می‌کنند؛ بدون spawn process و pickle کردن داده)
+        # هسته‌ها بین models تقسیم می‌شوند تا RandomForest/XGBoost (n_jobs) oversubscribe نکنند
+        n_workers = max(1, min(len(self.models), os.cpu_count() or 1))
+        n_jobs_per_model = max(1, (os.cpu_count() or 1) // n_workers) if n_workers > 1 else None
+        all_results = Parallel(n_jobs=n_workers, prefer="threads")(
+            delayed(_fit_one)(model, n_jobs_per_model, X_train, y_train, X_val, y_val)
+            for model in self.models
+        )
+        
+        for i, (model, metrics) in enumerate(zip(self.models, all_results)):
             all_metrics[f"{model.name}_{i}"] = metrics
         
         self.is_trained = True
@@ -340,40 +686,91 @@ class EnsembleModel(MLModel):
             raise ValueError("Models not trained yet!")
         
         if self.voting == 'soft':
-            # Average probabilities
-            all_proba = np.array([model.predict_proba(X)[:, 1] for model in self.models])
-            avg_proba = np.mean(all_proba, axis=0)
-            return (avg_proba >= 0.5).astype(int)
+            # ستون UP همه models در یک buffer (n_models, n)؛ میانگین و threshold
+            # در یک pass با kernel (خروجی int8)
+            probas = self._member_proba(X)
+            up_probas = np.empty((len(probas), probas[0].shape[0]), dtype=np.float64)
+            for i, proba in enumerate(probas):
+                up_probas[i] = proba[:, 1]
+            return soft_vote(up_probas)
         else:
-            # Hard voting (majority)
-            all_preds = np.array([model.predict(X) for model in self.models])
-            return (np.mean(all_preds, axis=0) >= 0.5).astype(int)
+            # Hard voting (majority): رأی‌ها در یک buffer از قبل allocate شده (n_models, n)
+            X = _as_float32(X)
+            votes = np.empty((len(self.models), X.shape[0]), dtype=np.int8)
+            for i, model in enumerate(self.models):
+                votes[i] = model.predict(X)
+            # mean >= 0.5  ⇔  2 * sum >= n_models (دقیق، با integer)
+            return (2 * votes.sum(axis=0, dtype=np.int64) >= len(self.models)).astype(np.int8)
     
     def predict_proba(self, X: pd.DataFrame) -> np.ndarray:
         """Average probabilities from all models"""
         if not self.is_trained:
             raise ValueError("Models not trained yet!")
         
-        all_proba = np.array([model.predict_proba(X) for model in self.models])
-        avg_proba = np.mean(all_proba, axis=0)
+        return self._average_proba(X)
+    
+    def _average_proba(self, X: pd.DataFrame) -> np.ndarray:
+        """
+        میانگین احتمال‌ها با جمع in-place در یک آرایه
+        
+        (به جای np.array روی لیست که یک stack (n_models, n, 2) موقت می‌سازد)
+        """
+        probas = self._member_proba(X)
+        # خروجی predict_proba هر model آرایه جدید است، پس روی همان جمع می‌کنیم.
+        # float64 می‌ماند: خروجی XGBoost float32 است و جمع float32 روی مرز 0.5
+        # می‌تواند prediction را عوض کند
+        avg_proba = np.asarray(probas[0], dtype=np.float64)
+        for proba in probas[1:]:
+            np.add(avg_proba, proba, out=avg_proba)
+        avg_proba /= len(probas)
         return avg_proba
     
+    def _member_proba(self, X: pd.DataFrame) -> list:
+        """predict_proba همه models، به صورت موازی روی thread pool"""
+        X = _as_float32(X)  # یک بار تبدیل، مشترک بین models
+        if len(self.models) < 2:
+            return [model.predict_proba(X) for model in self.models]
+        
+        futures = [_predict_pool().submit(model.predict_proba, X) for model in self.models]
+        return [f.result() for f in futures]
+    
+    def add_estimators(self, n: int, X: pd.DataFrame, y: pd.Series):
+        """n درخت/round جدید برای هر model"""
+        self._check_add_estimators()
+        
+        for model in self.models:
+            model.add_estimators(n, X, y)
+    
+    def _check_add_estimators(self):
+        """همه models قبل از تغییر اولین model بررسی می‌شوند (ensemble نیمه‌کاره نماند)"""
+        if not self.is_trained:
+            raise ValueError("Models not trained yet!")
+        for model in self.models:
+            model._check_add_estimators()
+    
     def get_feature_importance(self) -> Dict[str, float]:
         """Average feature importance across models"""
         if not self.models:
             return {}
         
-        all_importance = {}
+        importances = [model.get_feature_importance() for model in self.models]
+        # همه features (معمولاً همه models روی همان ستون‌ها train شده‌اند)
+        features = list(dict.fromkeys(f for importance in importances for f in importance))
+        if not features:
+            return {}
         
-        for model in self.models:
-            importance = model.get_feature_importance()
-            for feature, value in importance.items():
-                if feature not in all_importance:
-                    all_importance[feature] = []
-                all_importance[feature].append(value)
+        # ماتریس (n_models, n_features)؛ feature ای که در یک model نیست NaN می‌شود
+        # و در میانگین حساب نمی‌شود (مثل قبل: میانگین فقط روی models دارای آن)
+        matrix = np.full((len(importances), len(features)), np.nan)
+        for i, importance in enumerate(importances):
+            if list(importance) == features:
+                matrix[i] = np.fromiter(importance.values(), dtype=np.float64, count=len(features))
+            else:
+                matrix[i] = [importance.get(f, np.nan) for f in features]
         
         # Average
-        return {
-            feature: np.mean(values)
-            for feature, values in all_importance.items()
-        }
+        if np.isnan(matrix).any():
+            mean = np.nanmean(matrix, axis=0)
+        else:
+            mean = matrix.mean(axis=0)
+        return dict(zip(features, mean.tolist()))
@@ -316,6 +316,15 @@ class RiskManagementAgent(BaseAgent):
             }
         )
     
+    def reset(self, account_balance: float):
+        """Reset balances and trade tracking (keeps risk parameters)"""
+        self.account_balance = account_balance
+        self.current_balance = account_balance
+        self.peak_balance = account_balance
+        self.open_positions = []
+        self.daily_trades = {}
+        self.daily_pnl = {}
+    
     def update_balance(self, new_balance: float):
         """Update current balance and peak"""
         self.current_balance = new_balance
@@ -162,18 +162,19 @@ class TechnicalIndicators:
         if len(highs) < 2:
             return 0.0
         
-        true_ranges = []
-        for i in range(1, len(highs)):
-            high_low = highs[i] - lows[i]
-            high_close = abs(highs[i] - closes[i-1])
-            low_close = abs(lows[i] - closes[i-1])
-            true_range = max(high_low, high_close, low_close)
-            true_ranges.append(true_range)
-        
-        if len(true_ranges) < period:
-            return np.mean(true_ranges)
-        
-        return np.mean(true_ranges[-period:])
+        # Only the last `period` true ranges are averaged, so compute just those
+        end = len(highs)
+        start = max(1, end - period)
+        h = np.asarray(highs[start:end], dtype=np.float64)
+        l = np.asarray(lows[start:end], dtype=np.float64)
+        prev_close = np.asarray(closes[start - 1:end - 1], dtype=np.float64)
+        
+        true_ranges = np.maximum(
+            h - l,
+            np.maximum(np.abs(h - prev_close), np.abs(l - prev_close))
+        )
+        
+        return np.mean(true_ranges)
     
     @staticmethod
     def calculate_fibonacci_retracements(
@@ -2,9 +2,10 @@
 Data models for market data.
 """
 
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import datetime
-from pydantic import BaseModel, Field
+import numpy as np
+from pydantic import BaseModel, Field, PrivateAttr
 
 
 class OHLCV(BaseModel):
@@ -26,6 +27,10 @@ class MarketData(BaseModel):
     data: List[OHLCV]
     meta: Optional[dict] = None
     
+    # Column (SoA) cache for to_arrays(), keyed on the bar list it was built from
+    _arrays: Optional[Dict[str, np.ndarray]] = PrivateAttr(default=None)
+    _arrays_key: Optional[tuple] = PrivateAttr(default=None)
+    
     def __len__(self) -> int:
         return len(self.data)
     
@@ -39,3 +44,55 @@ class MarketData(BaseModel):
             "close": [item.close for item in self.data],
             "volume": [item.volume for item in self.data if item.volume is not None],
         }
+    
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """
+        Bars as parallel NumPy arrays (datetime, open, high, low, close, volume).
+        
+        Built in one pass and cached until `data` is replaced, changes
+        length, gets a new last bar or the last bar's values change (the
+        forming candle of a live feed, replaced or updated in place, e.g.
+        `data[-1].close = x`). In-place edits of earlier bars are not
+        detected; replace `data` (or the MarketData) after changing history.
+        Missing volume is stored as 0. The arrays are shared between callers
+        and marked read-only.
+        """
+        bars = self.data
+        if bars:
+            last = bars[-1]
+            key = (
+                id(bars), len(bars), id(last),
+                last.datetime, last.open, last.high, last.low, last.close, last.volume
+            )
+        else:
+            key = (id(bars), 0)
+        if self._arrays is None or self._arrays_key != key:
+            n = len(bars)
+            datetimes = np.empty(n, dtype=object)
+            opens = np.empty(n, dtype=np.float64)
+            highs = np.empty(n, dtype=np.float64)
+            lows = np.empty(n, dtype=np.float64)
+            closes = np.empty(n, dtype=np.float64)
+            volumes = np.empty(n, dtype=np.float64)
+            
+            for i, bar in enumerate(bars):
+                datetimes[i] = bar.datetime
+                opens[i] = bar.open
+                highs[i] = bar.high
+                lows[i] = bar.low
+                closes[i] = bar.close
+                volumes[i] = bar.volume if bar.volume else 0
+            
+            arrays = {
+                "datetime": datetimes,
+                "open": opens,
+                "high": highs,
+                "low": lows,
+                "close": closes,
+                "volume": volumes,
+            }
+            for values in arrays.values():
+                values.setflags(write=False)
+            self._arrays = arrays
+            self._arrays_key = key
+        return self._arrays
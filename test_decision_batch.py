@@ -0,0 +1,63 @@
+"""
+🧪 تست DecisionAgent.analyze_batch
+خروجی batch (روی AgentOutputBuffer) باید با analyze() تک‌مرحله‌ای یکسان باشد؛
+هم با kernel های کامپایل‌شده numba و هم با نسخه پایتونی آن‌ها (.py_func)
+"""
+
+import random
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import agents.decision.decision_agent as decision_module
+from agents.base import AgentOutput, AgentOutputBuffer, AgentType
+from agents.decision import DecisionAgent, TradingDecision, DECISIONS
+
+KERNELS = ("aggregate_signals", "aggregate_signals3", "aggregate_signals_batch")
+AGENT_TYPES = (AgentType.TECHNICAL, AgentType.ML, AgentType.RISK)
+
+
+def _random_step(rng: random.Random):
+    """خروجی سه agent برای یک مرحله (شامل signal=None و confidence=0)"""
+    outputs = []
+    for agent_type in AGENT_TYPES:
+        roll = rng.random()
+        signal = None if roll < 0.1 else rng.uniform(-1, 1)
+        confidence = 0.0 if roll > 0.9 else rng.uniform(0, 1)
+        outputs.append(AgentOutput(agent_type, signal, confidence))
+    return outputs
+
+
+@pytest.mark.parametrize("jit", [True, False], ids=["numba", "python"])
+def test_analyze_batch_matches_analyze(jit, monkeypatch):
+    """analyze_batch == analyze برای هر مرحله"""
+    if not jit:
+        for name in KERNELS:
+            kernel = getattr(decision_module, name)
+            monkeypatch.setattr(decision_module, name, getattr(kernel, "py_func", kernel))
+
+    rng = random.Random(7)
+    steps = [_random_step(rng) for _ in range(400)]
+
+    buffer = AgentOutputBuffer(n_agents=len(AGENT_TYPES), capacity=len(steps))
+    for outputs in steps:
+        for output in outputs:
+            buffer.push_output(output)
+
+    agent = DecisionAgent(cache_size=0)
+    signals, confidences, codes = agent.analyze_batch(buffer)
+
+    assert len(signals) == len(steps)
+    for i, outputs in enumerate(steps):
+        expected = agent.analyze(outputs)
+        assert signals[i] == expected.signal
+        assert confidences[i] == expected.confidence
+        expected_decision = expected.metadata.get("decision", TradingDecision.HOLD.value)
+        assert DECISIONS[codes[i]].value == expected_decision
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,102 @@
+"""
+🧪 تست kernel های FeatureEngineer
+هر kernel در agents/ml/_kernels.py باید با عبارت pandas معادل خود یکسان باشد؛
+هم نسخه کامپایل‌شده numba و هم نسخه پایتونی (.py_func)
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from agents.ml import _kernels
+
+PERIOD = 14
+
+
+def _kernel(name: str, jit: bool):
+    """kernel کامپایل‌شده یا تابع پایتونی زیر آن (بدون numba هر دو یکی هستند)"""
+    kernel = getattr(_kernels, name)
+    return kernel if jit else getattr(kernel, "py_func", kernel)
+
+
+def _prices(n: int = 600, seed: int = 3) -> pd.Series:
+    """random walk حول قیمت طلا با یک بازه ثابت و چند NaN"""
+    rng = np.random.default_rng(seed)
+    prices = 2000 + np.cumsum(rng.normal(0, 3, n))
+    prices[200:230] = prices[199]  # بازار بسته / قیمت ثابت
+    prices[[50, 51, 400]] = np.nan
+    return pd.Series(prices)
+
+
+def _assert_close(actual, expected):
+    np.testing.assert_allclose(actual, np.asarray(expected, dtype=np.float64), rtol=1e-9, atol=1e-9)
+
+
+@pytest.fixture(params=[True, False], ids=["numba", "python"])
+def jit(request):
+    return request.param
+
+
+def test_rolling_mean(jit):
+    s = _prices()
+    _assert_close(_kernel("rolling_mean", jit)(s.to_numpy(), PERIOD), s.rolling(PERIOD).mean())
+
+
+def test_rolling_mean_std(jit):
+    s = _prices()
+    mean, std = _kernel("rolling_mean_std", jit)(s.to_numpy(), PERIOD)
+    _assert_close(mean, s.rolling(PERIOD).mean())
+    _assert_close(std, s.rolling(PERIOD).std())
+
+
+def test_rolling_max_min(jit):
+    s = _prices()
+    _assert_close(_kernel("rolling_max", jit)(s.to_numpy(), PERIOD), s.rolling(PERIOD).max())
+    _assert_close(_kernel("rolling_min", jit)(s.to_numpy(), PERIOD), s.rolling(PERIOD).min())
+
+
+def test_rolling_corr(jit):
+    s = _prices()
+    volume = pd.Series(np.random.default_rng(5).uniform(1e3, 1e5, len(s)))
+    expected = s.rolling(PERIOD).corr(volume)
+    # pandas روی پنجره ثابت (واریانس صفر) ±inf یا عدد بی‌معنی می‌دهد؛ kernel عمداً NaN
+    flat = s.rolling(PERIOD).max() == s.rolling(PERIOD).min()
+    expected[flat] = np.nan
+    _assert_close(
+        _kernel("rolling_corr", jit)(s.to_numpy(), volume.to_numpy(), PERIOD),
+        expected
+    )
+
+
+def test_ema(jit):
+    s = _prices()
+    _assert_close(_kernel("ema", jit)(s.to_numpy(), PERIOD), s.ewm(span=PERIOD, adjust=False).mean())
+
+
+def test_macd(jit):
+    s = _prices().ffill()
+    macd, signal, hist = _kernel("macd", jit)(s.to_numpy(), 12, 26, 9)
+
+    expected_macd = s.ewm(span=12, adjust=False).mean() - s.ewm(span=26, adjust=False).mean()
+    expected_signal = expected_macd.ewm(span=9, adjust=False).mean()
+    _assert_close(macd, expected_macd)
+    _assert_close(signal, expected_signal)
+    _assert_close(hist, expected_macd - expected_signal)
+
+
+def test_rsi_sma(jit):
+    s = _prices().ffill()
+    delta = s.diff()
+    gain = delta.where(delta > 0, 0).rolling(PERIOD).mean()
+    loss = (-delta.where(delta < 0, 0)).rolling(PERIOD).mean()
+    expected = 100 - 100 / (1 + gain / loss)
+    _assert_close(_kernel("rsi_sma", jit)(s.to_numpy(), PERIOD), expected)
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
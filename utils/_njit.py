@@ -0,0 +1,26 @@
+"""
+Optional Numba JIT support.
+
+اگر numba نصب نباشد، njit تابع را بدون تغییر برمی‌گرداند و prange همان range است؛
+یعنی kernel ها همیشه قابل اجرا هستند (فقط بدون JIT کندتر).
+"""
+
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:  # pragma: no cover - depends on environment
+    NUMBA_AVAILABLE = False
+    prange = range
+
+    def njit(*args, **kwargs):
+        """No-op replacement for numba.njit (bare or with options)"""
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+
+        def decorator(func):
+            return func
+
+        return decorator
+
+
+__all__ = ["njit", "prange", "NUMBA_AVAILABLE"]